@@ -4,25 +4,48 @@ import logging
 import os
 import re
 import sys
+import threading
 import time
 import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from io import BytesIO
 from operator import itemgetter
 import time
 import azure.functions as func
-import meraki
-import requests
 from IPy import IP
-from passwordgenerator import pwgenerator
 
 from __app__.shared_code.appliance import Appliance
-
-_AZURE_MGMT_URL = "https://management.azure.com"
+from __app__.shared_code.arm import ARM_ENDPOINT, get_arm_client, get_retry_after, poll_arm_operation, send_arm_batch
+from __app__.shared_code.cassette import get_cassette
+from __app__.shared_code.dashboard import get_connection_stats, get_dashboard, get_rate_limit_stats, reset_connection_stats, \
+    set_rate_limit_workers
+from __app__.shared_code.helpers import get_whois_cache
+from __app__.shared_code.identity import get_token_provider
+from __app__.shared_code.inventory import DeviceInventory
+from __app__.shared_code.metrics import get_api_metrics
+from __app__.shared_code.mx import is_firmware_compliant
+from __app__.shared_code.peers import PEER_UPDATE_FIELDS, PeerTable
+from __app__.shared_code.psk import PskManager, get_psk_meta_key
+from __app__.shared_code.ratelimit import BULK, FAILOVER, request_priority
+from __app__.shared_code.state import DesiredStateStore, get_payload_hash
+from __app__.shared_code.tags import TagIndex
+from __app__.shared_code.tracing import get_tracer, profile_run, trace_span, traced
+from __app__.shared_code.uplinks import UplinkSnapshot
+
+_AZURE_MGMT_URL = ARM_ENDPOINT
 _BLOB_HOST_URL = "blob.core.windows.net"
 _YES = "Yes"
 _NO = "No"
 _VWAN_APPLY_NOW_TAG = 'vwan-apply-now'
+_VWAN_ROTATE_PSK_TAG = 'vwan-rotate-psk'
+_FULL = 'full'
+_INCREMENTAL = 'incremental'
+_LAST_FULL_SWEEP = 'lastFullSweep'
+_CONNECTION_SUFFIX = '-connection'
+# Conditional gateway updates retried when the gateway changed since it was read
+_GATEWAY_PRECONDITION_RETRIES = 3
 
 def _get_microsoft_network_base_url(mgmt_url, sub_id, rg_name=None, provider="Microsoft.Network"):
     if rg_name:
@@ -31,21 +54,17 @@ def _get_microsoft_network_base_url(mgmt_url, sub_id, rg_name=None, provider="Mi
     return "{0}/subscriptions/{1}/providers/{2}".format(mgmt_url, sub_id, provider)
 
 
+@traced('token')
 def get_bearer_token(resource_uri):
     access_token = None
-    try:
-        identity_endpoint = os.environ['IDENTITY_ENDPOINT']
-        identity_header = os.environ['IDENTITY_HEADER']
-    except:
+    if 'IDENTITY_ENDPOINT' not in os.environ or 'IDENTITY_HEADER' not in os.environ:
         logging.error("Could not obtain authentication token for Azure. Please ensure "
                       "System Assigned identities have been enabled on the Azure Function.")
         return None
 
-    token_auth_uri = f"{identity_endpoint}?resource={resource_uri}&api-version=2017-09-01"
-    head_msi = {'secret': identity_header}
+    # Tokens are cached in process and on disk until shortly before they expire
     try:
-        resp = requests.get(token_auth_uri, headers=head_msi)
-        access_token = resp.json()['access_token']
+        access_token = get_token_provider().get_token(resource_uri)
     except Exception as e:
         logging.error("Could not obtain access token to manage other Azure resources.")
         logging.error(e)
@@ -55,20 +74,44 @@ def get_bearer_token(resource_uri):
 
 
 # defining a vpn failover function that will failover if the Azure VPN gateway becomes unreachable
-def meraki_vpn_failover():
+@traced('failover')
+@request_priority(FAILOVER)
+def meraki_vpn_failover(peer_table, networks=None):
+    '''
+    Moves the vwan tag of third party VPN peers whose tunnel is down (and
+    carried traffic) to the peer of the other Azure gateway instance.
+    Networks are looked up once for all peers, and peers are looked up by
+    name, so X and X-sec are paired without scanning the peer list. The
+    change is made in peer_table, which the caller writes once per run,
+    and only once every peer was checked: a check that fails leaves
+    peer_table as it was.
+
+    @param  peer_table: PeerTable of the run
+    @param  networks:   Networks from getOrganizationNetworks(), fetched when None
+    @rtype:             boolean
+    @return:            True if peer_table was changed
+    '''
 
     # creating a variable that indicates whether or not the VPN config needs to be updated due to failover
     needs_update = False
-    
-    # obtaining current list of third party VPN peers
-    vpn_config_response = MerakiConfig.sdk_auth.appliance.getOrganizationApplianceVpnThirdPartyVPNPeers(
-        MerakiConfig.org_id
-    )
+
+    # network tags to set per peer name, applied to peer_table once every down tunnel was checked
+    tag_changes = {}
 
     # creating list of current Meraki VPN peers
-    vpn_peers_list = vpn_config_response['peers']
+    vpn_peers_list = peer_table.to_payload()
+
+    # performing one org wide call to obtain network info, reused for every peer
+    if networks is None:
+        networks = MerakiConfig.sdk_auth.organizations.getOrganizationNetworks(
+            MerakiConfig.org_id, total_pages='all'
+            )
 
-    logging.info("original VPN peers list: " + str(vpn_peers_list))
+    # indexing the first network carrying each tag, in organization order
+    network_by_tag = {}
+    for index, network in enumerate(networks):
+        for tag in network['tags'] or []:
+            network_by_tag.setdefault(tag, (index, network['id']))
 
     # creating list of tracked network IDs for monitoring vWAN VPN Health
     network_id_list = []
@@ -79,17 +122,19 @@ def meraki_vpn_failover():
         # matching if vwan is in the network tags for any of the vpn peers
         if 'vwan' in str(peers['networkTags']):
 
-            # performing org wide call to obtain network info and filtering by tag
-            org_network_response = MerakiConfig.sdk_auth.organizations.getOrganizationNetworks(
-                MerakiConfig.org_id, total_pages='all', tags = peers['networkTags']
-                )
+            # the first network with any of the peer's tags, as the tags filter of getOrganizationNetworks returns
+            tagged_networks = [network_by_tag[tag] for tag in peers['networkTags'] if tag in network_by_tag]
+            if not tagged_networks:
+                continue
 
             # appending network ID for tunnel to network_id_list
-            network_id_list.append(org_network_response[0]['id'])
+            network_id = min(tagged_networks)[1]
+            if network_id not in network_id_list:
+                network_id_list.append(network_id)
 
     # if there isnt any networks in the list to track exit the function
     if len(network_id_list) == 0:
-        return
+        return needs_update
 
     # obtaining org wide vpn status and filtering with the network_id_list 
     # that tag contains networks with a tag containing vwan
@@ -132,84 +177,95 @@ def meraki_vpn_failover():
 
                 logging.info("Network Tunnel detected as down, initiating failover")
 
-                # Updating the third party VPN list to move the tag to either backup or primary tunnel
-                # vpn_peers_list is the list we need to update
-
                 # parsing to obtain current network name of down tunnel
-                down_network_ipsec_name = vpns['thirdPartyVpnPeers'][0]['name']
+                down_network_ipsec_name = str(vpns['thirdPartyVpnPeers'][0]['name'])
 
                 # match on tunnel name ending w/ -sec (indicating backup vWAN VPN config)
-                if '-sec' in str(down_network_ipsec_name):
+                if '-sec' in down_network_ipsec_name:
 
                     logging.info("Currently on backup tunnel need to failback to primary, updating vpn list")
 
-                    # iterating through meraki vpn list to update the network tags in the vpn config
-                    for vpn_config in vpn_peers_list:
-
-                        # matching on down_network_ipsec_name to ipsec tunnel name in vpn_peers_list
-                        if down_network_ipsec_name == vpn_config['name']:
+                    # parsing vpn tunnel name to exclude -sec [-4] to get primary tunnel name
+                    standby_network_ipsec_name = down_network_ipsec_name[0:-4]
 
-                            # creating original_tags variable to store vpn_config['networkTags'] 
-                            # to later add that value to the primary VPN tunnel networkTags
-                            original_tags = vpn_config['networkTags']
+                else:
 
-                            # setting the networkTags for the backup VPN tunnel to None
-                            vpn_config['networkTags'] = ['none']
-                            
-                            # setting needs_update = True since we have modified the networktags in the vpn list
-                            needs_update = True
+                    logging.info("Need to failover to backup VPN tunnel, updating list")
 
-                    # iterating through meraki vpn list to update the network tags in the vpn config
-                    for vpn_config in vpn_peers_list:
+                    # adding -sec to the vpn tunnel name for the backup VPN tunnel
+                    standby_network_ipsec_name = down_network_ipsec_name + '-sec'
 
-                        # parsing vpn tunnel name to exclude -sec [-4] to get primary tunnel name
-                        if str(down_network_ipsec_name)[0:-4] == str(vpn_config['name']): 
+                down_peer = peer_table.get(down_network_ipsec_name)
+                if down_peer is None:
+                    logging.warning(f"VPN peer {down_network_ipsec_name} not found in the VPN peers list")
+                    continue
 
-                            # setting networkTags for the primary vpn tunnel to the original_tags variable
-                            vpn_config['networkTags'] = original_tags
+                # moving the network tags of the down tunnel to the standby tunnel
+                original_tags = tag_changes.get(down_network_ipsec_name, down_peer['networkTags'])
+                tag_changes[down_network_ipsec_name] = ['none']
+                if peer_table.get(standby_network_ipsec_name) is not None:
+                    tag_changes[standby_network_ipsec_name] = original_tags
 
-                else:
+                # setting needs_update = True since we have modified the networktags in the vpn list
+                needs_update = True
 
-                    logging.info("Need to failover to backup VPN tunnel, updating list")
+    for name, network_tags in tag_changes.items():
+        peer_table.get(name)['networkTags'] = network_tags
 
-                    # iterating through meraki vpn list to update the network tags in the vpn config
-                    for vpn_config in vpn_peers_list:
+    if needs_update == True:
+        logging.info("New VPN peers list: " + str(vpn_peers_list))
 
-                        # matching on down_network_ipsec_name to ipsec tunnel name in vpn_peers_list
-                        if down_network_ipsec_name == vpn_config['name']:
+    return needs_update
 
-                            # creating original_tags variable to store vpn_config['networkTags'] 
-                            # to later add that value to the secondary VPN tunnel networkTags
-                            original_tags = vpn_config['networkTags']
 
-                            # setting the networkTags for the primary VPN tunnel to None
-                            vpn_config['networkTags'] = ['none']
-                            
-                            # setting needs_update = True since we have modified the tags in the vpn list
-                            needs_update = True
+def run_vpn_failover(peer_table, networks=None):
+    '''
+    Runs meraki_vpn_failover(). A failed check is logged and the run goes
+    on without its changes, so it never holds back the peer list write
+    of networks already updated in Azure, as running failover after that
+    write never could.
+
+    @param  peer_table: PeerTable of the run
+    @param  networks:   Networks from getOrganizationNetworks(), fetched when None
+    @rtype:             boolean
+    @return:            True if peer_table was changed
+    '''
+    try:
+        return meraki_vpn_failover(peer_table, networks)
+    except Exception as e:
+        logging.error("VPN failover check failed, writing the VPN peers without failover changes.")
+        logging.exception(e)
+        return False
 
-                    # iterating through meraki vpn list to update the network tags in the vpn config
-                    for vpn_config in vpn_peers_list:
 
-                        # matching the vpn tunnel config name value and adding -sec for backup VPN tunnel
-                        if str(down_network_ipsec_name) + '-sec' == str(vpn_config['name']):
+@traced('peer update')
+def update_meraki_vpn_peers(peer_table):
+    '''
+    Writes the organization's third party VPN peer list. The list replaces
+    every peer of the organization and makes each MX reprocess its
+    tunnels, so reconcile() calls this once per run with all hub updates
+    and failover decisions merged, and the write is skipped when the list
+    is identical to the one the dashboard holds.
+
+    @param  peer_table: PeerTable of the run
+    @rtype:             boolean
+    @return:            True if the peer list was written
+    '''
+    if not peer_table.is_changed():
+        logging.info("Meraki VPN peers are unchanged, skipping update.")
+        return False
 
-                            # setting networkTags for the secondary vpn tunnel to the original_tags variable
-                            vpn_config['networkTags'] = original_tags
+    new_meraki_vpns = peer_table.to_payload()
+    logging.info("updated Meraki VPN Config: " + str(new_meraki_vpns))
 
-    # final call to update Meraki VPN config
-    logging.info("New VPN peers list: " + str(vpn_peers_list))
-    
-    # if statement to see if needs_update = True to indicate if we need to update Meraki VPN peers
-    if needs_update == True:
-    
-        logging.info("updating vpn list")
-    
-        # Update Meraki VPN config
-        update_meraki_vpn = MerakiConfig.sdk_auth.appliance.updateOrganizationApplianceVpnThirdPartyVPNPeers(
-            MerakiConfig.org_id, vpn_peers_list
+    # Update Meraki VPN config
+    update_meraki_vpn = MerakiConfig.sdk_auth.appliance.updateOrganizationApplianceVpnThirdPartyVPNPeers(
+        MerakiConfig.org_id, new_meraki_vpns
         )
 
+    logging.info("VPN Peers updated!")
+    return True
+
 
 # defining function to delete tag placeholder network for customers migrating from v0 of the script to v1
 def delete_tag_placeholder():
@@ -323,6 +379,46 @@ def get_meraki_ipsec_config(name, public_ip, private_subnets, secret, network_ta
     return ipsec_config
 
 
+def get_changed_network_ids(change_log):
+    # Network IDs with tag or VPN subnet changes. A relevant change that is not tied
+    # to a network returns None, meaning every network has to be reconciled
+    changed_network_ids = set()
+    for tag_events in change_log:
+        if tag_events['label'] == 'Network tags' or tag_events['label'] == 'VPN subnets':
+            if not tag_events.get('networkId'):
+                return None
+            changed_network_ids.add(tag_events['networkId'])
+
+    return changed_network_ids
+
+
+def is_full_sweep_due(desired_state):
+    # Full sweeps are the safety net of incremental runs, 0 disables them
+    if MerakiConfig.reconcile_mode != _INCREMENTAL or MerakiConfig.full_sweep_interval_minutes <= 0:
+        return False
+    last_full_sweep = desired_state.get_meta(_LAST_FULL_SWEEP, 0)
+    return time.time() - last_full_sweep >= MerakiConfig.full_sweep_interval_minutes * 60
+
+
+def get_hub_meta_key(hub):
+    # Name of the DesiredStateStore value holding the hash of the hub's state
+    return f"hub:{hub.lower()}"
+
+
+def get_site_name(network):
+    # Name of the network's vWAN site and Meraki peers
+    return str(network['name']).replace(' ', '')
+
+
+def get_hub_state_hash(azure_instance_0, azure_instance_1, azure_connected_subnets):
+    # Every network of a hub peers with the same gateway instances and subnets,
+    # a change to them affects all of the hub's networks
+    return get_payload_hash({
+        'instances': [azure_instance_0, azure_instance_1],
+        'subnets': sorted(azure_connected_subnets)
+    })
+
+
 def get_meraki_networks_by_tag(tag_name, networks):
     remove_network_id_list = []
     for network in networks:
@@ -349,6 +445,42 @@ def get_mx_from_network_devices(network_devices: list):
     return result
 
 
+def filter_candidate_networks(networks: list, device_inventory: DeviceInventory):
+    '''
+    Drops networks that cannot be reconciled using only data already
+    fetched in bulk: networks without an appliance, without an MX in the
+    device inventory or without an MX on compliant firmware. This runs
+    before any per-network API call is made.
+    @param networks:         networks from getOrganizationNetworks().
+    @param device_inventory: DeviceInventory of the organization.
+    @rtype:   tuple
+    @return:  list of candidate networks, number of API calls saved.
+    '''
+    candidates = []
+    saved_calls = 0
+    for network in networks:
+        if 'productTypes' in network and 'appliance' not in network['productTypes']:
+            logging.info(f"No appliance in {network['name']}, skipping network.")
+            continue
+
+        mx_devices = get_mx_from_network_devices(device_inventory.get_network_devices(network['id']))
+        if not mx_devices:
+            logging.info(f"MX device not found in {network['name']}, skipping network.")
+            # warm spare lookup
+            saved_calls += 1
+            continue
+
+        if not any(is_firmware_compliant(mx.get('firmware')) for mx in mx_devices):
+            logging.info(f"MX device for {network['name']} not running compliant firmware, skipping network.")
+            # warm spare lookup and uplink bandwidth per MX
+            saved_calls += 1 + len(mx_devices)
+            continue
+
+        candidates.append(network)
+
+    return candidates, saved_calls
+
+
 def meraki_tag_placeholder_network_check_tags(mdashboard, meraki_network_list):
 
     all_tags = []
@@ -374,7 +506,7 @@ def meraki_tag_placeholder_network_check_tags(mdashboard, meraki_network_list):
         
         # Build list of found tags
         for tag in tags:
-            if re.match(MerakiConfig.primary_tag_regex, tag):
+            if MerakiConfig.primary_tag_pattern.match(tag):
                 current_tags.append(tag)
                 all_tags.append(tag)
 
@@ -416,7 +548,7 @@ def check_if_meraki_vwan_tags_exist(tags, network_name, vwan_hub_name=""):
         logging.info(f"Checking if vwan hub {vwan_hub_name} is found in tags {tags} for network {network_name}")
         for tag in tags:
             try:
-                temp_vwan_hub_name = re.match(MerakiConfig.primary_tag_regex, tag).group(1)
+                temp_vwan_hub_name = MerakiConfig.primary_tag_pattern.match(tag).group(1)
                 if temp_vwan_hub_name not in hubs:
                     hubs.append(temp_vwan_hub_name)
             except:
@@ -436,7 +568,7 @@ def check_if_meraki_vwan_tags_exist(tags, network_name, vwan_hub_name=""):
         
 
     # Check if any vwan tags exist in the list of tags
-    if not any(re.match(MerakiConfig.primary_tag_regex, lowertag) \
+    if not any(MerakiConfig.primary_tag_pattern.match(lowertag) \
                                         for lowertag in (tag.lower() for tag in tags)):
 
         logging.info(f"No vwan tags found for {network_name}, skipping to next network")
@@ -455,18 +587,7 @@ def clean_meraki_vwan_tags(mdashboard, remove_tag, tagged_networks):
 
 
 def meraki_vwan_hubs(tags_network):
-    hubs = []
-    for network in tags_network:
-        tags = network['tags']
-        for tag in tags:
-            try:
-                vwan_hub_name = re.match(MerakiConfig.primary_tag_regex, tag).group(1)
-                if vwan_hub_name not in hubs:
-                    hubs.append(vwan_hub_name)
-            except:
-                continue
-
-    return hubs
+    return TagIndex(tags_network, MerakiConfig.primary_tag_pattern).hubs
 
 
 def find_azure_virtual_wan(virtual_wan_name, virtual_wans):
@@ -482,18 +603,20 @@ def find_azure_virtual_wan(virtual_wan_name, virtual_wans):
 
 def check_vwan_hubs_exist(virtual_wan, tags):
 
+    vwan_hub_names = set(vwan_hub['id'].rsplit('/', 1)[-1].lower() \
+                         for vwan_hub in virtual_wan['properties']['virtualHubs'])
     for tag in tags:
-        if tag.lower() not in (vwan_hub['id'].rsplit('/', 1)[-1].lower() \
-                                for vwan_hub in virtual_wan['properties']['virtualHubs']):
+        if tag.lower() not in vwan_hub_names:
             return False
 
     return True
 
 
+@traced('vWAN lookup')
 def get_azure_virtual_wans(header_with_bearer_token):
     endpoint_url = _get_microsoft_network_base_url(_AZURE_MGMT_URL,
                                                    AzureConfig.subscription_id) + "/virtualWans?api-version=2020-05-01"
-    virtual_wans_request = requests.get(endpoint_url, headers=header_with_bearer_token)
+    virtual_wans_request = AzureConfig.arm_client.get(endpoint_url, headers=header_with_bearer_token)
 
     if virtual_wans_request.status_code != 200:
         logging.error(
@@ -505,10 +628,11 @@ def get_azure_virtual_wans(header_with_bearer_token):
     return virtual_wans_request.json()
 
 
+@traced('hub info')
 def get_azure_virtual_wan_hub_info(resource_group, vwan_hub_name, header_with_bearer_token):
     vwan_hub_endpoint = _get_microsoft_network_base_url(_AZURE_MGMT_URL, AzureConfig.subscription_id, resource_group)\
                         + f"/virtualHubs/{vwan_hub_name}?api-version=2020-05-01"
-    vwan_hub_info = requests.get(vwan_hub_endpoint, headers=header_with_bearer_token)
+    vwan_hub_info = AzureConfig.arm_client.get(vwan_hub_endpoint, headers=header_with_bearer_token)
 
     if vwan_hub_info.status_code != 200:
         logging.error("Could not find Virtual WAN Hub")
@@ -526,11 +650,39 @@ def get_azure_virtual_wan_hub_info(resource_group, vwan_hub_name, header_with_be
 
     return vwan_hub_info
 
+@traced('effective routes')
+def get_azure_virtual_wan_effective_routes(effective_routes_endpoint, header_with_bearer_token, payload=None):
+    # Effective routes are returned by a long-running operation; poll it until it completes
+    effective_routes_endpoint_response = AzureConfig.arm_client.post(effective_routes_endpoint, json=payload, headers=header_with_bearer_token)
+
+    if effective_routes_endpoint_response.status_code != 202 and effective_routes_endpoint_response.status_code != 200:
+        logging.error("Could not obtain effective routes. Assuming no networks.")
+        logging.error(effective_routes_endpoint_response.text)
+        return None
+
+    operation_url = effective_routes_endpoint_response.headers.get('Azure-AsyncOperation')
+    if operation_url:
+        effective_routes_async_result = poll_arm_operation(operation_url, header_with_bearer_token,
+                                                           get_retry_after(effective_routes_endpoint_response))
+    else:
+        effective_routes_async_result = effective_routes_endpoint_response.json()
+
+    try:
+        if 'value' in effective_routes_async_result:
+            return effective_routes_async_result['value']
+        return effective_routes_async_result['properties']['output']['value']
+    except Exception as e:
+        logging.error("Could not obtain effective routes.")
+        logging.error(effective_routes_async_result)
+        return None
+
+
+@traced('gateway config')
 def get_azure_virtual_wan_gateway_config(resource_group, virtual_wan_hub, vpn_gateway_name, header_with_bearer_token):
 
     vpn_gateway_endpoint = _get_microsoft_network_base_url(_AZURE_MGMT_URL, AzureConfig.subscription_id, resource_group)\
                         + f"/vpnGateways/{vpn_gateway_name}?api-version=2020-05-01"
-    vpn_gateway_info = requests.get(vpn_gateway_endpoint, headers=header_with_bearer_token)
+    vpn_gateway_info = AzureConfig.arm_client.get(vpn_gateway_endpoint, headers=header_with_bearer_token)
 
     if vpn_gateway_info.status_code != 200:
         logging.error("Could not obtain vWAN Gateway information")
@@ -550,72 +702,25 @@ def get_azure_virtual_wan_gateway_config(resource_group, virtual_wan_hub, vpn_ga
         "ResourceId": f"/subscriptions/{AzureConfig.subscription_id}/resourceGroups/{resource_group}/" \
                         f"providers/Microsoft.Network/virtualHubs/{virtual_wan_hub}/hubRouteTables/defaultRouteTable"
     }
-    effective_routes_endpoint_response = requests.post(effective_routes_endpoint, json=payload, headers=header_with_bearer_token)
-
-    if effective_routes_endpoint_response.status_code == 202 or effective_routes_endpoint_response.status_code == 200:
-        # Get header and pull new endpoint
-        if effective_routes_endpoint_response.headers['Azure-AsyncOperation']:
-            effective_routes_async_response = requests.get(effective_routes_endpoint_response.headers['Azure-AsyncOperation'],
-                                                            headers=header_with_bearer_token)
-            for x in range(5):
-                time.sleep(10)
-                effective_routes_async_result = effective_routes_async_response.json()
-                logging.info(f"Retrying for effective routes. Attempt: {x}")
-                try:
-                    if not effective_routes_async_result['properties']['output']['value']:
-                        logging.info("Virtual WAN hub likely not propagating routes, trying old effective routes APIs")
-                        break
-                    
-                    for network in effective_routes_async_result['properties']['output']['value']:
-                        if network['nextHopType'] == 'Remote Hub' or network['nextHopType'] == 'Virtual Network Connection':
-                            for prefix in network['addressPrefixes']:
-                                gateway_info['connectedVirtualNetworks'].append(prefix)
-                    
-                    return gateway_info
-                except Exception as e:
-                    logging.info("Could not obtain effective routes. Trying again...")
-                    effective_routes_async_response = requests.get(effective_routes_endpoint_response.headers['Azure-AsyncOperation'],
-                                                            headers=header_with_bearer_token)
-
-                if x == 4:
-                    logging.error("Could not obtain effective routes and 5 attempts.")
-                    return None
+    effective_routes = get_azure_virtual_wan_effective_routes(effective_routes_endpoint, header_with_bearer_token, payload)
+    if effective_routes is None:
+        return None
 
-            # Pull effective routes using April Virtual WAN APIs
-            # If Virtual WAN hub has not been updated for routing service, use older effective routes API
-            effective_routes_endpoint = _get_microsoft_network_base_url(_AZURE_MGMT_URL, AzureConfig.subscription_id, resource_group)\
-                                + f"/virtualHubs/{virtual_wan_hub}/effectiveRoutes?api-version=2020-04-01"
-
-            effective_routes_endpoint_response = requests.post(effective_routes_endpoint, headers=header_with_bearer_token)
-
-            if effective_routes_endpoint_response.status_code == 202 or effective_routes_endpoint_response.status_code == 200:
-                # Get header and pull new endpoint
-                if effective_routes_endpoint_response.headers['Azure-AsyncOperation']:
-                    effective_routes_async_response = requests.get(effective_routes_endpoint_response.headers['Azure-AsyncOperation'],
-                                                                    headers=header_with_bearer_token)
-                    for x in range(5):
-                        time.sleep(10)
-                        effective_routes_async_result = effective_routes_async_response.json()
-                        logging.info(f"Retrying for effective routes. Attempt: {x}")
-                        try:
-                            for network in effective_routes_async_result['properties']['output']['value']:
-                                if network['nextHopType'] == 'Remote Hub' or network['nextHopType'] == 'Virtual Network Connection':
-                                    for prefix in network['addressPrefixes']:
-                                        gateway_info['connectedVirtualNetworks'].append(prefix)
-                            break
-                        except Exception as e:
-                            logging.error("Could not obtain effective routes. Trying again...")
-                            effective_routes_async_response = requests.get(effective_routes_endpoint_response.headers['Azure-AsyncOperation'],
-                                                                    headers=header_with_bearer_token)
-
-                        if x == 4:
-                            logging.error("Could not obtain effective routes and 5 attempts.")
-                            return None
+    if not effective_routes:
+        logging.info("Virtual WAN hub likely not propagating routes, trying old effective routes APIs")
 
-    else:
-        logging.error("Could not obtain effective routes. Assuming no networks.")
-        logging.error(vpn_gateway_info.text)
-        return None
+        # Pull effective routes using April Virtual WAN APIs
+        # If Virtual WAN hub has not been updated for routing service, use older effective routes API
+        effective_routes_endpoint = _get_microsoft_network_base_url(_AZURE_MGMT_URL, AzureConfig.subscription_id, resource_group)\
+                            + f"/virtualHubs/{virtual_wan_hub}/effectiveRoutes?api-version=2020-04-01"
+        effective_routes = get_azure_virtual_wan_effective_routes(effective_routes_endpoint, header_with_bearer_token)
+        if effective_routes is None:
+            return None
+
+    for network in effective_routes:
+        if network['nextHopType'] == 'Remote Hub' or network['nextHopType'] == 'Virtual Network Connection':
+            for prefix in network['addressPrefixes']:
+                gateway_info['connectedVirtualNetworks'].append(prefix)
 
     if not gateway_info['connectedVirtualNetworks']:
         logging.info(f"No connected virtual networks or hubs to {virtual_wan_hub}")
@@ -623,12 +728,48 @@ def get_azure_virtual_wan_gateway_config(resource_group, virtual_wan_hub, vpn_ga
     return gateway_info
 
 
+def get_azure_virtual_wan_hub_configs(resource_group, hubs, header_with_bearer_token):
+    # Hub info and effective routes are independent per hub, so the hubs' long-running
+    # effective routes operations are polled concurrently instead of one after another
+    def get_hub_config(hub):
+        vwan_hub_info = get_azure_virtual_wan_hub_info(resource_group, hub, header_with_bearer_token)
+        if vwan_hub_info is None:
+            return None, None
+
+        return vwan_hub_info, get_azure_virtual_wan_gateway_config(resource_group, vwan_hub_info['name'],
+                                                                   vwan_hub_info['vpnGatewayName'], header_with_bearer_token)
+
+    if not hubs:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(AzureConfig.max_concurrent_hubs, len(hubs))) as executor:
+        return dict(zip(hubs, executor.map(get_hub_config, hubs)))
+
+
+@traced('vpnSite GET')
+def get_azure_virtual_wan_site(resource_group, site_name, header_with_bearer_token):
+    vwan_site_endpoint = _get_microsoft_network_base_url(_AZURE_MGMT_URL, AzureConfig.subscription_id,
+                                                         resource_group) + \
+                         f"/vpnSites/{site_name}?api-version=2020-05-01"
+
+    vwan_site_info = AzureConfig.arm_client.get(vwan_site_endpoint, headers=header_with_bearer_token)
+
+    if vwan_site_info.status_code != 200:
+        if vwan_site_info.status_code != 404:
+            logging.error(f"Could not obtain vWAN site {site_name}")
+            logging.error(vwan_site_info.text)
+        return None
+
+    return vwan_site_info.json()
+
+
+@traced('vpnSite PUT')
 def update_azure_virtual_wan_site_links(resource_group, site_name, header_with_bearer_token, site_config):
     vwan_site_endpoint = _get_microsoft_network_base_url(_AZURE_MGMT_URL, AzureConfig.subscription_id,
                                                          resource_group) + \
                          f"/vpnSites/{site_name}?api-version=2020-05-01"
 
-    vwan_site_status = requests.put(vwan_site_endpoint, headers=header_with_bearer_token, json=site_config)
+    vwan_site_status = AzureConfig.arm_client.put(vwan_site_endpoint, headers=header_with_bearer_token, json=site_config)
 
     if vwan_site_status.status_code < 200 or vwan_site_status.status_code > 202:
         logging.error("Failed adding/updating vWAN site")
@@ -638,8 +779,32 @@ def update_azure_virtual_wan_site_links(resource_group, site_name, header_with_b
     return vwan_site_status.json()
 
 
-def create_virtual_wan_connection(resource_group, vpn_gateway_name, network_name,
-                                  subscription_id, wans, psk, header_with_bearer_token):
+@traced('vpnSites batch')
+def update_azure_virtual_wan_sites(resource_group, site_configs, header_with_bearer_token):
+    # vpnSites are upserted through ARM $batch, many per round trip; each site keeps its own
+    # status so a failed site is reported and skipped on its own
+    vwan_site_base_url = _get_microsoft_network_base_url('', AzureConfig.subscription_id, resource_group)
+    batch_requests = [{
+        'httpMethod': 'PUT',
+        'url': f"{vwan_site_base_url}/vpnSites/{site_name}?api-version=2020-05-01",
+        'content': site_config
+    } for site_name, site_config in site_configs]
+
+    site_statuses = {}
+    responses = send_arm_batch(batch_requests, header_with_bearer_token, session=AzureConfig.arm_client)
+    for (site_name, site_config), response in zip(site_configs, responses):
+        status_code = response.get('httpStatusCode') or 0
+        if status_code < 200 or status_code > 202:
+            logging.error(f"Failed adding/updating vWAN site {site_name}")
+            logging.error(response.get('content'))
+            site_statuses[site_name] = None
+        else:
+            site_statuses[site_name] = response.get('content') or {}
+
+    return site_statuses
+
+
+def get_virtual_wan_connection_config(resource_group, network_name, subscription_id, wans, psk):
 
     vwan_vpn_site_id = f"/subscriptions/{subscription_id}/resourceGroups/{resource_group}" + \
                                    f"/providers/Microsoft.Network/vpnSites/{network_name}"
@@ -657,16 +822,23 @@ def create_virtual_wan_connection(resource_group, vpn_gateway_name, network_name
                     }
                 }
 
+    return connection_config
+
+
+@traced('vpnConnection PUT')
+def put_virtual_wan_connection(resource_group, vpn_gateway_name, network_name, connection_config,
+                               header_with_bearer_token):
+
     vwan_vpn_gateway_connection_endpoint = _get_microsoft_network_base_url(_AZURE_MGMT_URL,
                                                                            AzureConfig.subscription_id,
                                                                            resource_group) + "/vpnGateways" \
                                                                                              f"/{vpn_gateway_name}/" \
                                                                                              "vpnConnections" \
-                                                                                             f"/{network_name}-" \
-                                                                                             "connection?" \
+                                                                                             f"/{network_name}" \
+                                                                                             f"{_CONNECTION_SUFFIX}?" \
                                                                                              "api-version=2020-05-01"
 
-    vwan_connection_info = requests.put(vwan_vpn_gateway_connection_endpoint,
+    vwan_connection_info = AzureConfig.arm_client.put(vwan_vpn_gateway_connection_endpoint,
                                         headers=header_with_bearer_token,
                                         json=connection_config)
 
@@ -678,6 +850,504 @@ def create_virtual_wan_connection(resource_group, vpn_gateway_name, network_name
     return vwan_connection_info.json()
 
 
+@traced('vpnConnection GET')
+def get_virtual_wan_connection(resource_group, vpn_gateway_name, network_name, header_with_bearer_token):
+
+    vwan_vpn_gateway_connection_endpoint = _get_microsoft_network_base_url(_AZURE_MGMT_URL,
+                                                                           AzureConfig.subscription_id,
+                                                                           resource_group) + \
+        f"/vpnGateways/{vpn_gateway_name}/vpnConnections/{network_name}{_CONNECTION_SUFFIX}?api-version=2020-05-01"
+
+    vwan_connection_info = AzureConfig.arm_client.get(vwan_vpn_gateway_connection_endpoint,
+                                                      headers=header_with_bearer_token)
+
+    if vwan_connection_info.status_code != 200:
+        if vwan_connection_info.status_code != 404:
+            logging.error(f"Could not obtain Virtual WAN connection of {network_name}")
+            logging.error(vwan_connection_info.text)
+        return None
+
+    return vwan_connection_info.json()
+
+
+def create_virtual_wan_connection(resource_group, vpn_gateway_name, network_name,
+                                  subscription_id, wans, psk, header_with_bearer_token):
+
+    connection_config = get_virtual_wan_connection_config(resource_group, network_name, subscription_id, wans, psk)
+
+    return put_virtual_wan_connection(resource_group, vpn_gateway_name, network_name, connection_config,
+                                      header_with_bearer_token)
+
+
+def reset_gateway_update_budget():
+    # Gateway updates of one invocation wait at most gateway_update_timeout seconds in total
+    AzureConfig.gateway_update_deadline = time.monotonic() + AzureConfig.gateway_update_timeout
+
+
+def get_gateway_update_budget(hubs_left=1):
+    # Each hub gets an equal share of what is left, so a slow first hub cannot starve the others;
+    # what a hub leaves unused goes to the hubs after it
+    if AzureConfig.gateway_update_deadline is None:
+        reset_gateway_update_budget()
+    return max(AzureConfig.gateway_update_deadline - time.monotonic(), 0) / max(hubs_left, 1)
+
+
+def merge_gateway_connections(vpn_gateway, chunk, get_shared_key):
+    '''
+    Merges the connections of chunk into the connection list of a VPN
+    gateway returned by ARM. ARM returns connections without their shared
+    keys, and a gateway update without a key would replace it, so every
+    other connection gets its key back from get_shared_key.
+
+    @param  vpn_gateway:    VPN gateway returned by ARM, updated in place
+    @param  chunk:          List of network name and connection config
+    @param  get_shared_key: Connection name -> key, None if unknown
+    @rtype:                 dict or None
+    @return:                vpn_gateway, None if the key of another connection is unknown
+    '''
+    chunk_connections = {f"{network_name}{_CONNECTION_SUFFIX}": connection_config
+                         for network_name, connection_config in chunk}
+
+    gateway_connections = {}
+    for connection in vpn_gateway['properties'].get('connections', []):
+        if connection['name'] in chunk_connections:
+            continue
+        for link_connection in connection.get('properties', {}).get('vpnLinkConnections', []):
+            link_properties = link_connection.setdefault('properties', {})
+            if not link_properties.get('sharedKey'):
+                shared_key = get_shared_key(connection['name'])
+                if shared_key is None:
+                    return None
+                link_properties['sharedKey'] = shared_key
+        gateway_connections[connection['name']] = connection
+
+    for connection_name, connection_config in chunk_connections.items():
+        gateway_connections[connection_name] = {
+            "name": connection_name,
+            "properties": connection_config['properties']
+        }
+    vpn_gateway['properties']['connections'] = list(gateway_connections.values())
+    return vpn_gateway
+
+
+@traced('gateway connections PUT')
+def update_azure_virtual_wan_gateway_connections(resource_group, vpn_gateway_name, connections, header_with_bearer_token,
+                                                 psk_manager, budget=None):
+    '''
+    Creates/updates the connections of many networks with gateway level
+    updates of the VPN gateway instead of one vpnConnections PUT (and one
+    queued gateway operation) per network. Connections are applied in
+    chunks of gateway_connection_chunk_size, each chunk waiting for the
+    gateway's long-running operation to finish before the next one
+    starts. Chunks left when the budget of the hub is used up are left to
+    the next run.
+
+    Each update sends the gateway's other connections back with the key of
+    their site's Meraki peers and is conditional on the gateway's ETag, so
+    a connection created or deleted meanwhile is not lost; the chunk is
+    retried on 412. A chunk falls back to one vpnConnections PUT per
+    network when the gateway has a connection whose key is not known.
+
+    @param  resource_group:           Resource group of the Virtual WAN
+    @param  vpn_gateway_name:         Name of the hub's VPN gateway
+    @param  connections:              List of network name and connection config
+    @param  header_with_bearer_token: Headers including the bearer token
+    @param  psk_manager:              PskManager of the run, for the keys of the other connections
+    @param  budget:                   Seconds the hub's updates may take, gateway_update_timeout when None
+    @rtype:                           dict
+    @return:                          Network name -> True if its connection was applied
+    '''
+    budget = AzureConfig.gateway_update_timeout if budget is None else max(budget, 0)
+    deadline = time.monotonic() + budget
+
+    vpn_gateway_endpoint = _get_microsoft_network_base_url(_AZURE_MGMT_URL, AzureConfig.subscription_id, resource_group)\
+                        + f"/vpnGateways/{vpn_gateway_name}?api-version=2020-05-01"
+
+    # Connections applied by earlier chunks may carry a rotated key
+    applied_keys = {}
+
+    def get_shared_key(connection_name):
+        if connection_name in applied_keys:
+            return applied_keys[connection_name]
+        if connection_name.endswith(_CONNECTION_SUFFIX):
+            return psk_manager.get_peer_psk(connection_name[:-len(_CONNECTION_SUFFIX)])
+        return None
+
+    def put_connection_or_skip(connection):
+        network_name, connection_config = connection
+        try:
+            return put_virtual_wan_connection(resource_group, vpn_gateway_name, network_name, connection_config,
+                                              header_with_bearer_token) is not None
+        except Exception as e:
+            logging.exception(e)
+            return False
+
+    connection_statuses = {network_name: False for network_name, connection_config in connections}
+    chunk_size = max(AzureConfig.gateway_connection_chunk_size, 1)
+    for start in range(0, len(connections), chunk_size):
+        chunk = connections[start:start + chunk_size]
+        chunk_names = [network_name for network_name, connection_config in chunk]
+
+        if deadline - time.monotonic() <= 0:
+            logging.warning(f"Gateway update budget of {round(budget, 1)} seconds for VPN gateway {vpn_gateway_name} "
+                            f"is used up, deferring {len(connections) - start} of its connections to the next run.")
+            break
+
+        applied = False
+        for attempt in range(_GATEWAY_PRECONDITION_RETRIES + 1):
+            # The gateway is read again for every update so each one starts from its current state
+            vpn_gateway_info = AzureConfig.arm_client.get(vpn_gateway_endpoint, headers=header_with_bearer_token)
+            if vpn_gateway_info.status_code != 200:
+                logging.error("Could not obtain vWAN Gateway information")
+                logging.error(vpn_gateway_info.text)
+                break
+
+            vpn_gateway = merge_gateway_connections(vpn_gateway_info.json(), chunk, get_shared_key)
+            if vpn_gateway is None:
+                logging.warning(f"VPN gateway {vpn_gateway_name} has connections not managed by this function, "
+                                f"creating the connections of {chunk_names} one at a time.")
+                for network_name, is_applied in zip(chunk_names, _map_networks(put_connection_or_skip, chunk)):
+                    connection_statuses[network_name] = is_applied
+                break
+
+            update_headers = dict(header_with_bearer_token)
+            etag = vpn_gateway.get('etag') or vpn_gateway_info.headers.get('ETag')
+            if etag:
+                update_headers['If-Match'] = etag
+
+            logging.info(f"Updating {len(chunk)} connections of VPN gateway {vpn_gateway_name}")
+            vpn_gateway_update = AzureConfig.arm_client.put(vpn_gateway_endpoint, headers=update_headers,
+                                                            json=vpn_gateway)
+            if vpn_gateway_update.status_code == 412:
+                logging.info(f"VPN gateway {vpn_gateway_name} changed since it was read, retrying {chunk_names}.")
+                continue
+            if vpn_gateway_update.status_code > 399:
+                logging.error(f"Could not update the connections of {chunk_names} on VPN gateway {vpn_gateway_name}.")
+                logging.error(f"Response: {vpn_gateway_update.text}")
+                break
+
+            # Wait for the gateway update to finish; the gateway takes one update at a time
+            operation_url = vpn_gateway_update.headers.get('Azure-AsyncOperation')
+            if operation_url:
+                operation = poll_arm_operation(operation_url, header_with_bearer_token,
+                                               get_retry_after(vpn_gateway_update),
+                                               timeout=max(deadline - time.monotonic(), 0),
+                                               session=AzureConfig.arm_client)
+                if operation is None or str(operation.get('status', 'Succeeded')).lower() != 'succeeded':
+                    logging.error(f"VPN gateway {vpn_gateway_name} update for {chunk_names} did not succeed: "
+                                  f"{operation}")
+                    break
+
+            applied = True
+            break
+        else:
+            logging.error(f"VPN gateway {vpn_gateway_name} kept changing, leaving {chunk_names} to the next run.")
+
+        if applied:
+            for network_name, connection_config in chunk:
+                connection_statuses[network_name] = True
+                applied_keys[f"{network_name}{_CONNECTION_SUFFIX}"] = \
+                    connection_config['properties']['vpnLinkConnections'][0]['properties']['sharedKey']
+
+    return connection_statuses
+
+
+def get_azure_vpn_gateway_peer_info(vwan_config):
+    # Parse the vwan config file
+    azure_instance_0 = "192.0.2.1"  # placeholder value
+    azure_instance_1 = "192.0.2.2"  # placeholder value
+    azure_connected_subnets = ['1.1.1.1']  # placeholder value
+
+    # Get Azure VPN Gateway Instances
+    for instance in vwan_config['properties']['ipConfigurations']:
+        if instance['id'] == 'Instance0':
+            azure_instance_0 = instance['publicIpAddress']
+        elif instance['id'] == 'Instance1':
+            azure_instance_1 = instance['publicIpAddress']
+
+    # Get Azure connected subnets
+    if vwan_config['connectedVirtualNetworks']:
+        azure_connected_subnets = vwan_config['connectedVirtualNetworks']
+
+    return azure_instance_0, azure_instance_1, azure_connected_subnets
+
+
+def is_azure_config_current(desired, actual):
+    '''
+    Checks if a configuration read back from ARM still holds every value
+    of the desired one. Values ARM adds, such as provisioningState, are
+    ignored, as are values left None, such as a shared key ARM does not
+    return. Resource IDs are compared case-insensitively.
+
+    @param  desired: Configuration as it would be written
+    @param  actual:  Configuration returned by ARM
+    @rtype:          boolean
+    @return:         True or False
+    '''
+    if isinstance(desired, dict):
+        if not isinstance(actual, dict):
+            return False
+        for key, value in desired.items():
+            if value is None:
+                continue
+            if key == 'id' and isinstance(value, str) and isinstance(actual.get(key), str):
+                if value.lower() != actual[key].lower():
+                    return False
+            elif not is_azure_config_current(value, actual.get(key)):
+                return False
+        return True
+
+    if isinstance(desired, list):
+        return isinstance(actual, list) and len(desired) == len(actual) and \
+            all(is_azure_config_current(value, item) for value, item in zip(desired, actual))
+
+    return desired == actual
+
+
+def is_azure_network_current(result, hub_context):
+    # Sites and connections read back without their shared keys; the key is compared by the PSK rotation instead
+    site = get_azure_virtual_wan_site(hub_context['resource_group'], result['netname'], hub_context['headers'])
+    if site is None or not is_azure_config_current(result['site_config'], site):
+        logging.info(f"Virtual WAN site of {result['netname']} differs from its desired state.")
+        return False
+
+    connection = get_virtual_wan_connection(hub_context['resource_group'], hub_context['hub_info']['vpnGatewayName'],
+                                            result['netname'], hub_context['headers'])
+    desired_connection = get_virtual_wan_connection_config(hub_context['resource_group'], result['netname'],
+                                                           AzureConfig.subscription_id, result['wans'].items(), None)
+    if connection is None or not is_azure_config_current(desired_connection, connection):
+        logging.info(f"Virtual WAN connection of {result['netname']} differs from its desired state.")
+        return False
+
+    return True
+
+
+def reconcile_meraki_network(network, hub_context, update_azure=True):
+    '''
+    Discovers the MX setup of a tagged network and creates/updates its
+    vWAN site and connection. Returns what the caller needs to merge the
+    network into the third party VPN peer list, or None if the network
+    was skipped. With update_azure False the Azure writes are left to the
+    caller, which batches them for all networks.
+    '''
+    # need network ID in order to obtain device/serial information
+    network_info = network['id']
+
+    # network name used to label Meraki VPN and Azure config
+    netname = get_site_name(network)
+
+    vwan_hub_info = hub_context['hub_info']
+
+    with trace_span('appliance build', network=netname):
+        try:
+            warm_spare_settings = MerakiConfig.sdk_auth.appliance.getNetworkApplianceWarmSpare(network_info)
+        except Exception as e:
+            logging.error(f'Failed to fetch warm_spare_settings for {netname}')
+            logging.error(e)
+            return None
+
+        if 'primarySerial' in warm_spare_settings:
+            appliance = Appliance(network_info,
+                                  warm_spare_settings.get('enabled'),
+                                  warm_spare_settings.get('primarySerial'),
+                                  warm_spare_settings.get('spareSerial'),
+                                  MerakiConfig.org_id,
+                                  hub_context['uplinks'],
+                                  hub_context['inventory'])
+        else:
+            logging.info(f"MX device not found in {netname}, skipping network.")
+            return None
+
+        # check if appliance is on 15 firmware
+        if not appliance.is_firmware_compliant():
+            logging.info(f"MX device for {netname} not running v15 firmware, skipping network.")
+            return None  # if box isnt firmware skip to next network
+
+        # gets branch local vpn subnets
+        va = MerakiConfig.sdk_auth.appliance.getNetworkApplianceVpnSiteToSiteVpn(network_info)
+
+        # filter for subnets in vpn
+        privsub = ([x['localSubnet'] for x in va['subnets'] if x['useVpn'] is True])
+
+        # If the site has two uplinks; create and update vwan site with
+        wans = appliance.get_wan_links()
+
+    site_config = get_site_config(vwan_hub_info['location'], hub_context['virtual_wan_id'], privsub, netname, wans)
+
+    # Hash of what would be written to Azure. The PSK is left out: when nothing else changed the
+    # writes are skipped and the tunnel keeps the secret both sides already share.
+    desired_state_hash = get_payload_hash({
+        'vpnGateway': vwan_hub_info['vpnGatewayName'],
+        'vpnSite': site_config,
+        'vpnConnection': get_virtual_wan_connection_config(hub_context['resource_group'], netname,
+                                                           AzureConfig.subscription_id, wans.items(), None)
+    })
+
+    # Get specific vwan tag
+    specific_tag = hub_context['tag_index'].get_primary_tag(network_info)
+
+    # The site keeps its key unless rotation is due or requested with the vwan-rotate-psk tag
+    psk, psk_rotated = hub_context['psk_manager'].get_psk(netname, _VWAN_ROTATE_PSK_TAG in network['tags'])
+
+    result = {
+        'network': network,
+        'netname': netname,
+        'specific_tag': specific_tag,
+        'desired_state_hash': desired_state_hash,
+        'psk': psk,
+        'psk_rotated': psk_rotated,
+        'site_config': site_config,
+        'wans': wans,
+        'unchanged': False
+    }
+
+    # Skip both Azure writes if they would apply what was applied last time and both Meraki peers still exist.
+    # Full sweeps only skip them if the site and connection in Azure still match, repairing drift.
+    if hub_context['desired_state'].is_unchanged(network_info, desired_state_hash) and not psk_rotated and \
+            netname in hub_context['existing_peers'] and f"{netname}-sec" in hub_context['existing_peers'] and \
+            (not hub_context['full_sweep'] or is_azure_network_current(result, hub_context)):
+        logging.info(f"Virtual WAN configuration of {netname} is unchanged, skipping Azure updates.")
+        hub_context['desired_state'].add_writes_avoided(2)
+        result['unchanged'] = True
+        return result
+
+    if not update_azure:
+        return result
+
+    # Create/Update the vWAN Site + Site Links
+    virtual_wan_site_link_update = update_azure_virtual_wan_site_links(hub_context['resource_group'], netname,
+                                                                        hub_context['headers'], site_config)
+    if virtual_wan_site_link_update is None:
+        logging.error(f"Virtual WAN Site Link for {netname} could not be created/updated, skipping to next network.")
+        return None
+
+    if not connect_reconciled_network(result, hub_context):
+        return None
+
+    return result
+
+
+def connect_reconciled_network(result, hub_context):
+    # Create Virtual WAN Connection
+    vwan_connection_result = create_virtual_wan_connection(hub_context['resource_group'],
+                                                           hub_context['hub_info']['vpnGatewayName'],
+                                                           result['netname'], AzureConfig.subscription_id,
+                                                           result['wans'].items(), result['psk'], hub_context['headers'])
+    if vwan_connection_result is None:
+        logging.error(f"Virtual WAN Connection for {result['netname']} could not be created, skipping to next network.")
+        return False
+
+    return True
+
+
+def _map_networks(function, items):
+    # Networks are independent of each other until they are merged into the peer list,
+    # so up to max_concurrent_networks of them are processed at once
+    max_workers = min(MerakiConfig.max_concurrent_networks, len(items))
+    if max_workers <= 1:
+        return [function(item) for item in items]
+
+    # executor.map returns results in the order of items
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(function, items))
+
+
+def discover_meraki_networks(networks, hub_context, update_azure=True):
+    def reconcile_or_skip(network):
+        try:
+            # Per-network calls yield the Meraki rate budget to failover checks
+            with request_priority(BULK):
+                return reconcile_meraki_network(network, hub_context, update_azure=update_azure)
+        except Exception as e:
+            logging.error(f"Failed to reconcile network {network['name']}, skipping network.")
+            logging.exception(e)
+            return None
+
+    return _map_networks(reconcile_or_skip, networks)
+
+
+def reconcile_meraki_networks(networks, hub_context):
+    bulk_azure_updates = AzureConfig.use_arm_batch or AzureConfig.use_gateway_bulk_connections
+
+    results = discover_meraki_networks(networks, hub_context, update_azure=not bulk_azure_updates)
+    if not bulk_azure_updates:
+        return results
+
+    return upsert_reconciled_networks(results, hub_context)
+
+
+def upsert_reconciled_networks(results, hub_context):
+    '''
+    Creates/updates the vWAN sites and connections of networks discovered
+    with update_azure False, in bulk when use_arm_batch or
+    use_gateway_bulk_connections is set and one network at a time
+    otherwise. Networks that could not be updated are set to None.
+
+    @param  results:     Results of reconcile_meraki_network(), None for skipped networks
+    @param  hub_context: Resource group, hub info and ARM headers of the hub
+    @rtype:              list
+    @return:             results
+    '''
+    pending = [index for index, result in enumerate(results) if result is not None and not result['unchanged']]
+
+    # vpnSites of every network to update are upserted in ARM batches, or one PUT per network
+    if AzureConfig.use_arm_batch:
+        site_statuses = update_azure_virtual_wan_sites(hub_context['resource_group'],
+                                                       [(results[index]['netname'], results[index]['site_config'])
+                                                        for index in pending],
+                                                       hub_context['headers'])
+    else:
+        def update_site_or_skip(index):
+            try:
+                return update_azure_virtual_wan_site_links(hub_context['resource_group'], results[index]['netname'],
+                                                           hub_context['headers'], results[index]['site_config'])
+            except Exception as e:
+                logging.exception(e)
+                return None
+
+        site_statuses = dict(zip((results[index]['netname'] for index in pending),
+                                 _map_networks(update_site_or_skip, pending)))
+
+    for index in pending[:]:
+        if site_statuses[results[index]['netname']] is None:
+            logging.error(f"Virtual WAN Site Link for {results[index]['netname']} could not be created/updated, "
+                          "skipping to next network.")
+            results[index] = None
+            pending.remove(index)
+
+    # Connections need their vpnSite, so they follow once the sites are done
+    if AzureConfig.use_gateway_bulk_connections:
+        # A timer run shares its budget among its hubs; an activity updates one hub and has it all
+        budget = None
+        if 'gateway_hubs_left' in hub_context:
+            budget = get_gateway_update_budget(hub_context['gateway_hubs_left'])
+        connection_statuses = update_azure_virtual_wan_gateway_connections(
+            hub_context['resource_group'], hub_context['hub_info']['vpnGatewayName'],
+            [(results[index]['netname'],
+              get_virtual_wan_connection_config(hub_context['resource_group'], results[index]['netname'],
+                                                AzureConfig.subscription_id, results[index]['wans'].items(),
+                                                results[index]['psk']))
+             for index in pending],
+            hub_context['headers'], hub_context['psk_manager'], budget)
+        connected = [connection_statuses[results[index]['netname']] for index in pending]
+    else:
+        def connect_or_skip(index):
+            try:
+                return connect_reconciled_network(results[index], hub_context)
+            except Exception as e:
+                logging.error(f"Failed to connect network {results[index]['netname']}, skipping network.")
+                logging.exception(e)
+                return False
+
+        connected = _map_networks(connect_or_skip, pending)
+
+    for index, is_connected in zip(pending, connected):
+        if not is_connected:
+            results[index] = None
+
+    return results
+
+
 class MerakiConfig:
     api_key = os.environ['meraki_api_key'].lower()
     org_name = os.environ['meraki_org_name']
@@ -685,18 +1355,53 @@ class MerakiConfig:
     maintenance_time_in_utc = int(os.environ['maintenance_time_in_utc'])
     tag_prefix = 'vwan-'
     primary_tag_regex = f"(?i)^{tag_prefix}([a-zA-Z0-9_-]+)-[0-9]+$"
+    primary_tag_pattern = re.compile(primary_tag_regex)
     secondary_tag_regex = f"(?i)^{tag_prefix}([a-zA-Z0-9_-]+)-[0-9]+-sec$"
     org_id = None
-    # authenticating to the Meraki SDK
-    sdk_auth = meraki.DashboardAPI(api_key)
+    # 'full' reconciles every tagged network on a change, 'incremental' only the changed ones
+    reconcile_mode = os.environ.get('reconcile_mode', _FULL).lower()
+    # how often an incremental run reconciles every tagged network, checking unchanged ones against Azure;
+    # 0 disables full sweeps
+    full_sweep_interval_minutes = int(os.environ.get('full_sweep_interval_minutes', 60))
+    # number of networks reconciled concurrently, 1 keeps the run serial
+    max_concurrent_networks = int(os.environ.get('max_concurrent_networks', 1))
+    # run as the Meraki-VWAN-Orchestrator durable orchestration instead of this timer function
+    use_durable_orchestration = os.environ.get('use_durable_orchestration', _NO) == _YES
+    # networks discovered per activity of the durable orchestration
+    durable_network_batch_size = int(os.environ.get('durable_network_batch_size', 100))
+    # authenticating to the Meraki SDK, the pooled client is shared with shared_code
+    sdk_auth = get_dashboard(api_key)
 
 
 class AzureConfig:
     subscription_id = os.environ['subscription_id']
     vwan_name = os.environ['vwan_name']
-
-
-def main(MerakiTimer: func.TimerRequest) -> None:
+    # number of hubs whose info and effective routes are fetched concurrently
+    max_concurrent_hubs = int(os.environ.get('max_concurrent_hubs', 8))
+    # upsert the vpnSites of a hub through ARM $batch instead of one PUT per network
+    use_arm_batch = os.environ.get('use_arm_batch', _NO) == _YES
+    # create the vpnConnections of a hub with chunked gateway level updates instead of one PUT per network
+    use_gateway_bulk_connections = os.environ.get('use_gateway_bulk_connections', _NO) == _YES
+    gateway_connection_chunk_size = int(os.environ.get('gateway_connection_chunk_size', 50))
+    # seconds one invocation waits for gateway level updates, well within the 5 minute function timeout;
+    # connections not applied by then are left to the next run
+    gateway_update_timeout = float(os.environ.get('gateway_update_timeout', 120))
+    gateway_update_deadline = None
+    # pooled session with timeouts and retries used for every ARM call
+    arm_client = get_arm_client()
+
+
+def get_reconcile_plan(past_due, desired_state=None):
+    '''
+    Looks up the organization and decides whether this run has anything
+    to do. Returns None when it has not, otherwise the networks of the
+    organization and the scope of the run.
+
+    @param  past_due:      True if the timer that started the run was past due
+    @param  desired_state: DesiredStateStore of the run, loaded from its file when None
+    @rtype:                dict
+    @return:          Plan of the run, or None
+    '''
     start_time = dt.datetime.utcnow()
     utc_timestamp = start_time.replace(tzinfo=dt.timezone.utc).isoformat()
 
@@ -704,41 +1409,51 @@ def main(MerakiTimer: func.TimerRequest) -> None:
     logging.info('Python version: %s', sys.version)
 
     # Obtain Meraki Org ID for API Calls
-    result_org_id = MerakiConfig.sdk_auth.organizations.getOrganizations()
+    with trace_span('org lookup'):
+        result_org_id = MerakiConfig.sdk_auth.organizations.getOrganizations()
     for x in result_org_id:
         if x['name'] == MerakiConfig.org_name:
             MerakiConfig.org_id = x['id']
-                     
+
     # executing function to delete tag placeholder network for customers migrating from v0 to v1 of the API
     delete_tag_placeholder()
 
-    # If no organization is mapped to the customer org name create logging error 
+    # If no organization is mapped to the customer org name create logging error
     if not MerakiConfig.org_id:
         logging.error("Could not find Meraki Organization Name.")
-        return
+        return None
 
     # Check if any config changes have been made to the Meraki configuration
-    change_log = MerakiConfig.sdk_auth.organizations.getOrganizationConfigurationChanges(MerakiConfig.org_id, total_pages=1, timespan=300)
+    with trace_span('change log'):
+        change_log = MerakiConfig.sdk_auth.organizations.getOrganizationConfigurationChanges(MerakiConfig.org_id, total_pages=1, timespan=300)
 
-    # Creating variable that indicates whether there has been a Meraki config change    
-    dashboard_config_change_ts = False
+    # Network IDs with vpn changes or network tag changes, None if a change is not tied to a network
+    changed_network_ids = get_changed_network_ids(change_log)
 
-    # Iterating through the event log to match events for vpn changes or network tag changes 
-    for tag_events in change_log:
-        if tag_events['label'] == 'Network tags' or tag_events['label'] == 'VPN subnets':
-            # change detected, indicating config change by changing dashboard_config_change_ts to true
-            dashboard_config_change_ts = True
+    # Creating variable that indicates whether there has been a Meraki config change
+    dashboard_config_change_ts = changed_network_ids is None or len(changed_network_ids) > 0
 
-    # If no maintenance mode, check if changes were made in last 5 minutes or 
+    # Hashes of the configuration last applied per network, used to skip unchanged Azure writes
+    if desired_state is None:
+        desired_state = DesiredStateStore()
+
+    # In incremental mode a full sweep runs every full_sweep_interval_minutes as a safety net: it reconciles
+    # every tagged network, and checks the sites and connections of unchanged ones against Azure
+    incremental = MerakiConfig.reconcile_mode == _INCREMENTAL
+    full_sweep_due = is_full_sweep_due(desired_state)
+
+    # If no maintenance mode, check if changes were made in last 5 minutes or
     # if script has not been run within 5 minutes; check for updates
-    if dashboard_config_change_ts is False and MerakiTimer.past_due is False and MerakiConfig.use_maintenance_window == _NO:
+    if dashboard_config_change_ts is False and past_due is False and MerakiConfig.use_maintenance_window == _NO \
+            and not full_sweep_due:
         logging.info("No changes in the past 5 minutes have been detected. No updates needed.")
-        return
+        return None
 
     # Meraki call to obtain Network information
-    meraki_networks = MerakiConfig.sdk_auth.organizations.getOrganizationNetworks(
-        MerakiConfig.org_id, total_pages='all'
-        )
+    with trace_span('network fetch'):
+        meraki_networks = MerakiConfig.sdk_auth.organizations.getOrganizationNetworks(
+            MerakiConfig.org_id, total_pages='all'
+            )
 
     # Check if tag placeholder network exists, if not create it
     # commenting out as this is no longer needed in v1 of Meraki SDK
@@ -749,16 +1464,238 @@ def main(MerakiTimer: func.TimerRequest) -> None:
     # apply now tag once the script has executed
     remove_network_id_list = get_meraki_networks_by_tag(_VWAN_APPLY_NOW_TAG, meraki_networks)
 
+    in_maintenance_window = MerakiConfig.use_maintenance_window == _YES and \
+        MerakiConfig.maintenance_time_in_utc == start_time.hour
+
+    # Incremental runs only reconcile changed and vwan-apply-now networks;
+    # None means every tagged network is reconciled
+    incremental_scope = None
+    if incremental and not full_sweep_due and not past_due and not in_maintenance_window \
+            and changed_network_ids is not None:
+        incremental_scope = changed_network_ids | set(remove_network_id_list)
+        logging.info(f"Incremental reconcile of {len(incremental_scope)} changed networks.")
+
+    return {
+        'meraki_networks': meraki_networks,
+        'desired_state': desired_state,
+        'remove_network_id_list': remove_network_id_list,
+        'incremental_scope': incremental_scope,
+        'full_sweep': full_sweep_due,
+        # if we are in maintenance mode or if update now tag is seen
+        'apply_updates': in_maintenance_window or MerakiConfig.use_maintenance_window == _NO or \
+            len(remove_network_id_list) > 0
+    }
+
+
+def get_vwan_hub_candidates(meraki_networks, header_with_bearer_token, device_inventory):
+    '''
+    Finds the Virtual WAN and the tagged networks of each of its hubs that
+    survive candidate filtering. Returns None if the Virtual WAN or one of
+    the tagged hubs does not exist.
+
+    @param  meraki_networks:          Networks from getOrganizationNetworks()
+    @param  header_with_bearer_token: ARM request headers
+    @param  device_inventory:         DeviceInventory of the organization
+    @rtype:                           tuple
+    @return:                          Virtual WAN, TagIndex and hub to candidate networks, or None
+    '''
+    # Get list of Azure Virtual WANs
+    virtual_wans = get_azure_virtual_wans(header_with_bearer_token)
+    if virtual_wans is None:
+        return None
+
+    # Find virtual wan instance
+    virtual_wan = find_azure_virtual_wan(AzureConfig.vwan_name, virtual_wans)
+    if virtual_wan is None:
+        logging.error(
+            "Could not find vWAN instance.  Please ensure you have created your Virtual WAN resource prior to running "
+            "this script or check that the system assigned identity has access to your Virtual WAN instance.")
+        return None
+
+    # Complie list of hubs that are in scope for Meraki
+    # Hub -> networks -> primary tag, built in one pass over the networks' tags
+    tag_index = TagIndex(meraki_networks, MerakiConfig.primary_tag_pattern)
+    tagged_hubs = tag_index.hubs
+    logging.info(f"Tagged Virtual WAN Hubs found: {tagged_hubs}")
+
+    # Check if VWAN Hubs in scope exist; if not log an error the hub doesn't exist
+    hubs_exist = check_vwan_hubs_exist(virtual_wan, tagged_hubs)
+    if(not hubs_exist):
+        logging.error("Not all Virtual WAN hubs exist, please ensure all hubs are created.")
+        return None
+
+    # Tagged networks per hub that survive candidate filtering
+    hub_candidates = {}
+    for hub in tagged_hubs:
+
+        # networks with vWAN in the tag for this hub
+        hub_networks = tag_index.get_networks(hub)
+        for network in hub_networks:
+            logging.info(f"Tags found for {network['name']} with hub {hub} \
+                | Tags: {network['tags']}")
+
+        # Drop networks that bulk data already rules out before any per-network API call
+        candidate_networks, saved_calls = filter_candidate_networks(hub_networks, device_inventory)
+        logging.info(f"Candidate filtering kept {len(candidate_networks)} of {len(hub_networks)} networks "
+                     f"for hub {hub}, saving {saved_calls} Meraki API calls.")
+
+        if not candidate_networks:
+            logging.info(f"No tagged networks found for hub {hub}.")
+            continue
+
+        hub_candidates[hub] = candidate_networks
+
+    return virtual_wan, tag_index, hub_candidates
+
+
+def get_hub_scope(hub, candidate_networks, vwan_config, desired_state, incremental_scope):
+    '''
+    Returns the Azure VPN Gateway peer info of a hub, the hash of the hub
+    state and the networks of the hub to reconcile in this run.
+
+    @param  hub:                Virtual WAN hub name
+    @param  candidate_networks: Candidate networks of the hub
+    @param  vwan_config:        Gateway configuration of the hub
+    @param  desired_state:      DesiredStateStore of the run
+    @param  incremental_scope:  Network IDs of an incremental run, None for every network
+    @rtype:                     tuple
+    @return:                    Peer info, hub state hash and networks
+    '''
+    # Azure VPN Gateway instances and connected subnets are the same for every network of the hub
+    peer_info = get_azure_vpn_gateway_peer_info(vwan_config)
+
+    # Incremental runs narrow the hub to its changed networks unless the hub itself changed
+    hub_state_hash = get_hub_state_hash(*peer_info)
+    if incremental_scope is not None and desired_state.get_meta(get_hub_meta_key(hub)) == hub_state_hash:
+        candidate_networks = [network for network in candidate_networks if network['id'] in incremental_scope]
+        logging.info(f"{len(candidate_networks)} changed networks to reconcile for hub {hub}.")
+
+    return peer_info, hub_state_hash, candidate_networks
+
+
+def merge_reconciled_networks(peer_table, peer_info, results):
+    '''
+    Merges the reconciled networks of a hub into the third party VPN peer
+    list, in network order so the peer list stays deterministic.
+
+    @param  peer_table: PeerTable of the run
+    @param  peer_info:  Azure VPN Gateway instances and connected subnets of the hub
+    @param  results:    Results of reconcile_meraki_network(), None for skipped networks
+    @rtype:             tuple
+    @return:            Networks tagged vwan-apply-now, results applied to Azure, and
+                        whether any network was merged
+    '''
+    azure_instance_0, azure_instance_1, azure_connected_subnets = peer_info
+    apply_now_networks = []
+    applied_results = []
+    found_tagged_networks = False
+    for result in results:
+        if result is None:
+            continue
+
+        netname = result['netname']
+
+        # Build meraki configurations for Azure VWAN VPN Gateway Instance 0 & 1
+        azure_instance_0_config = get_meraki_ipsec_config(netname, azure_instance_0,
+                                                        azure_connected_subnets, result['psk'],
+                                                        result['specific_tag'])
+        azure_instance_1_config = get_meraki_ipsec_config(f"{netname}-sec", azure_instance_1,
+                                                        azure_connected_subnets, result['psk'], f"none")
+
+        # Existing peers keep their network tags, which failover may have moved
+        peer_table.upsert(azure_instance_0_config, PEER_UPDATE_FIELDS)
+        peer_table.upsert(azure_instance_1_config, PEER_UPDATE_FIELDS)
+
+        if _VWAN_APPLY_NOW_TAG in result['network']['tags']:
+            apply_now_networks.append(result['network'])
+
+        if not result['unchanged']:
+            applied_results.append(result)
+
+        found_tagged_networks = True
+
+    return apply_now_networks, applied_results, found_tagged_networks
+
+
+def finish_reconcile(peer_table, meraki_networks, plan, psk_manager, applied_results, apply_now_networks,
+                     hub_state_hashes, failover=None):
+    '''
+    Runs failover, writes the peer list once for every hub, records what
+    was applied and removes the vwan-apply-now and vwan-rotate-psk tags
+    of the reconciled networks.
+
+    @param  peer_table:         PeerTable every hub was merged into
+    @param  meraki_networks:    Networks from getOrganizationNetworks(), fetched when None
+    @param  plan:               Plan from get_reconcile_plan()
+    @param  psk_manager:        PskManager of the run
+    @param  applied_results:    Results applied to Azure
+    @param  apply_now_networks: Networks tagged vwan-apply-now that were reconciled
+    @param  hub_state_hashes:   Hub name to the hash of its state
+    @param  failover:           Future of a failover check already started, None to run it now
+    @return:                    None
+    '''
+    desired_state = plan['desired_state']
+
+    # Failover decisions are merged into the same peer list as the hub updates
+    if failover is None:
+        run_vpn_failover(peer_table, meraki_networks)
+    else:
+        failover.result()
+
+    # Single write of the org peer list for every hub
+    update_meraki_vpn_peers(peer_table)
+
+    # Azure and Meraki now share the same configuration and key, remember what was applied
+    for result in applied_results:
+        desired_state.record(result['network']['id'], result['desired_state_hash'])
+        if result['psk_rotated']:
+            psk_manager.record_rotation(result['netname'])
+    for hub, hub_state_hash in hub_state_hashes.items():
+        desired_state.set_meta(get_hub_meta_key(hub), hub_state_hash)
+    if plan['full_sweep']:
+        desired_state.set_meta(_LAST_FULL_SWEEP, time.time())
+    with trace_span('state save'):
+        desired_state.save()
+    logging.info(f"Unchanged networks avoided {desired_state.writes_avoided} Azure writes so far.")
+
+    # Cleanup any found vwan-apply-now tags on the networks reconciled in this run
+    if len(plan['remove_network_id_list']) > 0:
+        logging.info("remove_network_id_list value: " + str(plan['remove_network_id_list']))
+        for network in apply_now_networks:
+            new_tag_list = network['tags'][:]
+            logging.info("pre-parsed network tag variable: " + str(new_tag_list))
+            new_tag_list.remove(_VWAN_APPLY_NOW_TAG)
+            logging.info("parsed network tag variable: " + str(new_tag_list))
+            MerakiConfig.sdk_auth.networks.updateNetwork(network['id'], tags=new_tag_list)
+
+    # Cleanup vwan-rotate-psk tags once the new keys are applied
+    for result in applied_results:
+        network = result['network']
+        if result['psk_rotated'] and _VWAN_ROTATE_PSK_TAG in network['tags']:
+            new_tag_list = [tag for tag in network['tags'] if tag not in (_VWAN_ROTATE_PSK_TAG, _VWAN_APPLY_NOW_TAG)]
+            logging.info(f"Removing {_VWAN_ROTATE_PSK_TAG} tag from {network['name']}")
+            MerakiConfig.sdk_auth.networks.updateNetwork(network['id'], tags=new_tag_list)
+
+
+def reconcile(MerakiTimer: func.TimerRequest) -> None:
+    plan = get_reconcile_plan(MerakiTimer.past_due)
+    if plan is None:
+        return
+
+    meraki_networks = plan['meraki_networks']
+    desired_state = plan['desired_state']
+    incremental_scope = plan['incremental_scope']
+
     # if we are in maintenance mode or if update now tag is seen
-    if (MerakiConfig.use_maintenance_window == _YES and MerakiConfig.maintenance_time_in_utc == start_time.hour) or \
-            MerakiConfig.use_maintenance_window == _NO or len(remove_network_id_list) > 0:
+    if plan['apply_updates']:
 
         # variable with new and existing s2s VPN config
         merakivpns: list = []
 
         # performing initial get to obtain all Meraki existing VPN info to add to
         # merakivpns list above
-        originalvpn = MerakiConfig.sdk_auth.appliance.getOrganizationApplianceVpnThirdPartyVPNPeers(MerakiConfig.org_id)
+        with trace_span('peer fetch'):
+            originalvpn = MerakiConfig.sdk_auth.appliance.getOrganizationApplianceVpnThirdPartyVPNPeers(MerakiConfig.org_id)
         merakivpns.append(originalvpn)
 
         # Get access token to authenticate to Azure
@@ -767,208 +1704,369 @@ def main(MerakiTimer: func.TimerRequest) -> None:
             return
         header_with_bearer_token = {'Authorization': f'Bearer {access_token}'}
 
-        # Get list of Azure Virtual WANs
-        virtual_wans = get_azure_virtual_wans(header_with_bearer_token)
-        if virtual_wans is None:
-            return
+        # Org-wide device inventory replaces a getDevice call per primary and spare MX
+        device_inventory = DeviceInventory(MerakiConfig.org_id, MerakiConfig.sdk_auth)
 
-        # Find virtual wan instance
-        virtual_wan = find_azure_virtual_wan(AzureConfig.vwan_name, virtual_wans)
-        if virtual_wan is None:
-            logging.error(
-                "Could not find vWAN instance.  Please ensure you have created your Virtual WAN resource prior to running "
-                "this script or check that the system assigned identity has access to your Virtual WAN instance.")
+        hub_candidates = get_vwan_hub_candidates(meraki_networks, header_with_bearer_token, device_inventory)
+        if hub_candidates is None:
             return
+        virtual_wan, tag_index, hub_candidates = hub_candidates
 
-        # Complie list of hubs that are in scope for Meraki
-        tagged_hubs = meraki_vwan_hubs(meraki_networks)
-        logging.info(f"Tagged Virtual WAN Hubs found: {tagged_hubs}")
+        # Site to site VPN keys stay the same across runs unless rotated
+        psk_manager = PskManager(merakivpns[0]['peers'], desired_state)
 
-        # Check if VWAN Hubs in scope exist; if not log an error the hub doesn't exist
-        hubs_exist = check_vwan_hubs_exist(virtual_wan, tagged_hubs)
-        if(not hubs_exist):
-            logging.error("Not all Virtual WAN hubs exist, please ensure all hubs are created.")
-            return
+        logging.info("logging meraki vpns: " + str(merakivpns[0]))
+        # Peers indexed by name; every hub merges into it and the payload is built from it
+        peer_table = PeerTable(merakivpns[0]['peers'])
 
-        # Generate random password for site to site VPN config
-        psk = pwgenerator.generate()
+        # Org-wide uplink statuses are fetched once and shared by every MX built in this run
+        uplink_snapshot = UplinkSnapshot(MerakiConfig.org_id, MerakiConfig.sdk_auth)
 
-        logging.info("logging meraki vpns: " + str(merakivpns[0]))
-        new_meraki_vpns = merakivpns[0]['peers']
+        existing_peers = set(peer['name'] for peer in merakivpns[0]['peers'])
+
+        # Failover is checked while the hubs' networks are reconciled, its Meraki calls taking the
+        # FAILOVER lane ahead of their BULK calls. It finishes before any hub is merged into peer_table,
+        # and a failed check is logged rather than raised by failover.result().
+        failover_executor = ThreadPoolExecutor(max_workers=1)
+        failover = failover_executor.submit(run_vpn_failover, peer_table, meraki_networks)
+        failover_executor.shutdown(wait=False)
+
+        # Results of every hub, applied after the single peer list write
+        apply_now_networks = []
+        applied_results = []
+        hub_state_hashes = {}
+
+        # Get Virtual WAN hub info and gateway configuration of all hubs at once
+        hub_configs = get_azure_virtual_wan_hub_configs(virtual_wan['resourceGroup'], list(hub_candidates),
+                                                        header_with_bearer_token)
 
         # Loop through each VWAN hub
-        for hub in tagged_hubs:
+        for hub_index, (hub, candidate_networks) in enumerate(hub_candidates.items()):
 
             logging.info(f"Traversing Meraki networks with updates for VWAN Hub: {hub}")
 
-            # Get Virtual WAN hub info
-            vwan_hub_info = get_azure_virtual_wan_hub_info(virtual_wan['resourceGroup'], hub, header_with_bearer_token)
+            vwan_hub_info, vwan_config = hub_configs[hub]
 
             # If no Virtual WAN hub or VPN Gateway, skip this hub
             if vwan_hub_info is None:
                 continue
 
-            # Get Virtual WAN Gateway Configuration
-            vwan_config = get_azure_virtual_wan_gateway_config(virtual_wan['resourceGroup'], vwan_hub_info['name'], vwan_hub_info['vpnGatewayName'], header_with_bearer_token)
+            # Virtual WAN Gateway Configuration could not be obtained; the hub's peers are left as they are
+            # and the other hubs are still reconciled, wherever the hub is in the list
             if vwan_config is None:
-                return
-
-            # networks with vWAN in the tag
-            found_tagged_networks = False
-            for network in meraki_networks:
-                # Check for placeholder network
-                #if network['name'].lower() == MerakiConfig.tag_placeholder_network:
-                #    logging.info(f"{network['name']} network found, skipping.")
-                #    continue
-
-                # Check if tags exist
-                if not network['tags']:
-                    logging.info(f"No tags found for {network['name']}, skipping to next network")
-                    continue
+                logging.error(f"Skipping hub {hub} without its VPN gateway configuration.")
+                continue
 
-                # Check if any vwan tags exist
-                if not check_if_meraki_vwan_tags_exist(network['tags'], network['name'], vwan_hub_info['name']):
-                    continue
+            hub_context = {
+                'resource_group': virtual_wan['resourceGroup'],
+                'virtual_wan_id': virtual_wan['id'],
+                'hub_info': vwan_hub_info,
+                'psk_manager': psk_manager,
+                'headers': header_with_bearer_token,
+                'uplinks': uplink_snapshot,
+                'inventory': device_inventory,
+                'desired_state': desired_state,
+                'full_sweep': plan['full_sweep'],
+                'existing_peers': existing_peers,
+                'tag_index': tag_index,
+                # This hub and the ones after it share what is left of the gateway update budget
+                'gateway_hubs_left': len(hub_candidates) - hub_index
+            }
 
-                logging.info(f"Tags found for {network['name']} with hub {vwan_hub_info['name']} \
-                    | Tags: {network['tags']}")
-                             
-                new_tag_list = network['tags'][:]
-
-                # need network ID in order to obtain device/serial information
-                network_info = network['id']
-
-                # network name used to label Meraki VPN and Azure config
-                netname = str(network['name']).replace(' ', '')
-
-                try:
-                    warm_spare_settings = MerakiConfig.sdk_auth.appliance.getNetworkApplianceWarmSpare(network_info)
-                except Exception as e:
-                    logging.error('Failed to fetch warm_spare_settings')
-                    logging.error(e.message)
-
-                if 'primarySerial' in warm_spare_settings:
-                    appliance = Appliance(network_info,
-                                          warm_spare_settings.get('enabled'),
-                                          warm_spare_settings.get('primarySerial'),
-                                          warm_spare_settings.get('spareSerial'),
-                                          MerakiConfig.org_id)
-                else:
-                    logging.info(f"MX device not found in {netname}, skipping network.")
-                    continue
+            peer_info, hub_state_hash, candidate_networks = get_hub_scope(hub, candidate_networks, vwan_config,
+                                                                          desired_state, incremental_scope)
+            if not candidate_networks:
+                continue
+
+            # Networks may be reconciled concurrently; results come back in network order
+            # so merging them into the third party VPN peer list stays deterministic
+            with trace_span('hub networks', hub=hub, networks=len(candidate_networks)):
+                hub_results = reconcile_meraki_networks(candidate_networks, hub_context)
+            failover.result()
+            hub_apply_now_networks, hub_applied_results, found_tagged_networks = \
+                merge_reconciled_networks(peer_table, peer_info, hub_results)
+            apply_now_networks.extend(hub_apply_now_networks)
+            applied_results.extend(hub_applied_results)
 
-                # check if appliance is on 15 firmware
-                if not appliance.is_firmware_compliant():
-                    logging.info(f"MX device for {netname} not running v15 firmware, skipping network.")
-                    continue  # if box isnt firmware skip to next network
+            if not found_tagged_networks:
+                logging.info(f"No tagged networks found for hub {hub}.")
+                continue
 
-                # gets branch local vpn subnets
-                va = MerakiConfig.sdk_auth.appliance.getNetworkApplianceVpnSiteToSiteVpn(network_info)
+            hub_state_hashes[hub] = hub_state_hash
 
-                # filter for subnets in vpn
-                privsub = ([x['localSubnet'] for x in va['subnets'] if x['useVpn'] is True])
+        finish_reconcile(peer_table, meraki_networks, plan, psk_manager, applied_results, apply_now_networks,
+                         hub_state_hashes, failover)
+    else:
+        logging.info("Maintenance mode detected but it is not during scheduled hours "
+                     f"or the {_VWAN_APPLY_NOW_TAG} tag has not been detected. Skipping updates")
+        peer_table = PeerTable(MerakiConfig.sdk_auth.appliance.getOrganizationApplianceVpnThirdPartyVPNPeers(
+            MerakiConfig.org_id
+            )['peers'])
+        run_vpn_failover(peer_table, meraki_networks)
+        update_meraki_vpn_peers(peer_table)
+
+
+# Org-wide snapshots shared by the activities of one orchestration run that land on this worker.
+# Activity payloads are kept in the task hub's history, so pre-shared keys only travel in them when
+# they are new; every other key is looked up in the peer list by the activity that needs it.
+_orchestration_runs = {}
+_orchestration_runs_lock = threading.Lock()
+
+def _get_orchestration_run(payload):
+    MerakiConfig.org_id = payload['orgId']
+    with _orchestration_runs_lock:
+        run = _orchestration_runs.get(payload['runId'])
+        if run is None:
+            # Only the latest run of the orchestration is kept
+            _orchestration_runs.clear()
+            peers = MerakiConfig.sdk_auth.appliance.getOrganizationApplianceVpnThirdPartyVPNPeers(
+                MerakiConfig.org_id
+                )['peers']
+            run = _orchestration_runs[payload['runId']] = {
+                'peer_list': peers,
+                'peers': set(peer['name'] for peer in peers),
+                'uplinks': UplinkSnapshot(MerakiConfig.org_id, MerakiConfig.sdk_auth),
+                'inventory': DeviceInventory(MerakiConfig.org_id, MerakiConfig.sdk_auth)
+            }
+    return run
+
+def _get_arm_headers():
+    access_token = get_bearer_token(_AZURE_MGMT_URL)
+    if access_token is None:
+        raise RuntimeError("Could not obtain an access token for Azure Resource Manager.")
+    return {'Authorization': f'Bearer {access_token}'}
+
+def _get_carried_desired_state(items):
+    # The orchestration carries the desired state of the networks and hubs in its payloads; workers
+    # do not share files, so each activity builds its store from the slices it was given
+    state = {'networks': {}, 'meta': {}}
+    for item in items:
+        item_state = item.get('desiredState') or {}
+        state['networks'].update(item_state.get('networks', {}))
+        state['meta'].update(item_state.get('meta', {}))
+    return DesiredStateStore(state=state)
+
+def plan_orchestration(payload):
+    '''
+    Activity of the Meraki-VWAN-Orchestrator orchestration: decides whether
+    the run has anything to do and returns the candidate networks of each
+    tagged hub, each with its slice of the desired state, or None when
+    there is nothing to do.
+
+    @param  payload: {'pastDue': bool, 'desiredState': dict}
+    @rtype:          dict
+    @return:         Plan of the orchestration
+    '''
+    # The plan is the only activity running, its worker gets the whole Meraki rate budget
+    set_rate_limit_workers(1)
+    desired_state = DesiredStateStore(state=payload.get('desiredState') or {})
+    plan = get_reconcile_plan(payload.get('pastDue', False), desired_state)
+    if plan is None:
+        return None
 
-                # If the site has two uplinks; create and update vwan site with
-                wans = appliance.get_wan_links()
+    orchestration_plan = {
+        'runId': uuid.uuid4().hex,
+        'orgId': MerakiConfig.org_id,
+        'applyUpdates': plan['apply_updates'],
+        'removeNetworkIds': plan['remove_network_id_list'],
+        'incrementalScope': None if plan['incremental_scope'] is None else sorted(plan['incremental_scope']),
+        'fullSweep': plan['full_sweep'],
+        'networkBatchSize': MerakiConfig.durable_network_batch_size,
+        'gatewayBulkConnections': AzureConfig.use_gateway_bulk_connections,
+        'hubs': []
+    }
+    if not plan['apply_updates']:
+        logging.info("Maintenance mode detected but it is not during scheduled hours "
+                     f"or the {_VWAN_APPLY_NOW_TAG} tag has not been detected. Skipping updates")
+        return orchestration_plan
 
-                site_config = get_site_config(vwan_hub_info['location'], virtual_wan['id'], privsub, netname, wans)
+    device_inventory = DeviceInventory(MerakiConfig.org_id, MerakiConfig.sdk_auth)
+    hub_candidates = get_vwan_hub_candidates(plan['meraki_networks'], _get_arm_headers(), device_inventory)
+    if hub_candidates is None:
+        return None
+    virtual_wan, tag_index, hub_candidates = hub_candidates
+
+    orchestration_plan['resourceGroup'] = virtual_wan['resourceGroup']
+    orchestration_plan['virtualWanId'] = virtual_wan['id']
+    for hub, candidate_networks in hub_candidates.items():
+        orchestration_plan['hubs'].append({
+            'hub': hub,
+            'desiredState': desired_state.get_state(meta_keys=[get_hub_meta_key(hub)]),
+            'networks': [{'id': network['id'], 'name': network['name'], 'tags': network['tags'],
+                          'desiredState': desired_state.get_state([network['id']],
+                                                                  [get_psk_meta_key(get_site_name(network))])}
+                         for network in candidate_networks]
+        })
+    return orchestration_plan
+
+def get_orchestration_hub_config(payload):
+    '''
+    Activity of the Meraki-VWAN-Orchestrator orchestration: gets the hub
+    info and effective routes of one hub and narrows its networks to the
+    ones to reconcile.
+
+    @param  payload: Plan fields and {'hub': str, 'desiredState': dict, 'networks': list}
+    @rtype:          dict
+    @return:         Hub info, peer info, hub state hash and networks, or None
+                     without a hub or VPN Gateway, {'failed': True} without its
+                     gateway configuration
+    '''
+    headers = _get_arm_headers()
+    vwan_hub_info = get_azure_virtual_wan_hub_info(payload['resourceGroup'], payload['hub'], headers)
+    if vwan_hub_info is None:
+        return None
 
-                # Create/Update the vWAN Site + Site Links
-                virtual_wan_site_link_update = update_azure_virtual_wan_site_links(virtual_wan['resourceGroup'], netname,
-                                                                                    header_with_bearer_token, site_config)
-                if virtual_wan_site_link_update is None:
-                    logging.error(f"Virtual WAN Site Link for {netname} could not be created/updated, skipping to next network.")
-                    continue
+    vwan_config = get_azure_virtual_wan_gateway_config(payload['resourceGroup'], vwan_hub_info['name'],
+                                                       vwan_hub_info['vpnGatewayName'], headers)
+    if vwan_config is None:
+        return {'hub': payload['hub'], 'failed': True}
+
+    incremental_scope = payload['incrementalScope']
+    peer_info, hub_state_hash, networks = get_hub_scope(payload['hub'], payload['networks'], vwan_config,
+                                                        _get_carried_desired_state([payload]),
+                                                        None if incremental_scope is None else set(incremental_scope))
+    return {
+        'hub': payload['hub'],
+        'hubInfo': {key: vwan_hub_info[key] for key in ('name', 'location', 'vpnGatewayName')},
+        'peerInfo': list(peer_info),
+        'hubStateHash': hub_state_hash,
+        'networks': networks
+    }
 
-                # Create Virtual WAN Connection
-                vwan_connection_result = create_virtual_wan_connection(virtual_wan['resourceGroup'], vwan_hub_info['vpnGatewayName'], netname,
-                                                                    AzureConfig.subscription_id, wans.items(), psk, header_with_bearer_token)
-                if vwan_connection_result is None:
-                    logging.error(f"Virtual WAN Connection for {netname} could not be created, skipping to next network.")
-                    continue
+def discover_orchestration_networks(payload):
+    '''
+    Activity of the Meraki-VWAN-Orchestrator orchestration: discovers the
+    MX setup, site configuration and pre-shared key of a batch of networks
+    of one hub. Azure is not updated.
+
+    @param  payload: Plan fields and {'hubInfo': dict, 'networks': list, 'rateLimitWorkers': int}
+    @rtype:          dict
+    @return:         Results of reconcile_meraki_network(), None for skipped
+                     networks, and the changes to the desired state
+    '''
+    # Discovery batches run at once, possibly on as many workers, and share the Meraki rate budget
+    set_rate_limit_workers(payload['rateLimitWorkers'])
+    run = _get_orchestration_run(payload)
+    desired_state = _get_carried_desired_state(payload['networks'])
+    networks = [{key: value for key, value in network.items() if key != 'desiredState'}
+                for network in payload['networks']]
+    hub_context = {
+        'resource_group': payload['resourceGroup'],
+        'virtual_wan_id': payload['virtualWanId'],
+        'hub_info': payload['hubInfo'],
+        'psk_manager': PskManager(run['peer_list'], desired_state),
+        # Full sweeps read the sites and connections of unchanged networks back from Azure
+        'headers': _get_arm_headers() if payload['fullSweep'] else None,
+        'uplinks': run['uplinks'],
+        'inventory': run['inventory'],
+        'desired_state': desired_state,
+        'full_sweep': payload['fullSweep'],
+        'existing_peers': run['peers'],
+        'tag_index': TagIndex(networks, MerakiConfig.primary_tag_pattern)
+    }
+    try:
+        results = discover_meraki_networks(networks, hub_context, update_azure=False)
+    finally:
+        get_whois_cache().save()
+    for result in results:
+        if result is not None and not result['psk_rotated']:
+            result['psk'] = None
+    return {'results': results, 'desiredState': desired_state.get_changes()}
+
+def _resolve_orchestration_psks(results, psk_manager):
+    for result in results:
+        if result is not None and result['psk'] is None:
+            result['psk'] = psk_manager.get_peer_psk(result['netname'])
+
+def upsert_orchestration_networks(payload):
+    '''
+    Activity of the Meraki-VWAN-Orchestrator orchestration: creates/updates
+    the vWAN sites and connections of discovered networks of one hub.
 
-                # Parse the vwan config file
-                azure_instance_0 = "192.0.2.1"  # placeholder value
-                azure_instance_1 = "192.0.2.2"  # placeholder value
-                azure_connected_subnets = ['1.1.1.1']  # placeholder value
-
-                # Get Azure VPN Gateway Instances
-                for instance in vwan_config['properties']['ipConfigurations']:
-                    if instance['id'] == 'Instance0':
-                        azure_instance_0 = instance['publicIpAddress']
-                    elif instance['id'] == 'Instance1':
-                        azure_instance_1 = instance['publicIpAddress']
-
-                # Get Azure connected subnets
-                if vwan_config['connectedVirtualNetworks']:
-                    azure_connected_subnets = vwan_config['connectedVirtualNetworks']
-
-                # Get specific vwan tag
-                for tag in new_tag_list[:]:
-                    if re.match(MerakiConfig.primary_tag_regex, tag):
-                        specific_tag = tag
-
-                # Build meraki configurations for Azure VWAN VPN Gateway Instance 0 & 1
-                azure_instance_0_config = get_meraki_ipsec_config(netname, azure_instance_0,
-                                                                azure_connected_subnets, psk, specific_tag)
-                azure_instance_1_config = get_meraki_ipsec_config(f"{netname}-sec", azure_instance_1,
-                                                                azure_connected_subnets, psk, f"none")
-
-                primary_peer_exists = False
-                secondary_peer_exists = False
-
-                logging.info("Parsed Meraki VPN output: " + str(merakivpns[0]['peers']))
-                for site in merakivpns[0]['peers']:
-                    if site['name'] == netname:
-                        primary_peer_exists = True
-                    if site['name'] == f"{netname}-sec":
-                        secondary_peer_exists = True
-
-                if primary_peer_exists:
-                    for vpn_peer in merakivpns[0]['peers']:
-                        if vpn_peer['name'] == netname:
-                            vpn_peer['secret'] = psk
-                            vpn_peer['privateSubnets'] = azure_connected_subnets
-                else:
-                    new_meraki_vpns.append(azure_instance_0_config)
+    @param  payload: Plan fields and {'hubInfo': dict, 'results': list}
+    @rtype:          list
+    @return:         True for every network that was updated
+    '''
+    run = _get_orchestration_run(payload)
+    hub_context = {
+        'resource_group': payload['resourceGroup'],
+        'hub_info': payload['hubInfo'],
+        'psk_manager': PskManager(run['peer_list'], DesiredStateStore(state={})),
+        'headers': _get_arm_headers()
+    }
+    _resolve_orchestration_psks(payload['results'], hub_context['psk_manager'])
+    return [result is not None for result in upsert_reconciled_networks(payload['results'], hub_context)]
 
-                if secondary_peer_exists:
-                    for vpn_peer in merakivpns[0]['peers']:
-                        if vpn_peer['name'] == f"{netname}-sec":
-                            vpn_peer['secret'] = psk
-                            vpn_peer['privateSubnets'] = azure_connected_subnets
-                else:
-                    new_meraki_vpns.append(azure_instance_1_config)
+def apply_orchestration_peers(payload):
+    '''
+    Activity of the Meraki-VWAN-Orchestrator orchestration: merges every
+    reconciled network into the third party VPN peer list, runs failover
+    and writes the peer list once.
 
-                found_tagged_networks = True
+    @param  payload: Plan fields and {'hubs': [{'hub', 'peerInfo', 'hubStateHash', 'results'}]}
+    @rtype:          dict
+    @return:         Peers and networks applied, and the changes to the desired state
+    '''
+    MerakiConfig.org_id = payload['orgId']
+    set_rate_limit_workers(1)
+    peers = MerakiConfig.sdk_auth.appliance.getOrganizationApplianceVpnThirdPartyVPNPeers(MerakiConfig.org_id)['peers']
+    peer_table = PeerTable(peers)
+    desired_state = DesiredStateStore(state={})
+
+    if not payload['applyUpdates']:
+        run_vpn_failover(peer_table)
+        update_meraki_vpn_peers(peer_table)
+        return {'peers': len(peer_table), 'applied': 0, 'desiredState': desired_state.get_changes()}
+
+    plan = {
+        'desired_state': desired_state,
+        'remove_network_id_list': payload['removeNetworkIds'],
+        'incremental_scope': payload['incrementalScope'],
+        'full_sweep': payload['fullSweep']
+    }
+    psk_manager = PskManager(peers, desired_state)
+    apply_now_networks = []
+    applied_results = []
+    hub_state_hashes = {}
+    for hub in payload['hubs']:
+        _resolve_orchestration_psks(hub['results'], psk_manager)
+        hub_apply_now_networks, hub_applied_results, found_tagged_networks = \
+            merge_reconciled_networks(peer_table, hub['peerInfo'], hub['results'])
+        apply_now_networks.extend(hub_apply_now_networks)
+        applied_results.extend(hub_applied_results)
+        if found_tagged_networks:
+            hub_state_hashes[hub['hub']] = hub['hubStateHash']
+
+    finish_reconcile(peer_table, None, plan, psk_manager, applied_results, apply_now_networks, hub_state_hashes)
+    return {'peers': len(peer_table), 'applied': len(applied_results), 'desiredState': desired_state.get_changes()}
 
-            if not found_tagged_networks:
-                logging.info(f"No tagged networks found for hub {hub}.")
-                return
-
-            logging.info("updated Meraki VPN Config: " + str(new_meraki_vpns))
-                                  
-            # Update Meraki VPN config
-            update_meraki_vpn = MerakiConfig.sdk_auth.appliance.updateOrganizationApplianceVpnThirdPartyVPNPeers(
-                MerakiConfig.org_id, new_meraki_vpns
-                )
-
-            logging.info("VPN Peers updated!")
-
-            # Cleanup any found vwan-apply-now tags
-            if len(remove_network_id_list) > 0:
-                logging.info("remove_network_id_list value: " + str(remove_network_id_list))
-                # no longer needed for v1 version of API since network['tags'] is a proper list
-                #clean_meraki_vwan_tags(MerakiConfig.sdk_auth, _VWAN_APPLY_NOW_TAG, meraki_networks)
-                #new_tag_list = network['tags']
-                logging.info("pre-parsed network tag variable: " + str(new_tag_list))
-                                  
-                if _VWAN_APPLY_NOW_TAG in new_tag_list:
-                     new_tag_list.remove(_VWAN_APPLY_NOW_TAG)
-                     logging.info("parsed network tag variable: " + str(new_tag_list))
-                     MerakiConfig.sdk_auth.networks.updateNetwork(network_info, tags=new_tag_list)
-            meraki_vpn_failover()
-    else:
-        logging.info("Maintenance mode detected but it is not during scheduled hours "
-                     f"or the {_VWAN_APPLY_NOW_TAG} tag has not been detected. Skipping updates")
-        meraki_vpn_failover()
+
+def main(MerakiTimer: func.TimerRequest) -> None:
+    if MerakiConfig.use_durable_orchestration:
+        logging.info("Reconciliation runs in the Meraki-VWAN-Orchestrator durable orchestration, skipping timer run.")
+        return
+
+    reset_connection_stats()
+    AzureConfig.arm_client.reset_connection_stats()
+    reset_gateway_update_budget()
+    get_api_metrics().reset()
+    get_tracer().reset()
+    cassette = get_cassette()
+    if cassette:
+        cassette.reset()
+    try:
+        with profile_run(), trace_span('main'):
+            reconcile(MerakiTimer)
+    finally:
+        logging.info(f"Meraki connection statistics: {get_connection_stats()}")
+        logging.info(f"Meraki rate limiter statistics: {get_rate_limit_stats()}")
+        logging.info(f"ARM connection statistics: {AzureConfig.arm_client.connection_stats()}")
+        for line in get_api_metrics().summary():
+            logging.info(f"API call metrics: {line}")
+        get_api_metrics().save()
+        get_tracer().save()
+        get_whois_cache().save()
+        logging.info(f"WHOIS cache statistics: {get_whois_cache().stats()}")
+        if cassette:
+            cassette.save()
+            logging.info(f"Cassette statistics: {cassette.stats()}")
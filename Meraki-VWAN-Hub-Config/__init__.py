@@ -0,0 +1,7 @@
+import importlib
+
+# The activity runs in the Meraki-VWAN-Automation module, whose name is not an identifier
+automation = importlib.import_module('__app__.Meraki-VWAN-Automation')
+
+def main(payload):
+    return automation.get_orchestration_hub_config(payload)
@@ -0,0 +1,113 @@
+import azure.durable_functions as df
+
+PLAN_ACTIVITY = 'Meraki-VWAN-Plan'
+HUB_CONFIG_ACTIVITY = 'Meraki-VWAN-Hub-Config'
+DISCOVER_ACTIVITY = 'Meraki-VWAN-Discover-Networks'
+UPSERT_ACTIVITY = 'Meraki-VWAN-Upsert-Networks'
+APPLY_PEERS_ACTIVITY = 'Meraki-VWAN-Apply-Peers'
+
+# Fields of the plan every activity after the plan gets
+PLAN_FIELDS = ('runId', 'orgId', 'resourceGroup', 'virtualWanId', 'incrementalScope', 'fullSweep')
+# Fields of a network result the peer list write needs; psk is only set for new keys
+PEER_RESULT_FIELDS = ('network', 'netname', 'specific_tag', 'desired_state_hash', 'psk', 'psk_rotated', 'unchanged')
+
+def _chunks(items: list, size: int):
+    return [items[index:index + size] for index in range(0, len(items), max(size, 1))]
+
+def _merge_desired_state(desired_state: dict, changes: dict):
+    desired_state['networks'].update(changes.get('networks', {}))
+    desired_state['meta'].update(changes.get('meta', {}))
+
+def orchestrator_function(context: df.DurableOrchestrationContext):
+    '''
+    Reconciles the tagged Meraki networks with Virtual WAN in activities
+    that scale out across workers: hub info and effective routes fan out
+    per hub, appliance discovery and the Azure site/connection upserts per
+    batch of networks, and everything fans in to a single peer list write.
+    The orchestration replays, so it only schedules activities and never
+    calls an API itself.
+
+    Workers share no files, so the desired state (hashes of the applied
+    configuration and run-level values) is carried from run to run: it
+    comes in with the input, every activity gets its slice of it and
+    hands back its changes, and the merged state is returned with the
+    output for the starter to pass to the next run.
+    '''
+    orchestration_input = context.get_input() or {}
+    carried_state = orchestration_input.get('desiredState') or {}
+    desired_state = {'networks': dict(carried_state.get('networks', {})),
+                     'meta': dict(carried_state.get('meta', {}))}
+
+    plan = yield context.call_activity(PLAN_ACTIVITY, orchestration_input)
+    if plan is None:
+        return {'desiredState': desired_state}
+
+    apply_input = {
+        'orgId': plan['orgId'],
+        'applyUpdates': plan['applyUpdates'],
+        'removeNetworkIds': plan['removeNetworkIds'],
+        'incrementalScope': plan['incrementalScope'],
+        'fullSweep': plan['fullSweep'],
+        'hubs': []
+    }
+    shared = {field: plan.get(field) for field in PLAN_FIELDS}
+
+    hubs = []
+    if plan['applyUpdates'] and plan['hubs']:
+        hub_configs = yield context.task_all([
+            context.call_activity(HUB_CONFIG_ACTIVITY, dict(shared, hub=hub['hub'], desiredState=hub['desiredState'],
+                                                            networks=hub['networks']))
+            for hub in plan['hubs']])
+
+        for hub_config in hub_configs:
+            # Hubs without hub info or gateway configuration are skipped, as in the timer function
+            if hub_config is None or hub_config.get('failed'):
+                continue
+            if hub_config['networks']:
+                hubs.append(hub_config)
+
+    # Appliance discovery of every hub fans out in batches of networks
+    discover_batches = [(hub, networks) for hub in hubs for networks in _chunks(hub['networks'], plan['networkBatchSize'])]
+    if discover_batches:
+        discovered = yield context.task_all([
+            context.call_activity(DISCOVER_ACTIVITY, dict(shared, hubInfo=hub['hubInfo'], networks=networks,
+                                                          rateLimitWorkers=len(discover_batches)))
+            for hub, networks in discover_batches])
+        for hub in hubs:
+            hub['results'] = []
+        for (hub, _), batch in zip(discover_batches, discovered):
+            hub['results'].extend(batch['results'])
+            _merge_desired_state(desired_state, batch['desiredState'])
+
+    # Networks whose Azure configuration changed are upserted per batch, or per hub when the
+    # gateway connections are updated in bulk, as two bulk updates of one gateway would conflict
+    upsert_batches = []
+    for hub in hubs:
+        pending = [result for result in hub['results'] if result is not None and not result['unchanged']]
+        for results in ([pending] if plan['gatewayBulkConnections'] else _chunks(pending, plan['networkBatchSize'])):
+            if results:
+                upsert_batches.append((hub, results))
+    if upsert_batches:
+        upserted = yield context.task_all([
+            context.call_activity(UPSERT_ACTIVITY, dict(shared, hubInfo=hub['hubInfo'], results=results))
+            for hub, results in upsert_batches])
+        for (hub, results), statuses in zip(upsert_batches, upserted):
+            failed = set(result['netname'] for result, status in zip(results, statuses) if not status)
+            hub['results'] = [None if result is not None and result['netname'] in failed else result
+                              for result in hub['results']]
+
+    for hub in hubs:
+        apply_input['hubs'].append({
+            'hub': hub['hub'],
+            'peerInfo': hub['peerInfo'],
+            'hubStateHash': hub['hubStateHash'],
+            'results': [{field: result[field] for field in PEER_RESULT_FIELDS}
+                        for result in hub['results'] if result is not None]
+        })
+
+    # Fan in to a single write of the org peer list
+    result = yield context.call_activity(APPLY_PEERS_ACTIVITY, apply_input)
+    _merge_desired_state(desired_state, result.pop('desiredState'))
+    return dict(result, desiredState=desired_state)
+
+main = df.Orchestrator.create(orchestrator_function)
@@ -0,0 +1,59 @@
+import json
+import logging
+import os
+
+import azure.durable_functions as df
+import azure.functions as func
+from azure.durable_functions.models import OrchestrationRuntimeStatus
+
+ORCHESTRATOR = 'Meraki-VWAN-Orchestrator'
+# One instance ID, so a run still in progress is not started twice
+INSTANCE_ID = 'meraki-vwan-reconcile'
+USE_DURABLE_ORCHESTRATION = os.environ.get('use_durable_orchestration', 'No') == 'Yes'
+
+def _load_json(value):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    return value
+
+def get_orchestration_input(status, past_due: bool):
+    '''
+    Returns the input of the next orchestration run. The desired state is
+    handed on from the last run, whose input and output the task hub
+    keeps for every worker: the state it returned if it completed, else
+    the state it started from.
+
+    @param  status:   DurableOrchestrationStatus of the last run, with its input
+    @param  past_due: True if the timer was past due
+    @rtype:           dict
+    @return:          Orchestration input
+    '''
+    desired_state = None
+    if status:
+        if status.runtime_status == OrchestrationRuntimeStatus.Completed:
+            desired_state = (_load_json(status.output) or {}).get('desiredState')
+        if desired_state is None:
+            desired_state = (_load_json(status.input_) or {}).get('desiredState')
+    return {'pastDue': past_due, 'desiredState': desired_state}
+
+async def main(MerakiTimer: func.TimerRequest, starter: str) -> None:
+    if not USE_DURABLE_ORCHESTRATION:
+        return
+
+    client = df.DurableOrchestrationClient(starter)
+    status = await client.get_status(INSTANCE_ID, show_input=True)
+    if status and status.runtime_status in (OrchestrationRuntimeStatus.Running, OrchestrationRuntimeStatus.Pending):
+        logging.info(f"Orchestration {INSTANCE_ID} is still {status.runtime_status.name}, skipping this run.")
+        return
+
+    orchestration_input = get_orchestration_input(status, MerakiTimer.past_due)
+    if status:
+        # The history of the last run holds the pre-shared keys it rotated; it is purged once the
+        # state it handed on has been read
+        await client.purge_instance_history(INSTANCE_ID)
+
+    instance_id = await client.start_new(ORCHESTRATOR, INSTANCE_ID, orchestration_input)
+    logging.info(f"Started orchestration {instance_id}.")
@@ -0,0 +1,178 @@
+'''
+Local Durable Functions harness. It drives an orchestrator function the
+way the Durable Functions extension does, without the Functions host or
+Azure Storage:
+- The orchestrator is replayed from its history after every batch of
+  activities completes.
+- The activities it schedules run in a thread pool.
+- Every input and output crosses a JSON boundary.
+
+Non-deterministic orchestrator code or payloads that would not
+serialize fail here as they would in Azure.
+
+    python benchmarks/durable_harness.py --sizes 1000 --runs 2
+
+runs the Meraki-VWAN-Orchestrator orchestration against the load test's
+fake Meraki and ARM servers; see load_test.py for the options.
+'''
+import collections
+import datetime
+import importlib
+import json
+import sys
+import time
+import traceback
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.durable_functions.models import OrchestrationRuntimeStatus
+
+# HistoryEventType values of the Durable Functions extension
+EXECUTION_STARTED = 0
+TASK_SCHEDULED = 4
+TASK_COMPLETED = 5
+TASK_FAILED = 6
+ORCHESTRATOR_STARTED = 12
+CALL_ACTIVITY = 0
+
+ORCHESTRATOR = 'Meraki-VWAN-Orchestrator'
+STARTER = 'Meraki-VWAN-Starter'
+ACTIVITIES = ('Meraki-VWAN-Plan', 'Meraki-VWAN-Hub-Config', 'Meraki-VWAN-Discover-Networks',
+              'Meraki-VWAN-Upsert-Networks', 'Meraki-VWAN-Apply-Peers')
+
+class DurableHarness():
+    '''
+    DurableHarness runs an orchestration to completion in process.
+    '''
+
+    def __init__(self, orchestrator, activities: dict, max_workers: int=8):
+        '''
+        Construct a new 'DurableHarness' object.
+
+        @param orchestrator: Handler returned by df.Orchestrator.create()
+        @param activities:   Activity function name to its main function
+        @param max_workers:  Activities run at once, the workers of a scaled out app
+        @return:             None
+        '''
+        self.orchestrator = orchestrator
+        self.activities = activities
+        self.max_workers = max_workers
+        self.replays = 0
+        self.calls = collections.Counter()
+        self.activity_time = collections.Counter()
+        # Status of the last run, as the starter gets it from the task hub
+        self.last_status = None
+
+    def _event(self, event_type: int, event_id: int=-1, **fields):
+        timestamp = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()
+        return dict(EventType=event_type, EventId=event_id, IsPlayed=False, Timestamp=timestamp, **fields)
+
+    def _run_activity(self, action: dict):
+        name = action['functionName']
+        start = time.perf_counter()
+        try:
+            output = self.activities[name](json.loads(action['input']))
+            return True, json.dumps(output)
+        except Exception as e:
+            return False, (str(e), traceback.format_exc())
+        finally:
+            self.activity_time[name] += time.perf_counter() - start
+
+    def run(self, orchestration_input=None, instance_id: str='local'):
+        '''
+        Runs the orchestration and returns its output. An exception the
+        orchestrator does not handle is raised.
+
+        @param  orchestration_input: JSON serializable input of the orchestration
+        @param  instance_id:         Instance ID the orchestrator sees
+        @rtype:                      any
+        @return:                     Output of the orchestration
+        '''
+        self.last_status = types.SimpleNamespace(runtime_status=OrchestrationRuntimeStatus.Running,
+                                                 input_=orchestration_input, output=None)
+        output = self._run(orchestration_input, instance_id)
+        self.last_status.runtime_status = OrchestrationRuntimeStatus.Completed
+        self.last_status.output = output
+        return output
+
+    def _run(self, orchestration_input, instance_id: str):
+        history = [self._event(ORCHESTRATOR_STARTED),
+                   self._event(EXECUTION_STARTED, Input=json.dumps(orchestration_input))]
+        scheduled = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                context = {
+                    'history': history,
+                    'instanceId': instance_id,
+                    'isReplaying': scheduled > 0,
+                    'parentInstanceId': None,
+                    'input': json.dumps(orchestration_input)
+                }
+                self.replays += 1
+                state = json.loads(self.orchestrator(json.dumps(context)))
+                if state.get('isDone'):
+                    return state.get('output')
+
+                # Actions of every yield so far, in order; the new ones follow those already scheduled
+                actions = [action for group in state['actions'] for action in group][scheduled:]
+                if not actions:
+                    raise RuntimeError(f"Orchestration {instance_id} waits without scheduling any activity")
+                for action in actions:
+                    if action['actionType'] != CALL_ACTIVITY:
+                        raise NotImplementedError(f"Action type {action['actionType']} is not supported")
+
+                for event in history:
+                    event['IsPlayed'] = True
+                event_ids = list(range(scheduled, scheduled + len(actions)))
+                for event_id, action in zip(event_ids, actions):
+                    history.append(self._event(TASK_SCHEDULED, event_id, Name=action['functionName']))
+                    self.calls[action['functionName']] += 1
+                scheduled += len(actions)
+
+                for event_id, (succeeded, output) in zip(event_ids, executor.map(self._run_activity, actions)):
+                    if succeeded:
+                        history.append(self._event(TASK_COMPLETED, TaskScheduledId=event_id, Result=output))
+                    else:
+                        history.append(self._event(TASK_FAILED, TaskScheduledId=event_id, Reason=output[0],
+                                                   Details=output[1]))
+                history.append(self._event(ORCHESTRATOR_STARTED))
+
+    def stats(self):
+        '''
+        Returns how often the orchestrator replayed and what each activity
+        cost.
+
+        @rtype:  dict
+        @return: Replays, activity calls and seconds per activity
+        '''
+        return {'replays': self.replays, 'calls': dict(self.calls),
+                'activityTime': {name: round(seconds, 3) for name, seconds in self.activity_time.items()}}
+
+
+def get_harness(max_workers: int=8):
+    '''
+    Imports the orchestrator and activity functions of the app, with the
+    repository as the __app__ package, and returns a harness running them
+    and a function starting a run the way the timer starter does.
+    Settings are read when modules are imported, so they are applied first.
+
+    @param  max_workers: Activities run at once
+    @rtype:              tuple
+    @return:             Harness of Meraki-VWAN-Orchestrator and the start function
+    '''
+    orchestrator = importlib.import_module(f"__app__.{ORCHESTRATOR}")
+    starter = importlib.import_module(f"__app__.{STARTER}")
+    activities = {name: importlib.import_module(f"__app__.{name}").main for name in ACTIVITIES}
+    harness = DurableHarness(orchestrator.main, activities, max_workers)
+
+    def start(past_due: bool=False):
+        return harness.run(starter.get_orchestration_input(harness.last_status, past_due))
+
+    return harness, start
+
+if __name__ == '__main__':
+    if __package__:
+        from .load_test import main
+    else:
+        from load_test import main
+    main(sys.argv[1:] + ['--durable'])
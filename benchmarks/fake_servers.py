@@ -0,0 +1,544 @@
+import collections
+import copy
+import http.server
+import json
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+# Requests of the failover path carry one networkIds[] parameter per tracked network
+MAX_REQUEST_LINE = 1 << 22
+
+class SyntheticOrg():
+    '''
+    SyntheticOrg is the state shared by the fake Meraki Dashboard and ARM
+    servers: a Meraki organization of size MX networks tagged for hubs
+    Virtual WAN hubs, and the Azure resources the function creates.
+    '''
+
+    def __init__(self, size: int, hubs: int=2, org_id: str='100000', org_name: str='Benchmark Org',
+                 subscription_id: str='00000000-0000-0000-0000-000000000000', resource_group: str='benchmark-rg',
+                 vwan_name: str='benchmark-vwan', firmware: str='wired-16-13'):
+        '''
+        Construct a new 'SyntheticOrg' object.
+
+        @param size:            Number of Meraki networks
+        @param hubs:            Number of Virtual WAN hubs the networks are spread over
+        @param org_id:          Organization ID of Meraki Dashboard
+        @param org_name:        Organization name
+        @param subscription_id: Azure subscription ID
+        @param resource_group:  Resource group of the Virtual WAN
+        @param vwan_name:       Virtual WAN name
+        @param firmware:        Firmware of every MX
+        @return:                None
+        '''
+        self.org_id = org_id
+        self.org_name = org_name
+        self.subscription_id = subscription_id
+        self.resource_group = resource_group
+        self.vwan_name = vwan_name
+        self.hubs = [f"hub{hub}" for hub in range(1, hubs + 1)]
+        self.lock = threading.Lock()
+
+        self.networks = []
+        self.devices = []
+        self.uplink_statuses = []
+        for index in range(size):
+            network_id = f"L_{index:08d}"
+            serial = f"Q2XX-{index // 10000:04d}-{index % 10000:04d}"
+            public_ip = f"100.{64 + index // 65536}.{index // 256 % 256}.{index % 256}"
+            hub = self.hubs[index % len(self.hubs)]
+            self.networks.append({'id': network_id, 'organizationId': org_id, 'name': f"site {index}",
+                                  'productTypes': ['appliance'], 'tags': [f"vwan-{hub}-1"]})
+            # Like getOrganizationDevices, inventory records carry no WAN addresses; the uplink statuses do
+            self.devices.append({'serial': serial, 'networkId': network_id, 'model': 'MX68',
+                                 'firmware': firmware, 'name': f"mx-{index}"})
+            self.uplink_statuses.append({'networkId': network_id, 'serial': serial, 'model': 'MX68',
+                                         'uplinks': [{'interface': 'wan1', 'status': 'active',
+                                                      'ip': f"10.{index // 256 % 256}.{index % 256}.2",
+                                                      'publicIp': public_ip}]})
+        self.networks_by_id = {network['id']: network for network in self.networks}
+        self.devices_by_serial = {device['serial']: device for device in self.devices}
+        self.uplink_statuses_by_serial = {status['serial']: status for status in self.uplink_statuses}
+        self.devices_by_network = {device['networkId']: device for device in self.devices}
+
+        # A recent change not tied to one network makes every run reconcile the whole org
+        self.configuration_changes = [{'ts': '2020-01-01T00:00:00.000000Z', 'adminName': 'Benchmark', 'page': 'Tags',
+                                       'label': 'Network tags', 'networkId': None, 'oldValue': '[]', 'newValue': '[]'}]
+        self.peers = []
+        self.vpn_sites = {}
+        self.vpn_gateways = {hub: {'name': f"{hub}-gw", 'location': 'westeurope', 'properties': {
+            'ipConfigurations': [{'id': 'Instance0', 'publicIpAddress': f"20.0.{number}.1"},
+                                 {'id': 'Instance1', 'publicIpAddress': f"20.0.{number}.2"}],
+            'connections': []}, 'etag': f"W/\"{uuid.uuid4()}\""} for number, hub in enumerate(self.hubs)}
+
+
+class FakeApiServer():
+    '''
+    FakeApiServer serves JSON routes from a local threaded HTTP server with
+    a configurable latency per request, a page size for paginated
+    endpoints and a token bucket rate limit answered with 429 and
+    Retry-After. Requests are counted per endpoint template.
+    '''
+
+    def __init__(self, org: SyntheticOrg, latency: float=0.0, page_size: int=1000, rate_limit: float=0):
+        '''
+        Construct a new 'FakeApiServer' object.
+
+        @param org:        SyntheticOrg served
+        @param latency:    Seconds added to every request
+        @param page_size:  Largest page of paginated endpoints
+        @param rate_limit: Requests per second before 429 is returned, 0 for no limit
+        @return:           None
+        '''
+        self.org = org
+        self.latency = latency
+        self.page_size = page_size
+        self.rate_limit = rate_limit
+        self.calls = collections.Counter()
+        self.throttled = collections.Counter()
+        self.base_url = None
+        self._tokens = rate_limit
+        self._tokens_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._httpd = None
+        # Headers of the request each server thread is handling
+        self._request = threading.local()
+        self._routes = [(method, re.compile(f"^{pattern}$"), template, handler)
+                        for method, pattern, template, handler in self.get_routes()]
+
+    def get_routes(self):
+        '''
+        Returns the routes of the server.
+
+        @rtype:  list
+        @return: (method, path regex, endpoint template, handler) tuples
+        '''
+        return []
+
+    def start(self):
+        '''
+        Starts serving on a free local port.
+
+        @rtype:  str
+        @return: Base URL of the server
+        '''
+        server = self
+
+        class Handler(_JsonRequestHandler):
+            def dispatch(self):
+                server._dispatch(self)
+
+        self._httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        return self.base_url
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+            self.throttled.clear()
+
+    def _take_token(self):
+        if not self.rate_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._tokens_at) * self.rate_limit)
+            self._tokens_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _route(self, method: str, path: str):
+        for route_method, pattern, template, handler in self._routes:
+            if route_method == method:
+                match = pattern.match(path)
+                if match:
+                    return template, handler, match.groups()
+        return f"{method} unknown", None, ()
+
+    def _dispatch(self, request):
+        parsed = urllib.parse.urlsplit(request.path)
+        query = urllib.parse.parse_qs(parsed.query)
+        template, handler, args = self._route(request.command, parsed.path)
+        if self.latency:
+            time.sleep(self.latency)
+
+        if not self._take_token():
+            with self._lock:
+                self.throttled[template] += 1
+            request.send_json(429, {'errors': ['Too Many Requests']}, {'Retry-After': '1'})
+            return
+        with self._lock:
+            self.calls[template] += 1
+
+        if handler is None:
+            request.send_json(404, {'errors': [f"No fake route for {request.command} {parsed.path}"]})
+            return
+        body = request.read_json()
+        self._request.headers = request.headers
+        response = handler(query, body, *args)
+        request.send_json(*response)
+
+    def _request_headers(self):
+        return getattr(self._request, 'headers', None) or {}
+
+    def paginate(self, path: str, query: dict, items: list, max_per_page: int=1000):
+        '''
+        Returns one page of items with a Meraki style Link header pointing
+        at the next page.
+
+        @param  path:         Path of the request, relative to the base URL
+        @param  query:        Parsed query string of the request
+        @param  items:        Every item of the endpoint
+        @param  max_per_page: Largest perPage the endpoint accepts
+        @rtype:               tuple
+        @return:              (status, page, headers)
+        '''
+        per_page = min(int(query.get('perPage', [max_per_page])[0]), max_per_page, self.page_size)
+        start = int(query.get('startingAfter', [0])[0])
+        page = items[start:start + per_page]
+        headers = {}
+        if start + per_page < len(items):
+            next_query = dict((key, value) for key, value in query.items() if key not in ('perPage', 'startingAfter'))
+            next_query.update({'perPage': [str(per_page)], 'startingAfter': [str(start + per_page)]})
+            headers['Link'] = f"<{path}?{urllib.parse.urlencode(next_query, doseq=True)}>; rel=next"
+        return 200, page, headers
+
+
+class FakeMerakiServer(FakeApiServer):
+    '''
+    FakeMerakiServer emulates the Meraki Dashboard API v1 endpoints used by
+    the function. Its base URL ends in /api/v1, like the real one.
+    '''
+
+    def start(self):
+        return super().start() + '/api/v1'
+
+    def get_routes(self):
+        org = r'/api/v1/organizations/([^/]+)'
+        network = r'/api/v1/networks/([^/]+)'
+        return [
+            ('GET', r'/api/v1/organizations', 'getOrganizations', self.get_organizations),
+            ('GET', f"{org}/networks", 'getOrganizationNetworks', self.get_organization_networks),
+            ('GET', f"{org}/devices", 'getOrganizationDevices', self.get_organization_devices),
+            ('GET', f"{org}/appliance/uplink/statuses", 'getOrganizationApplianceUplinkStatuses',
+             self.get_organization_appliance_uplink_statuses),
+            ('GET', f"{org}/configurationChanges", 'getOrganizationConfigurationChanges',
+             self.get_organization_configuration_changes),
+            ('GET', f"{org}/appliance/vpn/thirdPartyVPNPeers", 'getOrganizationApplianceVpnThirdPartyVPNPeers',
+             self.get_third_party_vpn_peers),
+            ('PUT', f"{org}/appliance/vpn/thirdPartyVPNPeers", 'updateOrganizationApplianceVpnThirdPartyVPNPeers',
+             self.update_third_party_vpn_peers),
+            ('GET', f"{org}/appliance/vpn/statuses", 'getOrganizationApplianceVpnStatuses',
+             self.get_organization_appliance_vpn_statuses),
+            ('GET', f"{network}/appliance/warmSpare", 'getNetworkApplianceWarmSpare', self.get_warm_spare),
+            ('GET', f"{network}/appliance/vpn/siteToSiteVpn", 'getNetworkApplianceVpnSiteToSiteVpn',
+             self.get_site_to_site_vpn),
+            ('GET', f"{network}/appliance/trafficShaping/uplinkBandwidth",
+             'getNetworkApplianceTrafficShapingUplinkBandwidth', self.get_uplink_bandwidth),
+            ('GET', f"{network}/devices", 'getNetworkDevices', self.get_network_devices),
+            ('GET', f"{network}/events", 'getNetworkEvents', self.get_network_events),
+            ('PUT', network, 'updateNetwork', self.update_network),
+            ('GET', r'/api/v1/devices/([^/]+)', 'getDevice', self.get_device),
+        ]
+
+    def get_organizations(self, query, body):
+        return 200, [{'id': self.org.org_id, 'name': self.org.org_name}]
+
+    def get_organization_networks(self, query, body, org_id):
+        return self.paginate(f"/organizations/{org_id}/networks", query, self.org.networks, 100000)
+
+    def get_organization_devices(self, query, body, org_id):
+        return self.paginate(f"/organizations/{org_id}/devices", query, self.org.devices, 1000)
+
+    def get_organization_appliance_uplink_statuses(self, query, body, org_id):
+        return self.paginate(f"/organizations/{org_id}/appliance/uplink/statuses", query,
+                             self.org.uplink_statuses, 1000)
+
+    def get_organization_configuration_changes(self, query, body, org_id):
+        return self.paginate(f"/organizations/{org_id}/configurationChanges", query, self.org.configuration_changes, 5000)
+
+    def get_third_party_vpn_peers(self, query, body, org_id):
+        with self.org.lock:
+            return 200, {'peers': self.org.peers}
+
+    def update_third_party_vpn_peers(self, query, body, org_id):
+        with self.org.lock:
+            self.org.peers = body['peers']
+            return 200, {'peers': self.org.peers}
+
+    def get_organization_appliance_vpn_statuses(self, query, body, org_id):
+        network_ids = query.get('networkIds[]', query.get('networkIds', []))
+        peers_by_network = {}
+        with self.org.lock:
+            for peer in self.org.peers:
+                for tag in peer['networkTags']:
+                    peers_by_network.setdefault(tag, peer['name'])
+        statuses = []
+        for network_id in network_ids:
+            network = self.org.networks_by_id.get(network_id)
+            if network is None:
+                continue
+            peer_name = next((peers_by_network[tag] for tag in network['tags'] if tag in peers_by_network), None)
+            statuses.append({'networkId': network_id, 'networkName': network['name'],
+                             'thirdPartyVpnPeers': [{'name': peer_name, 'reachability': 'reachable'}]})
+        return self.paginate(f"/organizations/{org_id}/appliance/vpn/statuses", query, statuses, 300)
+
+    def get_warm_spare(self, query, body, network_id):
+        device = self.org.devices_by_network.get(network_id)
+        if device is None:
+            return 200, {'enabled': False}
+        return 200, {'enabled': False, 'primarySerial': device['serial']}
+
+    def get_site_to_site_vpn(self, query, body, network_id):
+        index = int(network_id.split('_')[1])
+        return 200, {'mode': 'spoke', 'subnets': [{'localSubnet': f"10.{index // 256 % 256}.{index % 256}.0/24",
+                                                   'useVpn': True}]}
+
+    def get_uplink_bandwidth(self, query, body, network_id):
+        return 200, {'bandwidthLimits': {'wan1': {'limitUp': 100000, 'limitDown': 100000},
+                                         'wan2': {'limitUp': None, 'limitDown': None}}}
+
+    def get_network_devices(self, query, body, network_id):
+        device = self.org.devices_by_network.get(network_id)
+        return 200, [device] if device else []
+
+    def get_network_events(self, query, body, network_id):
+        return 200, {'pageStartAt': '2020-01-01T00:00:00.000000Z', 'pageEndAt': '2020-01-01T00:00:00.000000Z',
+                     'events': []}
+
+    def update_network(self, query, body, network_id):
+        network = self.org.networks_by_id.get(network_id)
+        if network is None:
+            return 404, {'errors': ['Network not found']}
+        if 'tags' in body:
+            network['tags'] = body['tags'] if isinstance(body['tags'], list) else body['tags'].split()
+        return 200, network
+
+    def get_device(self, query, body, serial):
+        device = self.org.devices_by_serial.get(serial)
+        if device is None:
+            return 404, {'errors': ['Device not found']}
+        uplinks = self.org.uplink_statuses_by_serial[serial]['uplinks']
+        return 200, dict(device, **{f"{uplink['interface']}Ip": uplink['ip'] for uplink in uplinks})
+
+
+class FakeArmServer(FakeApiServer):
+    '''
+    FakeArmServer emulates the ARM Virtual WAN endpoints used by the
+    function, the ARM $batch endpoint and the App Service managed
+    identity endpoint. Long-running operations complete on their first
+    poll. Like ARM, VPN gateways are returned without the shared keys of
+    their connections, and gateway updates honor If-Match.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._operations = {}
+
+    def get_routes(self):
+        network = r'/subscriptions/[^/]+/resourceGroups/[^/]+/providers/Microsoft.Network'
+        return [
+            ('GET', r'/msi/token', 'GET identity token', self.get_token),
+            ('GET', r'/subscriptions/[^/]+/providers/Microsoft.Network/virtualWans', 'GET virtualWans',
+             self.get_virtual_wans),
+            ('GET', f"{network}/virtualHubs/([^/]+)", 'GET virtualHubs', self.get_virtual_hub),
+            ('POST', f"{network}/virtualHubs/([^/]+)/effectiveRoutes", 'POST effectiveRoutes',
+             self.post_effective_routes),
+            ('GET', r'/operations/([^/]+)', 'GET operation', self.get_operation),
+            ('GET', f"{network}/vpnGateways/([^/]+)", 'GET vpnGateways', self.get_vpn_gateway),
+            ('PUT', f"{network}/vpnGateways/([^/]+)", 'PUT vpnGateways', self.put_vpn_gateway),
+            ('GET', f"{network}/vpnGateways/([^/]+)/vpnConnections/([^/]+)", 'GET vpnConnections',
+             self.get_vpn_connection),
+            ('PUT', f"{network}/vpnGateways/([^/]+)/vpnConnections/([^/]+)", 'PUT vpnConnections',
+             self.put_vpn_connection),
+            ('GET', f"{network}/vpnSites/([^/]+)", 'GET vpnSites', self.get_vpn_site),
+            ('PUT', f"{network}/vpnSites/([^/]+)", 'PUT vpnSites', self.put_vpn_site),
+            ('POST', r'/batch', 'POST batch', self.post_batch),
+        ]
+
+    def _start_operation(self, result: dict):
+        operation_id = uuid.uuid4().hex
+        with self._lock:
+            self._operations[operation_id] = result
+        return {'Azure-AsyncOperation': f"{self.base_url}/operations/{operation_id}", 'Retry-After': '0'}
+
+    def _get_hub_by_gateway(self, gateway_name: str):
+        for hub, gateway in self.org.vpn_gateways.items():
+            if gateway['name'] == gateway_name:
+                return hub
+        return None
+
+    def get_token(self, query, body):
+        return 200, {'access_token': 'benchmark-token', 'expires_on': str(int(time.time()) + 3600),
+                     'resource': query.get('resource', [''])[0], 'token_type': 'Bearer'}
+
+    def get_virtual_wans(self, query, body):
+        org = self.org
+        vwan_id = f"/subscriptions/{org.subscription_id}/resourceGroups/{org.resource_group}" \
+                  f"/providers/Microsoft.Network/virtualWans/{org.vwan_name}"
+        return 200, {'value': [{'name': org.vwan_name, 'id': vwan_id, 'location': 'westeurope', 'properties': {
+            'virtualHubs': [{'id': f"/subscriptions/{org.subscription_id}/resourceGroups/{org.resource_group}"
+                                   f"/providers/Microsoft.Network/virtualHubs/{hub}"} for hub in org.hubs]}}]}
+
+    def get_virtual_hub(self, query, body, hub):
+        if hub not in self.org.vpn_gateways:
+            return 404, {'error': {'code': 'ResourceNotFound'}}
+        gateway_name = self.org.vpn_gateways[hub]['name']
+        return 200, {'name': hub, 'location': 'westeurope', 'properties': {
+            'vpnGateway': {'id': f"/subscriptions/{self.org.subscription_id}/resourceGroups/{self.org.resource_group}"
+                                 f"/providers/Microsoft.Network/vpnGateways/{gateway_name}"}}}
+
+    def post_effective_routes(self, query, body, hub):
+        routes = {'status': 'Succeeded', 'properties': {'output': {'value': [
+            {'addressPrefixes': ['172.16.0.0/16'], 'nextHopType': 'Virtual Network Connection'}]}}}
+        return 202, {}, self._start_operation(routes)
+
+    def get_operation(self, query, body, operation_id):
+        with self._lock:
+            result = self._operations.get(operation_id)
+        if result is None:
+            return 404, {'error': {'code': 'OperationNotFound'}}
+        return 200, result
+
+    def get_vpn_gateway(self, query, body, gateway_name):
+        hub = self._get_hub_by_gateway(gateway_name)
+        if hub is None:
+            return 404, {'error': {'code': 'ResourceNotFound'}}
+        with self.org.lock:
+            gateway = copy.deepcopy(self.org.vpn_gateways[hub])
+        for connection in gateway['properties']['connections']:
+            for link_connection in connection['properties'].get('vpnLinkConnections', []):
+                link_connection.get('properties', {}).pop('sharedKey', None)
+        return 200, gateway, {'ETag': gateway['etag']}
+
+    def put_vpn_gateway(self, query, body, gateway_name):
+        hub = self._get_hub_by_gateway(gateway_name)
+        if hub is None:
+            return 404, {'error': {'code': 'ResourceNotFound'}}
+        if_match = self._request_headers().get('If-Match')
+        with self.org.lock:
+            gateway = self.org.vpn_gateways[hub]
+            if if_match and if_match != gateway['etag']:
+                return 412, {'error': {'code': 'PreconditionFailed'}}
+            gateway['properties']['connections'] = body['properties'].get('connections', [])
+            gateway['etag'] = f"W/\"{uuid.uuid4()}\""
+        return 201, {'name': gateway['name']}, self._start_operation({'status': 'Succeeded'})
+
+    def get_vpn_connection(self, query, body, gateway_name, connection_name):
+        hub = self._get_hub_by_gateway(gateway_name)
+        if hub is None:
+            return 404, {'error': {'code': 'ResourceNotFound'}}
+        with self.org.lock:
+            connections = [copy.deepcopy(connection)
+                           for connection in self.org.vpn_gateways[hub]['properties']['connections']
+                           if connection['name'] == connection_name]
+        if not connections:
+            return 404, {'error': {'code': 'ResourceNotFound'}}
+        for link_connection in connections[0]['properties'].get('vpnLinkConnections', []):
+            link_connection.get('properties', {}).pop('sharedKey', None)
+        return 200, connections[0]
+
+    def put_vpn_connection(self, query, body, gateway_name, connection_name):
+        hub = self._get_hub_by_gateway(gateway_name)
+        if hub is None:
+            return 404, {'error': {'code': 'ResourceNotFound'}}
+        with self.org.lock:
+            connections = self.org.vpn_gateways[hub]['properties']['connections']
+            connections[:] = [connection for connection in connections if connection['name'] != connection_name]
+            connections.append({'name': connection_name, 'properties': body['properties']})
+            self.org.vpn_gateways[hub]['etag'] = f"W/\"{uuid.uuid4()}\""
+        return 201, {'name': connection_name, 'properties': body['properties']}
+
+    def get_vpn_site(self, query, body, site_name):
+        with self.org.lock:
+            site = copy.deepcopy(self.org.vpn_sites.get(site_name))
+        if site is None:
+            return 404, {'error': {'code': 'ResourceNotFound'}}
+        return 200, dict(site, name=site_name)
+
+    def put_vpn_site(self, query, body, site_name):
+        with self.org.lock:
+            self.org.vpn_sites[site_name] = body
+        return 201, {'name': site_name, 'properties': body.get('properties', {})}
+
+    def post_batch(self, query, body):
+        responses = []
+        for item in body.get('requests', []):
+            parsed = urllib.parse.urlsplit(item['url'])
+            template, handler, args = self._route(item['httpMethod'], parsed.path)
+            with self._lock:
+                self.calls[f"batch {template}"] += 1
+            if handler is None:
+                responses.append({'name': item.get('name'), 'httpStatusCode': 404, 'content': {}})
+                continue
+            response = handler(urllib.parse.parse_qs(parsed.query), item.get('content'), *args)
+            responses.append({'name': item.get('name'), 'httpStatusCode': response[0], 'content': response[1],
+                              'headers': response[2] if len(response) > 2 else {}})
+        return 200, {'responses': responses}
+
+
+class _JsonRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; Nagle would hold the body back for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def handle_one_request(self):
+        # Same as BaseHTTPRequestHandler.handle_one_request with a longer request line
+        try:
+            self.raw_requestline = self.rfile.readline(MAX_REQUEST_LINE + 1)
+            if len(self.raw_requestline) > MAX_REQUEST_LINE:
+                self.send_error(414)
+                return
+            if not self.raw_requestline:
+                self.close_connection = True
+                return
+            if not self.parse_request():
+                return
+            self.dispatch()
+            self.wfile.flush()
+        except TimeoutError:
+            self.close_connection = True
+
+    def dispatch(self):
+        '''
+        Answers the parsed request. The handler class of each fake server
+        overrides this to route to the server; unrouted requests get 501.
+
+        @return: None
+        '''
+        self.send_json(501, {'errors': [f"{self.command} {self.path} is not implemented"]})
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def send_json(self, status: int, payload, headers: dict=None):
+        content = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
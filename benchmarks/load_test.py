@@ -0,0 +1,191 @@
+'''
+Offline load test of the Meraki vWAN function. Local stand-ins of the
+Meraki Dashboard API and of ARM serve synthetic organizations of the
+requested sizes, main() runs end to end against them, and the wall time
+and API call counts of every run are reported.
+
+    python benchmarks/load_test.py --sizes 10 1000 10000 --latency 0.02 --rate-limit 10
+
+With --durable the Meraki-VWAN-Orchestrator orchestration runs in the
+local durable harness instead of the timer function's main().
+'''
+import argparse
+import importlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+if __package__:
+    from .durable_harness import get_harness
+    from .fake_servers import FakeArmServer, FakeMerakiServer, SyntheticOrg
+else:
+    from durable_harness import get_harness
+    from fake_servers import FakeArmServer, FakeMerakiServer, SyntheticOrg
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTION_MODULE = '__app__.Meraki-VWAN-Automation'
+
+def get_function_module(environment: dict):
+    '''
+    Imports the function the way the Functions host does, with the
+    repository as the __app__ package. Settings are read when modules are
+    imported, so environment is applied first.
+
+    @param  environment: Settings of the function
+    @rtype:              module
+    @return:             Function module
+    '''
+    for name, value in environment.items():
+        os.environ.setdefault(name, value)
+    if '__app__' not in sys.modules:
+        package = types.ModuleType('__app__')
+        package.__path__ = [REPO_ROOT]
+        sys.modules['__app__'] = package
+    return importlib.import_module(FUNCTION_MODULE)
+
+def run_size(function, servers: list, org: SyntheticOrg, state_dir: str, runs: int):
+    '''
+    Runs main() runs times against org and returns what each run cost.
+
+    @param  function:  Function module
+    @param  servers:   Fake Meraki and ARM servers
+    @param  org:       SyntheticOrg served
+    @param  state_dir: Directory of the function's state files, emptied first
+    @param  runs:      Consecutive runs, the first one starting from empty state
+    @rtype:            list
+    @return:           Result of each run
+    '''
+    for name in os.listdir(state_dir):
+        if name.startswith('state-') or name.startswith('whois-'):
+            os.remove(os.path.join(state_dir, name))
+    for server in servers:
+        server.org = org
+
+    results = []
+    for run in range(1, runs + 1):
+        for server in servers:
+            server.reset_counts()
+        timer = types.SimpleNamespace(past_due=False)
+        error = None
+        start = time.perf_counter()
+        try:
+            function.main(timer)
+        except Exception as e:
+            logging.exception(e)
+            error = repr(e)
+        wall_time = time.perf_counter() - start
+
+        meraki_server, arm_server = servers
+        results.append({
+            'networks': len(org.networks),
+            'run': run,
+            'wallTime': round(wall_time, 3),
+            'error': error,
+            'merakiCalls': sum(meraki_server.calls.values()),
+            'armCalls': sum(arm_server.calls.values()),
+            'meraki429': sum(meraki_server.throttled.values()),
+            'arm429': sum(arm_server.throttled.values()),
+            'merakiEndpoints': dict(meraki_server.calls.most_common()),
+            'armEndpoints': dict(arm_server.calls.most_common()),
+            'peers': len(org.peers),
+            'vpnSites': len(org.vpn_sites)
+        })
+    return results
+
+def print_report(results: list):
+    print(f"{'networks':>9} {'run':>4} {'wall s':>9} {'meraki':>8} {'arm':>7} {'429s':>6} {'peers':>7}  error")
+    for result in results:
+        print(f"{result['networks']:>9} {result['run']:>4} {result['wallTime']:>9.2f} {result['merakiCalls']:>8} "
+              f"{result['armCalls']:>7} {result['meraki429'] + result['arm429']:>6} {result['peers']:>7}  "
+              f"{result['error'] or ''}")
+    for result in results:
+        print(f"\n{result['networks']} networks, run {result['run']}")
+        for endpoint, count in list(result['merakiEndpoints'].items()) + list(result['armEndpoints'].items()):
+            print(f"  {count:>8}  {endpoint}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000], help='networks per synthetic org')
+    parser.add_argument('--hubs', type=int, default=2, help='Virtual WAN hubs the networks are spread over')
+    parser.add_argument('--runs', type=int, default=1, help='consecutive runs per size, later runs start warm')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake API request')
+    parser.add_argument('--arm-latency', type=float, default=None, help='ARM latency, defaults to --latency')
+    parser.add_argument('--page-size', type=int, default=1000, help='largest page of paginated Meraki endpoints')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='Meraki requests per second, 0 for no limit; also the budget of the function')
+    parser.add_argument('--arm-rate-limit', type=float, default=0, help='ARM requests per second, 0 for no limit')
+    parser.add_argument('--setting', action='append', default=[], metavar='NAME=VALUE',
+                        help='function setting, e.g. max_concurrent_networks=8 or use_arm_batch=Yes')
+    parser.add_argument('--durable', action='store_true', help='run the durable orchestration in the local harness')
+    parser.add_argument('--durable-workers', type=int, default=8, help='activities the durable harness runs at once')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='show the function log')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    state_dir = tempfile.mkdtemp(prefix='meraki-vwan-load-test-')
+    prefix_dump = os.path.join(state_dir, 'prefixes.csv')
+    with open(prefix_dump, 'w') as dump_file:
+        dump_file.write('0.0.0.0/0,Benchmark ISP\n')
+
+    org = SyntheticOrg(args.sizes[0], args.hubs)
+    meraki_server = FakeMerakiServer(org, args.latency, args.page_size, args.rate_limit)
+    arm_latency = args.latency if args.arm_latency is None else args.arm_latency
+    arm_server = FakeArmServer(org, arm_latency, args.page_size, args.arm_rate_limit)
+    meraki_url = meraki_server.start()
+    arm_url = arm_server.start()
+
+    environment = {
+        'meraki_api_key': 'f' * 40,
+        'meraki_org_name': org.org_name,
+        'meraki_base_url': meraki_url,
+        'meraki_rate_limit': str(args.rate_limit),
+        'use_maintenance_window': 'No',
+        'maintenance_time_in_utc': '0',
+        'subscription_id': org.subscription_id,
+        'vwan_name': org.vwan_name,
+        'arm_endpoint': arm_url,
+        'IDENTITY_ENDPOINT': f"{arm_url}/msi/token",
+        'IDENTITY_HEADER': 'benchmark',
+        'isp_resolver': 'offline',
+        'isp_prefix_dump_path': prefix_dump,
+        'isp_prefix_index_path': os.path.join(state_dir, 'prefixes.idx'),
+        'whois_cache_path': os.path.join(state_dir, 'whois-cache.json'),
+        'desired_state_path': os.path.join(state_dir, 'state-desired.json'),
+        'token_cache_path': os.path.join(state_dir, 'state-token.json')
+    }
+    for setting in args.setting:
+        name, value = setting.split('=', 1)
+        environment[name] = value
+        os.environ[name] = value
+
+    try:
+        function = get_function_module(environment)
+        if args.durable:
+            harness, start = get_harness(args.durable_workers)
+            function = types.SimpleNamespace(main=lambda timer: start(timer.past_due))
+        results = []
+        for size in args.sizes:
+            print(f"Running {args.runs} run(s) against {size} networks...", file=sys.stderr)
+            results.extend(run_size(function, [meraki_server, arm_server], SyntheticOrg(size, args.hubs),
+                                    state_dir, args.runs))
+    finally:
+        meraki_server.stop()
+        arm_server.stop()
+        shutil.rmtree(state_dir, ignore_errors=True)
+        if args.durable:
+            print(f"Durable harness: {json.dumps(harness.stats())}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    print_report(results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+'''
+Replays a cassette recorded with cassette_mode=record through main() and
+reports the wall time and the API calls of the run, so versions of the
+function can be compared on the same real-world data.
+
+Record a run of the function (from an empty desired state) with the
+settings cassette_mode=record and cassette_path=<file>, or against the
+load test servers. Every invocation replaces the cassette with its own
+run, so keep the one of the first run of a fresh worker:
+
+    python benchmarks/load_test.py --sizes 1000 --setting cassette_mode=record --setting cassette_path=run.json.gz
+
+then replay it:
+
+    python benchmarks/replay.py run.json.gz --latency zero --output replay.json
+'''
+import argparse
+import collections
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+if __package__:
+    from .load_test import get_function_module
+else:
+    from load_test import get_function_module
+
+# Collapses IDs and resource names so calls are counted per endpoint
+ENDPOINT_PATTERNS = [
+    (re.compile(r'/(networks|devices|organizations)/[^/?]+'), r'/\1/{id}'),
+    (re.compile(r'/(vpnSites|vpnConnections|virtualHubs|vpnGateways|operations)/[^/?]+'), r'/\1/{name}'),
+    (re.compile(r'\?.*$'), '')
+]
+
+def get_endpoint(key: str):
+    for pattern, replacement in ENDPOINT_PATTERNS:
+        key = pattern.sub(replacement, key)
+    return key
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('cassette', help='cassette recorded with cassette_mode=record')
+    parser.add_argument('--latency', choices=('original', 'zero'), default='original',
+                        help='wait the recorded latency of every response, or none')
+    parser.add_argument('--setting', action='append', default=[], metavar='NAME=VALUE',
+                        help='function setting, e.g. max_concurrent_networks=8')
+    parser.add_argument('--output', help='write the result as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='show the function log')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    with gzip.open(args.cassette, 'rt', encoding='utf-8') as cassette_file:
+        recorded = json.load(cassette_file)
+
+    state_dir = tempfile.mkdtemp(prefix='meraki-vwan-replay-')
+    environment = dict(recorded.get('settings', {}))
+    environment.update({
+        # Recorded latencies already include the waits of the rate limiter
+        'meraki_rate_limit': '0',
+        'meraki_api_key': 'f' * 40,
+        'IDENTITY_HEADER': 'replay',
+        'cassette_mode': 'replay',
+        'cassette_path': os.path.abspath(args.cassette),
+        'cassette_latency': args.latency,
+        'whois_cache_path': os.path.join(state_dir, 'whois-cache.json'),
+        'desired_state_path': os.path.join(state_dir, 'desired-state.json'),
+        'token_cache_path': os.path.join(state_dir, 'token-cache.json')
+    })
+    for setting in args.setting:
+        name, value = setting.split('=', 1)
+        environment[name] = value
+    os.environ.update(environment)
+
+    try:
+        function = get_function_module(environment)
+        error = None
+        start = time.perf_counter()
+        try:
+            function.main(types.SimpleNamespace(past_due=False))
+        except Exception as e:
+            logging.exception(e)
+            error = repr(e)
+        wall_time = time.perf_counter() - start
+        stats = function.get_cassette().stats()
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    endpoints = collections.Counter()
+    for key, count in stats['played'].items():
+        endpoints[get_endpoint(key)] += count
+    result = {
+        'cassette': args.cassette,
+        'latency': args.latency,
+        'wallTime': round(wall_time, 3),
+        'error': error,
+        'recordedCalls': len(recorded['interactions']),
+        'recordedLatency': round(sum(interaction['elapsed'] for interaction in recorded['interactions']), 3),
+        'calls': sum(stats['played'].values()),
+        'missed': stats['missed'],
+        'endpoints': dict(endpoints.most_common())
+    }
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(result, output_file, indent=2)
+
+    print(f"wall time {result['wallTime']:.2f}s, {result['calls']} calls "
+          f"({result['recordedCalls']} recorded, {result['recordedLatency']:.2f}s recorded latency)")
+    for endpoint, count in result['endpoints'].items():
+        print(f"  {count:>8}  {endpoint}")
+    if result['missed']:
+        print(f"{sum(result['missed'].values())} calls had no recorded response:", file=sys.stderr)
+        for key, count in result['missed'].items():
+            print(f"  {count:>8}  {key}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
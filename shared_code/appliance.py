@@ -1,9 +1,8 @@
-import os
-import meraki
-
+from __app__.shared_code.dashboard import get_dashboard
+from __app__.shared_code.inventory import DeviceInventory
 from __app__.shared_code.mx import MX
+from __app__.shared_code.uplinks import UplinkSnapshot
 
-API_KEY = os.environ.get('meraki_api_key')
 PRIMARY_SERIAL = 'primarySerial'
 SECONDARY_SERIAL = 'spareSerial'
 
@@ -13,7 +12,8 @@ class Appliance():
     If HA is configured, self.warmspare_enabled will be True and
     self.secondary will also have the MX information.
     '''
-    def __init__(self, network_id:str, enabled:bool, primary_serial:str, secondary_serial:str, org_id=None):
+    def __init__(self, network_id:str, enabled:bool, primary_serial:str, secondary_serial:str, org_id=None,
+                 uplinks: UplinkSnapshot=None, inventory: DeviceInventory=None):
         '''
         Construct a new 'Appliance' object.
 
@@ -21,24 +21,39 @@ class Appliance():
         @param enabled:          If warmspare is enabled or not
         @param primary_serial:   Serial number of the primary MX
         @param secondary_serial: Serial number of the secondary MX
+        @param uplinks:          UplinkSnapshot of the organization shared within a run
+        @param inventory:        DeviceInventory of the organization shared within a run
         @return:                 None
         '''
         self.network_id = network_id
         self.org_id = org_id
         self.warmspare_enabled = enabled
-        self.primary = MX(network_id, self._get_mx(primary_serial), org_id) if primary_serial else MX()
-        self.secondary = MX(network_id, self._get_mx(secondary_serial), org_id) if secondary_serial else MX()
+        self.inventory = inventory
+        if uplinks is None and org_id:
+            uplinks = UplinkSnapshot(org_id)
+        self.uplinks = uplinks
+        self.primary = MX(network_id, self._get_mx(primary_serial), org_id, uplinks) if primary_serial else MX()
+        self.secondary = MX(network_id, self._get_mx(secondary_serial), org_id, uplinks) if secondary_serial else MX()
 
     def _get_mx(self, serial: str):
         '''
         Obtains the information of the Meraki device by serial number.
+        The device inventory is used when available, with the WAN
+        addresses getDevice returns taken from the uplink statuses, and
+        getDevice otherwise.
 
         @param   serial: serial number
         @rtype:          dict or None
         @return:         Information of the Meraki device
         '''
+        if self.inventory:
+            device = self.inventory.get_device(serial)
+            if device:
+                if self.uplinks:
+                    return dict(device, **self.uplinks.get_wan_ips(self.network_id, serial))
+                return device
         try:
-            mdashboard = meraki.DashboardAPI(api_key=API_KEY, suppress_logging=True, print_console=True)
+            mdashboard = get_dashboard()
             return mdashboard.devices.getDevice(serial)
         except:
             return
@@ -0,0 +1,248 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from urllib3.util.retry import Retry
+
+from __app__.shared_code.pooling import ConnectionStats, PooledAdapter, mount_pooled_adapter
+
+ARM_REQUEST_TIMEOUT = float(os.environ.get('arm_request_timeout', 30))
+ARM_MAX_RETRIES = int(os.environ.get('arm_max_retries', 4))
+ARM_POOL_CONNECTIONS = int(os.environ.get('arm_pool_connections', 4))
+ARM_POOL_MAXSIZE = int(os.environ.get('arm_pool_maxsize', 16))
+ARM_RETRY_STATUSES = (429, 500, 502, 503, 504)
+ARM_POLL_TIMEOUT = float(os.environ.get('arm_poll_timeout', 60))
+ARM_POLL_INITIAL_DELAY = float(os.environ.get('arm_poll_initial_delay', 0.5))
+ARM_POLL_MAX_DELAY = float(os.environ.get('arm_poll_max_delay', 10))
+ARM_BATCH_SIZE = int(os.environ.get('arm_batch_size', 20))
+ARM_BATCH_API_VERSION = '2020-06-01'
+ARM_ENDPOINT = os.environ.get('arm_endpoint', 'https://management.azure.com')
+TERMINAL_STATES = ('succeeded', 'failed', 'canceled', 'cancelled')
+
+_arm_client = None
+_arm_client_lock = threading.Lock()
+
+class ArmRetry(Retry):
+    '''
+    ArmRetry retries idempotent requests answered with 429 or 5xx. Other
+    requests, such as the POST of a $batch, are only retried on 429, which
+    ARM answers without acting on the request: a 5xx may follow work
+    already done, and send_arm_batch retries failed batch items itself.
+    '''
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if not self._is_method_retryable(method):
+            return status_code == 429 and bool(self.total)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class ArmClient():
+    '''
+    ArmClient sends Azure Resource Manager requests through one pooled,
+    keep-alive session. Every request gets a timeout, and requests
+    answered with 429, or with 5xx when they are idempotent, are retried
+    with backoff, honoring Retry-After.
+    '''
+
+    def __init__(self, timeout: float=ARM_REQUEST_TIMEOUT, max_retries: int=ARM_MAX_RETRIES,
+                 pool_connections: int=ARM_POOL_CONNECTIONS, pool_maxsize: int=ARM_POOL_MAXSIZE):
+        '''
+        Construct a new 'ArmClient' object.
+
+        @param timeout:          Seconds before a single request times out
+        @param max_retries:      Retries of a request answered with 429, or 5xx when idempotent
+        @param pool_connections: Number of host pools to keep
+        @param pool_maxsize:     Connections kept alive per host
+        @return:                 None
+        '''
+        self.timeout = timeout
+        self.stats = ConnectionStats()
+        retry = ArmRetry(total=max_retries, connect=max_retries, read=0, status=max_retries,
+                         status_forcelist=ARM_RETRY_STATUSES, backoff_factor=0.5,
+                         respect_retry_after_header=True, raise_on_status=False)
+        self.session = requests.Session()
+        mount_pooled_adapter(self.session, PooledAdapter(self.stats, pool_connections=pool_connections,
+                                                         pool_maxsize=pool_maxsize, max_retries=retry))
+
+    def request(self, method: str, url: str, **kwargs):
+        '''
+        Sends a request to ARM.
+
+        @param  method: HTTP method
+        @param  url:    Absolute URL
+        @param  kwargs: Arguments passed to requests, e.g. headers or json
+        @rtype:         requests.Response
+        @return:        Response
+        '''
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url: str, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def connection_stats(self):
+        '''
+        Returns how many ARM requests were sent and how many of them
+        reused a pooled connection since the last reset.
+
+        @rtype:  dict
+        @return: Requests, opened and reused connections
+        '''
+        return self.stats.as_dict()
+
+    def reset_connection_stats(self):
+        self.stats.reset()
+
+
+def get_arm_client():
+    '''
+    Returns the ArmClient shared by every ARM call of the worker process.
+
+    @rtype:  ArmClient
+    @return: Shared client
+    '''
+    global _arm_client
+    with _arm_client_lock:
+        if _arm_client is None:
+            _arm_client = ArmClient()
+    return _arm_client
+
+def get_retry_after(response, default: float=None):
+    '''
+    Returns the delay requested by the Retry-After header of an ARM
+    response in seconds.
+
+    @param  response: requests.Response
+    @param  default:  Delay to use when the header is missing or invalid
+    @rtype:           float
+    @return:          Seconds to wait
+    '''
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return default
+
+def poll_arm_operation(operation_url: str, headers: dict, retry_after: float=None,
+                       timeout: float=ARM_POLL_TIMEOUT, session=None):
+    '''
+    Polls an ARM long-running operation (Azure-AsyncOperation or Location
+    URL) until it reaches a terminal state. Retry-After is honored when
+    ARM sends it; otherwise the delay starts at ARM_POLL_INITIAL_DELAY and
+    doubles up to ARM_POLL_MAX_DELAY. Operations that finish early are
+    returned immediately.
+
+    @param  operation_url: URL returned in Azure-AsyncOperation or Location
+    @param  headers:       Headers including the bearer token
+    @param  retry_after:   Retry-After of the response that started the operation
+    @param  timeout:       Seconds to wait before giving up
+    @param  session:       ArmClient used for the polls, the shared client by default
+    @rtype:                dict or None
+    @return:               Body of the finished operation, None on timeout
+    '''
+    session = session or get_arm_client()
+    deadline = time.monotonic() + timeout
+    delay = ARM_POLL_INITIAL_DELAY
+    wait = retry_after if retry_after is not None else delay
+    attempt = 0
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logging.error(f"ARM operation did not complete within {timeout} seconds: {operation_url}")
+            return None
+        time.sleep(min(wait, remaining))
+        attempt += 1
+
+        response = session.get(operation_url, headers=headers)
+        if response.status_code == 202:
+            body = {}
+        elif response.status_code == 200:
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            status = str(body.get('status', 'Succeeded')).lower()
+            if status in TERMINAL_STATES:
+                logging.info(f"ARM operation finished with status {body.get('status', 'Succeeded')} "
+                             f"after {attempt} polls")
+                return body
+        elif response.status_code == 429 or response.status_code >= 500:
+            logging.info(f"ARM operation poll returned {response.status_code}, retrying")
+        else:
+            logging.error(f"ARM operation poll failed with {response.status_code}: {response.text}")
+            return None
+
+        delay = min(delay * 2, ARM_POLL_MAX_DELAY)
+        wait = get_retry_after(response, delay)
+
+def send_arm_batch(batch_requests: list, headers: dict, batch_size: int=ARM_BATCH_SIZE,
+                   max_retries: int=ARM_MAX_RETRIES, session=None):
+    '''
+    Sends ARM requests through the $batch endpoint, up to batch_size per
+    round trip. Every request keeps its own status: items answered with
+    429 or 5xx are sent again in a later batch, and a batch that fails as
+    a whole reports its status for each of its items.
+
+    @param  batch_requests: Dicts with httpMethod, url relative to ARM_ENDPOINT and optional content
+    @param  headers:        Headers including the bearer token
+    @param  batch_size:     Requests per batch
+    @param  max_retries:    Times an item answered with 429 or 5xx is sent again
+    @param  session:        ArmClient used for the batches, the shared client by default
+    @rtype:                 list
+    @return:                Responses with httpStatusCode and content, in the order of batch_requests
+    '''
+    session = session or get_arm_client()
+    batch_url = f"{ARM_ENDPOINT}/batch?api-version={ARM_BATCH_API_VERSION}"
+    responses = [None] * len(batch_requests)
+    pending = list(range(len(batch_requests)))
+
+    for attempt in range(max_retries + 1):
+        retry = []
+        retry_after = 0
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            named_requests = [dict(batch_requests[index], name=str(index)) for index in chunk]
+            response = session.post(batch_url, headers=headers, json={'requests': named_requests})
+
+            body = None
+            if response.status_code == 202 and response.headers.get('Location'):
+                body = poll_arm_operation(response.headers['Location'], headers, get_retry_after(response), session=session)
+            elif response.status_code == 200:
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = None
+            else:
+                logging.error(f"ARM batch request failed with {response.status_code}: {response.text}")
+
+            items = {item.get('name'): item for item in (body or {}).get('responses', [])}
+            for index in chunk:
+                item = items.get(str(index))
+                if item is None:
+                    item = {'name': str(index), 'httpStatusCode': response.status_code if response.status_code >= 400 else None,
+                            'content': {'error': {'message': 'No response in ARM batch'}}}
+                responses[index] = item
+
+                status = item.get('httpStatusCode') or 0
+                if status == 429 or status >= 500:
+                    retry.append(index)
+                    try:
+                        retry_after = max(retry_after, float((item.get('headers') or {}).get('Retry-After')))
+                    except (TypeError, ValueError):
+                        pass
+
+        if not retry or attempt == max_retries:
+            break
+        logging.info(f"Retrying {len(retry)} throttled or failed ARM batch items")
+        time.sleep(retry_after or ARM_POLL_INITIAL_DELAY * 2 ** attempt)
+        pending = retry
+
+    return responses
@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class PersistentLRUCache():
+    '''
+    PersistentLRUCache is a bounded least-recently-used cache whose entries
+    expire after a TTL. Entries are kept in a JSON file so they survive
+    across function invocations; the file stands in for a blob and is
+    rewritten at most every save_interval seconds when entries were added,
+    and whenever save() is called.
+    '''
+
+    def __init__(self, path: str, max_entries: int=4096, ttl: float=7 * 24 * 3600, save_interval: float=5):
+        '''
+        Construct a new 'PersistentLRUCache' object and load the entries
+        found in path.
+
+        @param path:          File the cache is persisted to
+        @param max_entries:   Maximum number of entries kept
+        @param ttl:           Seconds an entry is valid for
+        @param save_interval: Minimum seconds between two automatic saves
+        @return:              None
+        '''
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._dirty = False
+        self._saved_at = time.time()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        '''
+        Loads unexpired entries from self.path. A missing or unreadable
+        file leaves the cache empty.
+
+        @return: None
+        '''
+        try:
+            with open(self.path) as cache_file:
+                entries = json.load(cache_file).get('entries', {})
+        except (OSError, ValueError, AttributeError):
+            return
+
+        now = time.time()
+        for key, (value, expires_at) in entries.items():
+            if expires_at > now:
+                self._entries[key] = (value, expires_at)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        '''
+        Writes the entries to self.path if any were added since the last
+        save, replacing the file atomically.
+
+        @return: None
+        '''
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = dict(self._entries)
+                self._dirty = False
+                self._saved_at = time.time()
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, 'w') as cache_file:
+                    json.dump({'entries': entries}, cache_file)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logging.warning(f"Could not persist cache to {self.path}: {e}")
+
+    def get(self, key: str):
+        '''
+        Returns the cached value of key and marks it as recently used.
+
+        @param  key: Cache key
+        @rtype:      str or None
+        @return:     Cached value, None when missing or expired
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value):
+        '''
+        Stores value under key and evicts the least recently used entry
+        when the cache is full. The cache is persisted once save_interval
+        has passed since the last save.
+
+        @param  key:   Cache key
+        @param  value: JSON serializable value
+        @return:       None
+        '''
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            save_due = time.time() - self._saved_at >= self.save_interval
+        if save_due:
+            self.save()
+
+    def stats(self):
+        '''
+        Returns the hit and miss counters of the cache.
+
+        @rtype:  dict
+        @return: Counters and current size
+        '''
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
@@ -0,0 +1,285 @@
+import collections
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+CASSETTE_MODE = os.environ.get('cassette_mode', '').lower()
+CASSETTE_PATH = os.environ.get('cassette_path', os.path.join(tempfile.gettempdir(), 'meraki_vwan_cassette.json.gz'))
+CASSETTE_LATENCY = os.environ.get('cassette_latency', 'original').lower()
+RECORD = 'record'
+REPLAY = 'replay'
+ZERO_LATENCY = 'zero'
+SCRUBBED = 'scrubbed'
+
+# Response headers the function reads; every other header is left out of the cassette
+KEPT_HEADERS = ('Content-Type', 'Link', 'Location', 'Retry-After', 'Azure-AsyncOperation')
+SECRET_KEYS = ('secret', 'sharedKey', 'access_token', 'refresh_token', 'client_secret', 'psk')
+# Non-secret settings a replay needs to import the function with
+RECORDED_SETTINGS = ('meraki_org_name', 'use_maintenance_window', 'maintenance_time_in_utc', 'subscription_id',
+                     'vwan_name', 'meraki_base_url', 'arm_endpoint', 'IDENTITY_ENDPOINT', 'reconcile_mode')
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+def _scrub(value):
+    if isinstance(value, dict):
+        return {key: SCRUBBED if key in SECRET_KEYS and value[key] else _scrub(value[key]) for key in value}
+    if isinstance(value, list):
+        return [_scrub(item) for item in value]
+    return value
+
+def get_request_key(method: str, url: str):
+    '''
+    Returns the key recorded responses are matched by: the method and the
+    path with its query sorted. Hosts and request bodies are left out, as
+    replays run against other hosts and send fresh secrets.
+
+    @param  method: HTTP method
+    @param  url:    Request URL
+    @rtype:         str
+    @return:        Key e.g. "GET /api/v1/organizations"
+    '''
+    parsed = urllib.parse.urlsplit(url)
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)))
+    return f"{method} {parsed.path}?{query}" if query else f"{method} {parsed.path}"
+
+
+class Cassette():
+    '''
+    Cassette records the HTTP responses of a run, with secrets scrubbed,
+    to a gzip compressed JSON file and plays them back in order. A replay
+    waits the recorded latency of each response, or none. Answers the
+    function gets without requests, such as WHOIS, are kept as lookups.
+    '''
+
+    def __init__(self, path: str=CASSETTE_PATH, mode: str=CASSETTE_MODE, latency: str=CASSETTE_LATENCY):
+        '''
+        Construct a new 'Cassette' object. A replay cassette is loaded
+        from path.
+
+        @param path:    File of the cassette
+        @param mode:    'record' or 'replay'
+        @param latency: 'original' or 'zero', the latency of replayed responses
+        @return:        None
+        '''
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.settings = {}
+        self.played = collections.Counter()
+        self.missed = collections.Counter()
+        self._lock = threading.Lock()
+        self._interactions = []
+        self._queues = {}
+        self._lookups = {}
+
+        if mode == RECORD:
+            self.settings = {name: os.environ[name] for name in RECORDED_SETTINGS if name in os.environ}
+        elif mode == REPLAY:
+            with gzip.open(path, 'rt', encoding='utf-8') as cassette_file:
+                cassette = json.load(cassette_file)
+            self.settings = cassette.get('settings', {})
+            self._interactions = cassette['interactions']
+            self._lookups = cassette.get('lookups', {})
+            for interaction in self._interactions:
+                self._queues.setdefault(interaction['key'], collections.deque()).append(interaction)
+
+    def record(self, request, response, elapsed: float):
+        '''
+        Adds a response to the cassette.
+
+        @param  request:  requests.PreparedRequest
+        @param  response: requests.Response
+        @param  elapsed:  Seconds the request took
+        @return:          None
+        '''
+        try:
+            body = _scrub(response.json())
+            is_json = True
+        except ValueError:
+            body = response.text
+            is_json = False
+
+        interaction = {
+            'key': get_request_key(request.method, request.url),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+            'json': is_json,
+            'body': body,
+            'requestBytes': len(request.body or b''),
+            'elapsed': round(elapsed, 4)
+        }
+        with self._lock:
+            self._interactions.append(interaction)
+
+    def play(self, request):
+        '''
+        Returns the next recorded response for request. Once the
+        responses recorded for a key are used up, the last one is
+        repeated, as polls may take a different number of rounds.
+
+        @param  request: requests.PreparedRequest
+        @rtype:          requests.Response
+        @return:         Recorded response
+        '''
+        key = get_request_key(request.method, request.url)
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                self.missed[key] += 1
+                raise requests.exceptions.ConnectionError(f"No recorded response for {key}", request=request)
+            interaction = queue.popleft() if len(queue) > 1 else queue[0]
+            self.played[key] += 1
+
+        if self.latency != ZERO_LATENCY:
+            time.sleep(interaction['elapsed'])
+
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.reason = interaction['reason']
+        response.headers = CaseInsensitiveDict(interaction['headers'])
+        body = interaction['body']
+        response._content = json.dumps(body).encode('utf-8') if interaction['json'] else (body or '').encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def lookup(self, kind: str, key: str, fetch):
+        '''
+        Returns a value the function obtains without requests, such as a
+        WHOIS answer: fetched and recorded, or replayed.
+
+        @param  kind:  Kind of lookup e.g. whois
+        @param  key:   Key of the value e.g. an IP address
+        @param  fetch: Function returning the value when recording
+        @rtype:        any
+        @return:       JSON serializable value
+        '''
+        if self.mode == REPLAY:
+            with self._lock:
+                if key in self._lookups.get(kind, {}):
+                    self.played[f"{kind} lookup"] += 1
+                    return self._lookups[kind][key]
+                self.missed[f"{kind} {key}"] += 1
+            raise LookupError(f"No recorded {kind} lookup for {key}")
+
+        value = fetch()
+        with self._lock:
+            self._lookups.setdefault(kind, {})[key] = value
+        return value
+
+    def reset(self):
+        '''
+        Starts a new recording, called at the start of every invocation so
+        a warm worker's cassette holds one run. Lookups are kept, as their
+        answers stay cached in the worker across runs. A replay cassette is
+        left as it is.
+
+        @return: None
+        '''
+        if self.mode != RECORD:
+            return
+        with self._lock:
+            self._interactions = []
+            self.played.clear()
+            self.missed.clear()
+
+    def save(self):
+        '''
+        Writes a recorded cassette to self.path.
+
+        @return: None
+        '''
+        if self.mode != RECORD:
+            return
+        with self._lock:
+            cassette = {'settings': self.settings, 'interactions': list(self._interactions),
+                        'lookups': {kind: dict(values) for kind, values in self._lookups.items()}}
+        try:
+            with gzip.open(self.path, 'wt', encoding='utf-8') as cassette_file:
+                json.dump(cassette, cassette_file, separators=(',', ':'))
+            logging.info(f"Recorded {len(cassette['interactions'])} responses to {self.path}")
+        except OSError as e:
+            logging.warning(f"Could not write cassette {self.path}: {e}")
+
+    def stats(self):
+        '''
+        Returns how many responses were played per request key, and
+        which requests had no recorded response.
+
+        @rtype:  dict
+        @return: Played and missed requests
+        '''
+        with self._lock:
+            return {'played': dict(self.played), 'missed': dict(self.missed)}
+
+
+class CassetteAdapter(BaseAdapter):
+    '''
+    CassetteAdapter sits in front of a session's adapter. It records the
+    responses the adapter returns, or answers from the cassette without
+    sending anything.
+    '''
+
+    def __init__(self, cassette: Cassette, adapter):
+        '''
+        Construct a new 'CassetteAdapter' object.
+
+        @param cassette: Cassette to record to or replay from
+        @param adapter:  Adapter requests are sent with when recording
+        @return:         None
+        '''
+        super().__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        if self.cassette.mode == REPLAY:
+            return self.cassette.play(request)
+
+        start = time.perf_counter()
+        response = self.adapter.send(request, **kwargs)
+        self.cassette.record(request, response, time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def get_cassette():
+    '''
+    Returns the cassette of the worker process when cassette_mode is
+    'record' or 'replay'.
+
+    @rtype:  Cassette or None
+    @return: Shared cassette
+    '''
+    global _cassette
+    if CASSETTE_MODE not in (RECORD, REPLAY):
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette()
+    return _cassette
+
+def wrap_adapter(adapter):
+    '''
+    Returns adapter, put behind the cassette when one is in use.
+
+    @param  adapter: requests adapter
+    @rtype:          requests adapter
+    @return:         Adapter to mount
+    '''
+    cassette = get_cassette()
+    return CassetteAdapter(cassette, adapter) if cassette else adapter
@@ -0,0 +1,103 @@
+import os
+import threading
+import meraki
+
+from __app__.shared_code.metrics import instrument_rest_session
+from __app__.shared_code.pooling import ConnectionStats, PooledAdapter, mount_pooled_adapter
+from __app__.shared_code.ratelimit import MERAKI_RATE_BURST, MERAKI_RATE_LIMIT, MERAKI_RATE_LIMIT_WORKERS, TokenBucket
+
+API_KEY = os.environ.get('meraki_api_key')
+BASE_URL = os.environ.get('meraki_base_url', meraki.config.DEFAULT_BASE_URL)
+POOL_CONNECTIONS = int(os.environ.get('meraki_pool_connections', 4))
+POOL_MAXSIZE = int(os.environ.get('meraki_pool_maxsize', 16))
+SDK_LOGGING = os.environ.get('meraki_sdk_logging', 'No') == 'Yes'
+
+_clients = {}
+_buckets = {}
+# Worker processes the rate budget is shared among
+_rate_limit_workers = MERAKI_RATE_LIMIT_WORKERS or 1
+_clients_lock = threading.Lock()
+_stats = ConnectionStats()
+
+def get_dashboard(api_key: str=None):
+    '''
+    Returns the Meraki DashboardAPI client shared by the function and
+    shared_code. One client is created per API key and its HTTP session
+    keeps connections alive in a pool of POOL_MAXSIZE connections. Its
+    requests are counted in the API metrics under their SDK operation.
+    Every request of the organization waits for a token of one shared
+    TokenBucket of meraki_rate_limit requests per second, 0 to disable,
+    shared out among meraki_rate_limit_workers worker processes.
+
+    @param  api_key: Meraki API key, defaults to the meraki_api_key setting
+    @rtype:          meraki.DashboardAPI
+    @return:         Shared client
+    '''
+    # Keys are normalized as the function always has, so one organization gets one client and one TokenBucket
+    api_key = (api_key or API_KEY).lower()
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = meraki.DashboardAPI(api_key=api_key, base_url=BASE_URL, suppress_logging=not SDK_LOGGING, print_console=True)
+            adapter = PooledAdapter(_stats, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            bucket = None
+            if MERAKI_RATE_LIMIT > 0:
+                bucket = TokenBucket(MERAKI_RATE_LIMIT / _rate_limit_workers, MERAKI_RATE_BURST / _rate_limit_workers)
+            mount_pooled_adapter(client._session._req_session, adapter, bucket)
+            _buckets[api_key] = bucket
+            instrument_rest_session(client._session)
+            _clients[api_key] = client
+    return client
+
+def set_rate_limit_workers(workers: int):
+    '''
+    Shares the rate budget of every client among workers worker
+    processes, unless meraki_rate_limit_workers or the app's instance
+    limit sets their number. The durable activities call it with the
+    number of activities the orchestration runs alongside them.
+
+    @param  workers: Worker processes that may send requests at once
+    @return:         None
+    '''
+    global _rate_limit_workers
+    if MERAKI_RATE_LIMIT_WORKERS is not None:
+        return
+    with _clients_lock:
+        _rate_limit_workers = max(workers, 1)
+        for bucket in _buckets.values():
+            if bucket is not None:
+                bucket.set_budget(MERAKI_RATE_LIMIT / _rate_limit_workers, MERAKI_RATE_BURST / _rate_limit_workers)
+
+def get_connection_stats():
+    '''
+    Returns how many Meraki requests were sent and how many of them
+    reused a pooled connection since the last reset.
+
+    @rtype:  dict
+    @return: Requests, opened and reused connections
+    '''
+    return _stats.as_dict()
+
+def get_rate_limit_stats():
+    '''
+    Returns how many Meraki requests waited for the rate limiter, how
+    long they waited and how many were answered with 429.
+
+    @rtype:  list
+    @return: Rate limiter counters of every client
+    '''
+    with _clients_lock:
+        return [bucket.stats() for bucket in _buckets.values() if bucket is not None]
+
+def reset_connection_stats():
+    '''
+    Resets the connection and rate limiter counters, called at the start
+    of a run.
+
+    @return: None
+    '''
+    _stats.reset()
+    with _clients_lock:
+        for bucket in _buckets.values():
+            if bucket is not None:
+                bucket.reset_stats()
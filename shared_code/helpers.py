@@ -1,15 +1,90 @@
+import logging
+import os
+import tempfile
 from ipwhois import IPWhois
 
+from __app__.shared_code.cache import PersistentLRUCache
+from __app__.shared_code.cassette import get_cassette
+from __app__.shared_code.prefix_index import PrefixIndex, build_prefix_index
+
+WHOIS_CACHE_PATH = os.environ.get('whois_cache_path',
+                                  os.path.join(tempfile.gettempdir(), 'meraki_vwan_whois_cache.json'))
+WHOIS_CACHE_SIZE = int(os.environ.get('whois_cache_size', 4096))
+WHOIS_CACHE_TTL_HOURS = float(os.environ.get('whois_cache_ttl_hours', 168))
+ISP_RESOLVER = os.environ.get('isp_resolver', 'whois').lower()
+ISP_PREFIX_DUMP_PATH = os.environ.get('isp_prefix_dump_path')
+ISP_PREFIX_INDEX_PATH = os.environ.get('isp_prefix_index_path',
+                                       os.path.join(tempfile.gettempdir(), 'meraki_vwan_prefix.idx'))
+
+_whois_cache = None
+_prefix_index = None
+
+def get_whois_cache():
+    '''
+    Returns the WHOIS cache shared by every lookup of the worker process.
+    It is loaded from WHOIS_CACHE_PATH on first use.
+
+    @rtype:  PersistentLRUCache
+    @return: ISP names keyed by public IP
+    '''
+    global _whois_cache
+    if _whois_cache is None:
+        _whois_cache = PersistentLRUCache(WHOIS_CACHE_PATH, WHOIS_CACHE_SIZE, WHOIS_CACHE_TTL_HOURS * 3600)
+    return _whois_cache
+
+def get_prefix_index():
+    '''
+    Returns the offline prefix index used when isp_resolver is 'offline'.
+    The index is (re)built from ISP_PREFIX_DUMP_PATH when it is missing
+    or older than the dump.
+
+    @rtype:  PrefixIndex or None
+    @return: Prefix index, None if offline resolution is not available
+    '''
+    global _prefix_index
+    if _prefix_index is None and ISP_RESOLVER == 'offline':
+        try:
+            if ISP_PREFIX_DUMP_PATH and (not os.path.exists(ISP_PREFIX_INDEX_PATH) or
+                    os.path.getmtime(ISP_PREFIX_DUMP_PATH) > os.path.getmtime(ISP_PREFIX_INDEX_PATH)):
+                count = build_prefix_index(ISP_PREFIX_DUMP_PATH, ISP_PREFIX_INDEX_PATH)
+                logging.info(f"Built ISP prefix index with {count} intervals from {ISP_PREFIX_DUMP_PATH}")
+            _prefix_index = PrefixIndex(ISP_PREFIX_INDEX_PATH)
+        except (OSError, ValueError) as e:
+            logging.warning(f"ISP prefix index unavailable, falling back to WHOIS: {e}")
+            _prefix_index = False
+    return _prefix_index or None
+
 def get_whois_info(public_ip: str):
     '''
-    Returns WAN ISP name.
+    Returns WAN ISP name. With the offline resolver the prefix index is
+    asked first; known IPs are answered from the WHOIS cache and only the
+    remaining misses are looked up.
 
     @param  public_ip: A public IP addres
     @rtype:            str
     @return:           WAN ISP name
     '''
+    # WHOIS is not sent through requests, so a cassette records the answers instead
+    cassette = get_cassette()
+    if cassette:
+        return cassette.lookup('whois', public_ip, lambda: _get_whois_info(public_ip))
+    return _get_whois_info(public_ip)
+
+def _get_whois_info(public_ip: str):
+    prefix_index = get_prefix_index()
+    if prefix_index:
+        whois_info = prefix_index.lookup(public_ip)
+        if whois_info:
+            return whois_info
+
+    cache = get_whois_cache()
+    whois_info = cache.get(public_ip)
+    if whois_info is not None:
+        return whois_info
+
     obj = IPWhois(public_ip)
     res = obj.lookup_whois()
     whois_info = res["nets"][0]['name']
+    cache.set(public_ip, whois_info)
 
-    return whois_info
\ No newline at end of file
+    return whois_info
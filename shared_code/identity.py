@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from dateutil import parser as date_parser
+from requests.adapters import HTTPAdapter
+
+from __app__.shared_code.cassette import wrap_adapter
+from __app__.shared_code.metrics import instrument_adapter
+
+TOKEN_CACHE_PATH = os.environ.get('token_cache_path',
+                                  os.path.join(tempfile.gettempdir(), 'meraki_vwan_token_cache.json'))
+TOKEN_REFRESH_MARGIN = float(os.environ.get('token_refresh_margin', 300))
+TOKEN_REQUEST_TIMEOUT = float(os.environ.get('token_request_timeout', 10))
+MSI_API_VERSION = '2017-09-01'
+
+_token_provider = None
+_token_provider_lock = threading.Lock()
+
+def _parse_expires_on(token_response: dict):
+    '''
+    Returns the expiry of a managed identity token as a UNIX timestamp.
+    App Service returns expires_on either as epoch seconds or as a date
+    such as "11/16/2020 1:21:37 AM +00:00".
+
+    @param  token_response: Response of the identity endpoint
+    @rtype:                 float
+    @return:                Expiry timestamp
+    '''
+    expires_on = token_response.get('expires_on')
+    try:
+        return float(expires_on)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return date_parser.parse(expires_on).timestamp()
+    except (TypeError, ValueError, OverflowError):
+        pass
+    try:
+        return time.time() + float(token_response['expires_in'])
+    except (KeyError, TypeError, ValueError):
+        return time.time() + TOKEN_REFRESH_MARGIN
+
+
+class ManagedIdentityTokenProvider():
+    '''
+    ManagedIdentityTokenProvider caches managed identity tokens in process
+    and on local disk so warm invocations skip the identity endpoint.
+    Tokens are refreshed once they are within refresh_margin of expiring;
+    a single caller refreshes while concurrent callers keep using the
+    still valid token or wait for the refresh instead of all calling the
+    identity endpoint at once.
+    '''
+
+    def __init__(self, cache_path: str=TOKEN_CACHE_PATH, refresh_margin: float=TOKEN_REFRESH_MARGIN):
+        '''
+        Construct a new 'ManagedIdentityTokenProvider' object.
+
+        @param cache_path:     File tokens are persisted to
+        @param refresh_margin: Seconds before expiry a token is refreshed
+        @return:               None
+        '''
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.session = requests.Session()
+        self.session.mount('http://', instrument_adapter(wrap_adapter(HTTPAdapter())))
+        self.session.mount('https://', instrument_adapter(wrap_adapter(HTTPAdapter())))
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._refresh_locks = {}
+
+    def _refresh_lock(self, resource: str):
+        with self._lock:
+            return self._refresh_locks.setdefault(resource, threading.Lock())
+
+    def _read_disk(self, resource: str):
+        try:
+            with open(self.cache_path) as cache_file:
+                token = json.load(cache_file)[resource]
+            return token['access_token'], float(token['expires_on'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_disk(self, resource: str, access_token: str, expires_on: float):
+        try:
+            with open(self.cache_path) as cache_file:
+                tokens = json.load(cache_file)
+        except (OSError, ValueError):
+            tokens = {}
+        tokens[resource] = {'access_token': access_token, 'expires_on': expires_on}
+
+        temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            file_descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(file_descriptor, 'w') as cache_file:
+                json.dump(tokens, cache_file)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            logging.warning(f"Could not persist token cache to {self.cache_path}: {e}")
+
+    def _fetch(self, resource: str):
+        identity_endpoint = os.environ['IDENTITY_ENDPOINT']
+        identity_header = os.environ['IDENTITY_HEADER']
+        token_auth_uri = f"{identity_endpoint}?resource={resource}&api-version={MSI_API_VERSION}"
+        resp = self.session.get(token_auth_uri, headers={'secret': identity_header}, timeout=TOKEN_REQUEST_TIMEOUT)
+        token_response = resp.json()
+        return token_response['access_token'], _parse_expires_on(token_response)
+
+    def _is_fresh(self, token, now: float):
+        return token is not None and token[1] - self.refresh_margin > now
+
+    def get_token(self, resource: str):
+        '''
+        Returns an access token for resource from the in-process cache, the
+        disk cache or the identity endpoint, in that order.
+
+        @param  resource: Resource URI the token is for
+        @rtype:           str
+        @return:          Access token
+        '''
+        now = time.time()
+        token = self._tokens.get(resource)
+        if self._is_fresh(token, now):
+            return token[0]
+
+        refresh_lock = self._refresh_lock(resource)
+        still_valid = token is not None and token[1] > now
+        # Another caller is already refreshing a token that has not expired yet
+        if still_valid and not refresh_lock.acquire(blocking=False):
+            return token[0]
+        if not still_valid:
+            refresh_lock.acquire()
+
+        try:
+            token = self._tokens.get(resource)
+            if self._is_fresh(token, time.time()):
+                return token[0]
+
+            token = self._read_disk(resource)
+            if not self._is_fresh(token, time.time()):
+                token = self._fetch(resource)
+                self._write_disk(resource, *token)
+                logging.info("Obtained a new managed identity access token")
+
+            self._tokens[resource] = token
+            return token[0]
+        finally:
+            refresh_lock.release()
+
+
+def get_token_provider():
+    '''
+    Returns the token provider shared by the worker process.
+
+    @rtype:  ManagedIdentityTokenProvider
+    @return: Shared token provider
+    '''
+    global _token_provider
+    with _token_provider_lock:
+        if _token_provider is None:
+            _token_provider = ManagedIdentityTokenProvider()
+    return _token_provider
@@ -0,0 +1,40 @@
+from __app__.shared_code.snapshot import OrgSnapshot
+
+class DeviceInventory(OrgSnapshot):
+    '''
+    DeviceInventory holds every device of an organization, fetched once
+    with getOrganizationDevices, so appliances can be built without a
+    getDevice call per serial. Inventory records carry no WAN addresses.
+    '''
+
+    def __init__(self, org_id: str, dashboard=None):
+        '''
+        Construct a new 'DeviceInventory' object.
+
+        @param org_id:    Organization ID of Meraki Dashboard
+        @param dashboard: meraki.DashboardAPI used to fetch the devices
+        @return:          None
+        '''
+        super().__init__(org_id, ('organizations', 'getOrganizationDevices'), dashboard)
+
+    def get_device(self, serial: str):
+        '''
+        Returns the device with the serial number.
+
+        @param  serial: Serial number
+        @rtype:         dict or None
+        @return:        Device as returned by getOrganizationDevices
+        '''
+        self._ensure_fetched()
+        return self._by_serial.get(serial)
+
+    def get_network_devices(self, network_id: str):
+        '''
+        Returns the devices claimed into a network.
+
+        @param  network_id: Network ID of Meraki Dashboard
+        @rtype:             list
+        @return:            Devices as returned by getOrganizationDevices
+        '''
+        self._ensure_fetched()
+        return self._by_network.get(network_id, [])
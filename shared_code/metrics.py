@@ -0,0 +1,323 @@
+import bisect
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+from requests.adapters import BaseAdapter
+
+API_METRICS_PATH = os.environ.get('api_metrics_path', '')
+# Upper bounds in seconds of the latency histogram buckets, the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PROMETHEUS_PREFIX = 'meraki_vwan_api'
+
+_api_metrics = None
+_api_metrics_lock = threading.Lock()
+
+def get_endpoint_template(method: str, url: str):
+    '''
+    Returns the endpoint template a request without an SDK operation is
+    counted under. ARM requests are named after the resource type the
+    path ends with, e.g. "PUT vpnSites" or "POST effectiveRoutes".
+
+    @param  method: HTTP method
+    @param  url:    Request URL
+    @rtype:         str
+    @return:        Endpoint template
+    '''
+    segments = [segment for segment in urllib.parse.urlsplit(url).path.split('/') if segment]
+    if 'providers' in segments:
+        index = len(segments) - 1 - segments[::-1].index('providers')
+        # After the provider namespace, resource types and names alternate
+        types = segments[index + 2:]
+        if types:
+            return f"{method} {types[-1] if len(types) % 2 else types[-2]}"
+    # Elsewhere the last segment that is not an ID, e.g. "GET operations"
+    names = [segment for segment in segments if not any(character.isdigit() for character in segment)]
+    return f"{method} {names[-1] if names else '/'}"
+
+
+class EndpointMetrics():
+    '''
+    EndpointMetrics accumulates the requests sent to one endpoint template.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def get_quantile(self, quantile: float):
+        '''
+        Returns the upper bound of the histogram bucket the quantile falls
+        in, or the slowest request when it falls in the +Inf bucket.
+
+        @param  quantile: Quantile between 0 and 1
+        @rtype:           float
+        @return:          Seconds
+        '''
+        rank = quantile * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets[:-1]):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[index]
+        return self.latency_max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'requestBytes': self.request_bytes,
+            'responseBytes': self.response_bytes,
+            'latencySum': round(self.latency_sum, 4),
+            'latencyMax': round(self.latency_max, 4),
+            'latencyBuckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], self.buckets))
+        }
+
+
+class ApiMetrics():
+    '''
+    ApiMetrics records the count, latency histogram, bytes, retries and
+    429s of the Meraki and ARM requests of a run per endpoint template.
+    Meraki requests are counted under the SDK operation that sent them,
+    e.g. getNetworkApplianceWarmSpare, every other request under the
+    template returned by get_endpoint_template.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._context = threading.local()
+        self._endpoints = {}
+        self.started = time.time()
+
+    @contextlib.contextmanager
+    def operation(self, name: str):
+        '''
+        Counts the requests sent by the current thread within the context
+        under name. Every request after the first is a retry.
+
+        @param  name: Endpoint template e.g. getNetworkApplianceWarmSpare
+        @return:      Context manager
+        '''
+        previous = getattr(self._context, 'operation', None)
+        self._context.operation = [name, 0]
+        try:
+            yield
+        finally:
+            self._context.operation = previous
+
+    def record(self, request, response, elapsed: float, error: bool=False):
+        '''
+        Adds a request to the metrics of its endpoint template.
+
+        @param  request:  requests.PreparedRequest
+        @param  response: requests.Response, None when the request failed
+        @param  elapsed:  Seconds the request took
+        @param  error:    True when no response was received
+        @return:          None
+        '''
+        operation = getattr(self._context, 'operation', None)
+        if operation:
+            operation[1] += 1
+            endpoint, retries = operation[0], int(operation[1] > 1)
+        else:
+            endpoint, retries = get_endpoint_template(request.method, request.url), 0
+
+        throttled = 0
+        if response is not None:
+            throttled = int(response.status_code == 429)
+            # Retries urllib3 made before returning the response
+            history = getattr(getattr(response.raw, 'retries', None), 'history', None) or ()
+            retries += len(history)
+            throttled += sum(1 for attempt in history if attempt.status == 429)
+            error = error or response.status_code >= 500
+        body = request.body or b''
+
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = EndpointMetrics()
+            metrics.count += 1
+            metrics.errors += int(error)
+            metrics.retries += retries
+            metrics.throttled += throttled
+            metrics.request_bytes += len(body.encode('utf-8') if isinstance(body, str) else body)
+            metrics.response_bytes += len(response.content or b'') if response is not None else 0
+            metrics.latency_sum += elapsed
+            metrics.latency_max = max(metrics.latency_max, elapsed)
+            metrics.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self.started = time.time()
+
+    def as_dict(self):
+        '''
+        Returns the metrics of every endpoint template, the busiest first.
+
+        @rtype:  dict
+        @return: Endpoint template to metrics
+        '''
+        with self._lock:
+            endpoints = sorted(self._endpoints.items(), key=lambda item: item[1].latency_sum, reverse=True)
+            return {endpoint: metrics.as_dict() for endpoint, metrics in endpoints}
+
+    def summary(self):
+        '''
+        Returns one line per endpoint template for the run log.
+
+        @rtype:  list
+        @return: Summary lines
+        '''
+        with self._lock:
+            endpoints = sorted(self._endpoints.items(), key=lambda item: item[1].latency_sum, reverse=True)
+            return [f"{endpoint}: {metrics.count} calls, {metrics.latency_sum:.2f}s total, "
+                    f"p50 <= {metrics.get_quantile(0.5)}s, p95 <= {metrics.get_quantile(0.95)}s, "
+                    f"max {metrics.latency_max:.3f}s, {metrics.retries} retries, {metrics.throttled} 429s, "
+                    f"{metrics.errors} errors, {metrics.request_bytes} bytes sent, "
+                    f"{metrics.response_bytes} bytes received"
+                    for endpoint, metrics in endpoints]
+
+    def to_prometheus(self):
+        '''
+        Returns the metrics in the Prometheus text exposition format.
+
+        @rtype:  str
+        @return: Metrics text
+        '''
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+            counters = (('requests_total', 'Requests sent', 'count'),
+                        ('errors_total', 'Requests that failed or got a 5xx response', 'errors'),
+                        ('retries_total', 'Retried requests', 'retries'),
+                        ('throttled_total', 'Responses with status 429', 'throttled'),
+                        ('request_bytes_total', 'Request body bytes sent', 'request_bytes'),
+                        ('response_bytes_total', 'Response body bytes received', 'response_bytes'))
+            for name, help_text, attribute in counters:
+                lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} counter")
+                for endpoint, metrics in endpoints:
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}{{endpoint="{endpoint}"}} {getattr(metrics, attribute)}')
+
+            name = f"{PROMETHEUS_PREFIX}_request_duration_seconds"
+            lines.append(f"# HELP {name} Request latency")
+            lines.append(f"# TYPE {name} histogram")
+            for endpoint, metrics in endpoints:
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], metrics.buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {metrics.latency_sum:.6f}')
+                lines.append(f'{name}_count{{endpoint="{endpoint}"}} {metrics.count}')
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path: str=API_METRICS_PATH):
+        '''
+        Writes the metrics to path, in the Prometheus text format when path
+        ends with .prom and as JSON otherwise. Nothing is written without a
+        path.
+
+        @param  path: File to write, defaults to the api_metrics_path setting
+        @return:      None
+        '''
+        if not path:
+            return
+        if path.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps({'started': self.started, 'endpoints': self.as_dict()}, indent=2)
+        try:
+            with open(path, 'w') as metrics_file:
+                metrics_file.write(content)
+        except OSError as e:
+            logging.warning(f"Could not write API metrics to {path}: {e}")
+
+
+class MetricsAdapter(BaseAdapter):
+    '''
+    MetricsAdapter sits in front of a session's adapter and records every
+    request it sends in an ApiMetrics object.
+    '''
+
+    def __init__(self, metrics: ApiMetrics, adapter):
+        '''
+        Construct a new 'MetricsAdapter' object.
+
+        @param metrics: ApiMetrics the adapter reports to
+        @param adapter: Adapter requests are sent with
+        @return:        None
+        '''
+        super().__init__()
+        self.metrics = metrics
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.adapter.send(request, **kwargs)
+            if not kwargs.get('stream'):
+                # Reads the body here so the latency includes its download
+                response.content
+        except Exception:
+            self.metrics.record(request, None, time.perf_counter() - start, error=True)
+            raise
+        self.metrics.record(request, response, time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def get_api_metrics():
+    '''
+    Returns the ApiMetrics shared by every client of the worker process.
+
+    @rtype:  ApiMetrics
+    @return: Shared metrics
+    '''
+    global _api_metrics
+    with _api_metrics_lock:
+        if _api_metrics is None:
+            _api_metrics = ApiMetrics()
+    return _api_metrics
+
+def instrument_adapter(adapter):
+    '''
+    Returns adapter behind a MetricsAdapter.
+
+    @param  adapter: requests adapter
+    @rtype:          MetricsAdapter
+    @return:         Adapter to mount
+    '''
+    return MetricsAdapter(get_api_metrics(), adapter)
+
+def instrument_rest_session(rest_session):
+    '''
+    Makes the requests of a Meraki SDK RestSession count under the SDK
+    operation that sent them, with the SDK's own retries as retries.
+
+    @param  rest_session: meraki.rest_session.RestSession
+    @return:              None
+    '''
+    request = rest_session.request
+    metrics = get_api_metrics()
+
+    def instrumented_request(metadata, method, url, **kwargs):
+        with metrics.operation(metadata.get('operation') or get_endpoint_template(method, url)):
+            return request(metadata, method, url, **kwargs)
+
+    rest_session.request = instrumented_request
@@ -1,27 +1,37 @@
-import os
-import meraki
-
+from __app__.shared_code.dashboard import get_dashboard
 from __app__.shared_code.interface import Interface
+from __app__.shared_code.uplinks import UplinkSnapshot
 
-API_KEY = API_KEY = os.environ.get('meraki_api_key')
 FIRMWARE = ['wired-15', 'wired-16', 'wired-17']
 NOT_CONNECTED = 'Not connected'
 
+def is_firmware_compliant(firmware: str):
+    '''
+    Return if a firmware version is compliant.
+
+    @param  firmware: Firmware version e.g. wired-16-13
+    @rtype:           boolean
+    @return:          True / False
+    '''
+    return (firmware or '')[0:8] in FIRMWARE
+
 class MX():
     '''
     MX encapsulates the information of a MX.
     '''
 
-    def __init__(self, network_id: str='', mx: dict={}, org_id=None):
+    def __init__(self, network_id: str='', mx: dict={}, org_id=None, uplinks: UplinkSnapshot=None):
         '''
         Construct a new 'MX' object.
 
         @param   network_id: Network ID of Meraki Dashboard
         @param   mx:         Information of the MX obtianed from getNetworkDevice()
+        @param   uplinks:    UplinkSnapshot of the organization shared within a run
         @return:           None
         '''
         self.network_id = network_id
         self.org_id = org_id
+        self.uplinks = uplinks
         self.name = mx.get('name', '')
         self.model = mx.get('model', '')
         self.firmware = mx.get('firmware', '')
@@ -42,15 +52,10 @@ class MX():
         WAN_1 = 'wan1'
         WAN_2 = 'wan2'
 
-        mdashboard = meraki.DashboardAPI(api_key=API_KEY, suppress_logging=True, print_console=True)
-        org_uplinks = mdashboard.appliance.getOrganizationApplianceUplinkStatuses(self.org_id)
-        
-        uplinks = []
-        
-        for sites in org_uplinks:
-            if sites['networkId'] == self.network_id:
-                uplinks = sites['uplinks']
-        
+        if not self.uplinks:
+            self.uplinks = UplinkSnapshot(self.org_id)
+        uplinks = self.uplinks.get_uplinks(self.network_id, self.serial)
+
         for uplink in uplinks:
             if uplink['status'] != NOT_CONNECTED:
                 if uplink['interface'] == WAN_1:
@@ -68,7 +73,7 @@ class MX():
         WAN_1 = 'wan1'
         WAN_2 = 'wan2'
 
-        mdashboard = meraki.DashboardAPI(api_key=API_KEY, suppress_logging=True, print_console=True)
+        mdashboard = get_dashboard()
         settings = mdashboard.appliance.getNetworkApplianceTrafficShapingUplinkBandwidth(self.network_id)
         self.wan1.update(settings['bandwidthLimits'][WAN_1])
         self.wan2.update(settings['bandwidthLimits'][WAN_2])
@@ -142,4 +147,4 @@ class MX():
         @rtype:  boolean
         @return: True / False
         '''
-        return self.firmware[0:8] in FIRMWARE
+        return is_firmware_compliant(self.firmware)
@@ -0,0 +1,89 @@
+import json
+
+PEER_UPDATE_FIELDS = ('secret', 'privateSubnets')
+
+def _serialize_peers(peers: list):
+    return json.dumps(peers, sort_keys=True, separators=(',', ':'))
+
+
+class PeerTable():
+    '''
+    PeerTable holds the organization's third party VPN peers indexed by
+    peer name, so reconciling a network finds its X and X-sec peers
+    without scanning the peer list. Peers keep the order they had in the
+    dashboard, new peers are appended, and the Meraki payload is built
+    once when all changes are merged.
+    '''
+
+    def __init__(self, peers: list):
+        '''
+        Construct a new 'PeerTable' object.
+
+        @param peers: Peers from getOrganizationApplianceVpnThirdPartyVPNPeers()
+        @return:      None
+        '''
+        self._peers = []
+        self._by_name = {}
+        self._original = _serialize_peers(peers)
+        for peer in peers:
+            self._add(peer)
+
+    def _add(self, peer: dict):
+        self._peers.append(peer)
+        self._by_name.setdefault(peer['name'], []).append(peer)
+
+    def __contains__(self, name: str):
+        return name in self._by_name
+
+    def __len__(self):
+        return len(self._peers)
+
+    def get(self, name: str):
+        '''
+        Returns the peer named name.
+
+        @param  name: Peer name e.g. site1 or site1-sec
+        @rtype:       dict or None
+        @return:      Peer
+        '''
+        peers = self._by_name.get(name)
+        return peers[0] if peers else None
+
+    def upsert(self, peer: dict, fields: tuple=PEER_UPDATE_FIELDS):
+        '''
+        Adds peer, or updates fields of the existing peers with its name.
+        networkTags are only updated when listed in fields, as failover
+        moves them between X and X-sec.
+
+        @param  peer:   Peer built by get_meraki_ipsec_config()
+        @param  fields: Keys copied to an existing peer, e.g. secret, privateSubnets, networkTags
+        @rtype:         boolean
+        @return:        True if the peer was added
+        '''
+        existing_peers = self._by_name.get(peer['name'])
+        if not existing_peers:
+            self._add(peer)
+            return True
+
+        for existing_peer in existing_peers:
+            for field in fields:
+                existing_peer[field] = peer[field]
+        return False
+
+    def to_payload(self):
+        '''
+        Returns the peers as expected by updateOrganizationApplianceVpnThirdPartyVPNPeers().
+
+        @rtype:  list
+        @return: Peers
+        '''
+        return list(self._peers)
+
+    def is_changed(self):
+        '''
+        Checks if the peers differ from the ones the table was built from.
+
+        @rtype:  boolean
+        @return: True or False
+        '''
+        return _serialize_peers(self._peers) != self._original
@@ -0,0 +1,101 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from __app__.shared_code.cassette import wrap_adapter
+from __app__.shared_code.metrics import instrument_adapter
+from __app__.shared_code.ratelimit import RateLimitedAdapter, TokenBucket
+
+class ConnectionStats():
+    '''
+    ConnectionStats counts the requests sent through a PooledAdapter and
+    how many new connections had to be opened for them.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.opened = 0
+
+    def add(self, requests: int=0, opened: int=0):
+        with self._lock:
+            self.requests += requests
+            self.opened += opened
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.opened = 0
+
+    def as_dict(self):
+        '''
+        Returns the counters. Every request that did not open a
+        connection reused a pooled one.
+
+        @rtype:  dict
+        @return: Requests, opened and reused connections
+        '''
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'opened': self.opened,
+                'reused': max(self.requests - self.opened, 0)
+            }
+
+
+def _counting_pool(pool_class, stats: ConnectionStats):
+    class CountingPool(pool_class):
+        def _new_conn(self):
+            stats.add(opened=1)
+            return super()._new_conn()
+    return CountingPool
+
+
+class PooledAdapter(HTTPAdapter):
+    '''
+    PooledAdapter is a keep-alive HTTPAdapter that records connection
+    reuse in a ConnectionStats object.
+    '''
+
+    def __init__(self, stats: ConnectionStats, pool_connections: int=4, pool_maxsize: int=16, **kwargs):
+        '''
+        Construct a new 'PooledAdapter' object.
+
+        @param stats:            ConnectionStats the adapter reports to
+        @param pool_connections: Number of host pools to keep
+        @param pool_maxsize:     Connections kept alive per host
+        @return:                 None
+        '''
+        self.stats = stats
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.stats),
+            'https': _counting_pool(HTTPSConnectionPool, self.stats)
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.add(requests=1)
+        return super().send(request, **kwargs)
+
+
+def mount_pooled_adapter(session: requests.Session, adapter: PooledAdapter, bucket: TokenBucket=None):
+    '''
+    Mounts adapter on session for http and https, behind the API metrics
+    and behind the cassette when one is recording or replaying. With a
+    bucket, every request waits for a token first.
+
+    @param  session: requests session
+    @param  adapter: PooledAdapter
+    @param  bucket:  TokenBucket limiting the session's request rate
+    @return:         None
+    '''
+    adapter = instrument_adapter(wrap_adapter(adapter))
+    if bucket is not None:
+        adapter = RateLimitedAdapter(bucket, adapter)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
@@ -0,0 +1,215 @@
+import ipaddress
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'MVPX'
+VERSION = 1
+HEADER = struct.Struct('>4sIIII')
+V4_RECORD = struct.Struct('>III')
+V6_RECORD = struct.Struct('>16s16sI')
+OFFSET = struct.Struct('>I')
+
+def _parse_dump_line(line: str):
+    '''
+    Parses a line of an IP prefix dump. Two layouts are understood:
+    "<prefix> <organization>" (tab, comma or space separated) and the
+    iptoasn layout "<first ip>\\t<last ip>\\t<asn>\\t<country>\\t<organization>".
+
+    @param  line: Line of the dump file
+    @rtype:       tuple or None
+    @return:      (first address, last address, organization)
+    '''
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+
+    fields = line.split('\t')
+    if len(fields) >= 5 and '/' not in fields[0]:
+        first = ipaddress.ip_address(fields[0])
+        last = ipaddress.ip_address(fields[1])
+        organization = fields[-1].strip()
+    else:
+        for separator in ('\t', ',', ' '):
+            if separator in line:
+                prefix, organization = line.split(separator, 1)
+                break
+        else:
+            return None
+        network = ipaddress.ip_network(prefix.strip(), strict=False)
+        first, last = network[0], network[-1]
+        organization = organization.strip()
+
+    if not organization or organization.lower() == 'not routed':
+        return None
+    return first, last, organization
+
+def _flatten(intervals: list):
+    '''
+    Turns possibly nested address intervals into sorted, disjoint
+    intervals where the most specific interval wins. Adjacent intervals
+    of the same organization are merged.
+
+    @param  intervals: List of (first, last, organization) as integers
+    @rtype:            list
+    @return:           Sorted list of disjoint (first, last, organization)
+    '''
+    intervals.sort(key=lambda interval: (interval[0], -interval[1]))
+    result = []
+    stack = []
+    position = 0
+
+    def emit(upto):
+        nonlocal position
+        if stack and position <= upto:
+            if result and result[-1][2] == stack[-1][1] and result[-1][1] + 1 == position:
+                result[-1] = (result[-1][0], upto, stack[-1][1])
+            else:
+                result.append((position, upto, stack[-1][1]))
+        position = upto + 1
+
+    for first, last, organization in intervals:
+        while stack and stack[-1][0] < first:
+            emit(stack[-1][0])
+            stack.pop()
+        if stack:
+            emit(first - 1)
+            last = min(last, stack[-1][0])
+        else:
+            position = first
+        stack.append((last, organization))
+
+    while stack:
+        emit(stack[-1][0])
+        stack.pop()
+
+    return result
+
+def build_prefix_index(dump_path: str, index_path: str):
+    '''
+    Builds a prefix index file from an IP prefix to organization dump.
+
+    @param  dump_path:  Path of the prefix dump
+    @param  index_path: Path of the index file to write
+    @rtype:             int
+    @return:            Number of intervals written
+    '''
+    intervals = {4: [], 6: []}
+    with open(dump_path, encoding='utf-8', errors='replace') as dump:
+        for line in dump:
+            try:
+                parsed = _parse_dump_line(line)
+            except ValueError:
+                continue
+            if parsed:
+                first, last, organization = parsed
+                intervals[first.version].append((int(first), int(last), organization))
+
+    organizations = {}
+    tables = {}
+    for version in (4, 6):
+        tables[version] = [(first, last, organizations.setdefault(organization, len(organizations)))
+                           for first, last, organization in _flatten(intervals[version])]
+
+    v4_size = len(tables[4]) * V4_RECORD.size
+    v6_size = len(tables[6]) * V6_RECORD.size
+    strings_offset = HEADER.size + v4_size + v6_size
+
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as index:
+        index.write(HEADER.pack(MAGIC, VERSION, len(tables[4]), len(tables[6]), strings_offset))
+        for first, last, organization_id in tables[4]:
+            index.write(V4_RECORD.pack(first, last, organization_id))
+        for first, last, organization_id in tables[6]:
+            index.write(V6_RECORD.pack(first.to_bytes(16, 'big'), last.to_bytes(16, 'big'), organization_id))
+
+        encoded = [organization.encode('utf-8') for organization in organizations]
+        offset = OFFSET.size * (len(encoded) + 1)
+        for name in encoded:
+            index.write(OFFSET.pack(offset))
+            offset += len(name)
+        index.write(OFFSET.pack(offset))
+        for name in encoded:
+            index.write(name)
+    os.replace(temp_path, index_path)
+
+    return len(tables[4]) + len(tables[6])
+
+
+class PrefixIndex():
+    '''
+    PrefixIndex answers which organization an IP address belongs to from
+    an index file written by build_prefix_index(). The file is memory
+    mapped and binary searched, so lookups need no network and the index
+    is shared between workers through the page cache.
+    '''
+
+    def __init__(self, index_path: str):
+        '''
+        Construct a new 'PrefixIndex' object.
+
+        @param index_path: Path of the index file
+        @return:           None
+        '''
+        with open(index_path, 'rb') as index:
+            self._map = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._v4_count, self._v6_count, self._strings_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{index_path} is not a prefix index")
+
+        self._v4_offset = HEADER.size
+        self._v6_offset = self._v4_offset + self._v4_count * V4_RECORD.size
+
+    def __len__(self):
+        return self._v4_count + self._v6_count
+
+    def _organization(self, organization_id: int):
+        start, end = struct.unpack_from('>II', self._map, self._strings_offset + organization_id * OFFSET.size)
+        return self._map[self._strings_offset + start:self._strings_offset + end].decode('utf-8')
+
+    def lookup(self, ip: str):
+        '''
+        Returns the organization the IP address belongs to.
+
+        @param  ip: IPv4 or IPv6 address
+        @rtype:     str or None
+        @return:    Organization name, None if the address is not indexed
+        '''
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        if address.version == 4:
+            record, base, count = V4_RECORD, self._v4_offset, self._v4_count
+            key = int(address)
+        else:
+            record, base, count = V6_RECORD, self._v6_offset, self._v6_count
+            key = address.packed
+
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if record.unpack_from(self._map, base + middle * record.size)[0] <= key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == 0:
+            return None
+        first, last, organization_id = record.unpack_from(self._map, base + (low - 1) * record.size)
+        if key > last:
+            return None
+        return self._organization(organization_id)
+
+    def close(self):
+        self._map.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(f"usage: {sys.argv[0]} <prefix dump> <index file>")
+    print(f"{build_prefix_index(sys.argv[1], sys.argv[2])} intervals written to {sys.argv[2]}")
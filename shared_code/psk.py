@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+from passwordgenerator import pwgenerator
+
+PSK_ROTATION_DAYS = float(os.environ.get('psk_rotation_days', 0))
+
+def get_psk_meta_key(site: str):
+    '''
+    Returns the name of the DesiredStateStore value holding the time the
+    key of site was last rotated.
+
+    @param  site: Site name, i.e. the name of its primary peer
+    @rtype:       str
+    @return:      Name of the value
+    '''
+    return f"psk:{site}"
+
+class PskManager():
+    '''
+    PskManager keeps one pre-shared key per site stable across runs. The
+    key already configured on the site's Meraki peers is reused, and a new
+    one is generated only for sites without a key, when rotation is
+    requested, or when the key is older than rotation_days. Only rotation
+    times are persisted, in the DesiredStateStore; the keys themselves
+    stay in the dashboard and in Azure.
+    '''
+
+    def __init__(self, peers: list, desired_state, rotation_days: float=PSK_ROTATION_DAYS):
+        '''
+        Construct a new 'PskManager' object.
+
+        @param peers:         Peers from getOrganizationApplianceVpnThirdPartyVPNPeers()
+        @param desired_state: DesiredStateStore rotation times are kept in
+        @param rotation_days: Days after which a key is rotated, 0 to rotate on request only
+        @return:              None
+        '''
+        self.desired_state = desired_state
+        self.rotation_days = rotation_days
+        self._lock = threading.Lock()
+        self._secrets = {}
+        for peer in peers:
+            if peer.get('secret'):
+                self._secrets.setdefault(peer['name'], peer['secret'])
+        self._peer_secrets = dict(self._secrets)
+
+    def get_psk(self, site: str, rotate: bool=False):
+        '''
+        Returns the pre-shared key of a site.
+
+        @param  site:   Site name, i.e. the name of its primary peer
+        @param  rotate: Generate a new key even if the current one is not due
+        @rtype:         tuple
+        @return:        Key and True if it is a new key
+        '''
+        with self._lock:
+            psk = self._secrets.get(site) or self._secrets.get(f"{site}-sec")
+            rotated_at = self.desired_state.get_meta(get_psk_meta_key(site))
+
+            if psk and rotated_at is None:
+                # Key from before rotation times were kept; its age starts now
+                self.desired_state.set_meta(get_psk_meta_key(site), time.time())
+                rotated_at = time.time()
+
+            due = self.rotation_days > 0 and rotated_at is not None and \
+                time.time() - rotated_at >= self.rotation_days * 86400
+            if psk and not rotate and not due:
+                return psk, False
+
+            psk = pwgenerator.generate()
+            self._secrets[site] = psk
+            return psk, True
+
+    def get_peer_psk(self, site: str):
+        '''
+        Returns the key of a site's Meraki peers as they were when the
+        manager was built, i.e. the key last applied on both sides. Keys
+        generated since are not returned.
+
+        @param  site: Site name, i.e. the name of its primary peer
+        @rtype:       str or None
+        @return:      Key, None if the site has no peers
+        '''
+        return self._peer_secrets.get(site) or self._peer_secrets.get(f"{site}-sec")
+
+    def record_rotation(self, site: str):
+        '''
+        Records that a new key of site was applied on both sides.
+
+        @param  site: Site name
+        @return:      None
+        '''
+        self.desired_state.set_meta(get_psk_meta_key(site), time.time())
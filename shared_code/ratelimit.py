@@ -0,0 +1,235 @@
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from requests.adapters import BaseAdapter
+
+# Meraki allows 10 requests per second per organization, with a burst of 10 more
+MERAKI_RATE_LIMIT = float(os.environ.get('meraki_rate_limit', 10))
+MERAKI_RATE_BURST = float(os.environ.get('meraki_rate_burst', 10))
+MERAKI_429_MAX_RETRIES = int(os.environ.get('meraki_429_max_retries', 8))
+# The budget is per organization, but each worker process holds its own bucket. When the durable
+# orchestration scales out, every worker gets an equal share of it: meraki_rate_limit_workers
+# defaults to the app's instance limit (WEBSITE_MAX_DYNAMIC_APPLICATION_SCALE_OUT). Without either,
+# it is None and the budget is shared among the activities the orchestration runs at once.
+# Idle workers leave their share unused; the 429 backoff covers workers beyond the setting.
+if os.environ.get('use_durable_orchestration', 'No') == 'Yes':
+    _workers = os.environ.get('meraki_rate_limit_workers') or \
+        os.environ.get('WEBSITE_MAX_DYNAMIC_APPLICATION_SCALE_OUT')
+    if not _workers:
+        logging.warning("Neither meraki_rate_limit_workers nor the app's instance limit is set, the Meraki rate "
+                        "budget is shared among the activities each step of the orchestration runs at once.")
+else:
+    _workers = os.environ.get('meraki_rate_limit_workers', 1)
+MERAKI_RATE_LIMIT_WORKERS = max(int(_workers), 1) if _workers else None
+# After a 429 the rate drops to RATE_DECREASE of itself, never below RATE_FLOOR of the budget,
+# and climbs back by RATE_INCREASE of the budget per successful request
+RATE_DECREASE = 0.7
+RATE_FLOOR = 0.2
+RATE_INCREASE = 0.02
+DEFAULT_RETRY_AFTER = 1.0
+
+# Lanes of the bucket, the lowest is served first
+FAILOVER = 0
+DEFAULT = 1
+BULK = 2
+
+_lane = threading.local()
+
+@contextlib.contextmanager
+def request_priority(lane: int):
+    '''
+    Sends the Meraki requests of the current thread within the context in
+    lane. Works as a decorator too.
+
+    @param  lane: FAILOVER, DEFAULT or BULK
+    @return:      Context manager
+    '''
+    previous = getattr(_lane, 'lane', DEFAULT)
+    _lane.lane = lane
+    try:
+        yield
+    finally:
+        _lane.lane = previous
+
+def get_request_priority():
+    return getattr(_lane, 'lane', DEFAULT)
+
+
+class TokenBucket():
+    '''
+    TokenBucket spreads requests over a budget of requests per second. A
+    request waits for a token, and waiting requests are served lowest lane
+    first, then in arrival order. A 429 pauses every lane for its
+    Retry-After and lowers the rate, which then climbs back to the budget
+    while requests succeed.
+    '''
+
+    def __init__(self, rate: float=MERAKI_RATE_LIMIT, burst: float=MERAKI_RATE_BURST):
+        '''
+        Construct a new 'TokenBucket' object.
+
+        @param rate:  Budget in requests per second
+        @param burst: Tokens the bucket holds
+        @return:      None
+        '''
+        self.budget = rate
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.paused_until = 0.0
+        self.acquired = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, lane: int=DEFAULT):
+        '''
+        Waits until the request may be sent.
+
+        @param  lane: Lane of the request
+        @rtype:       float
+        @return:      Seconds waited
+        '''
+        start = time.monotonic()
+        entry = (lane, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiting[0] is not entry:
+                        # The first waiter wakes the others once it got its token
+                        self._condition.wait()
+                    elif now < self.paused_until:
+                        self._condition.wait(self.paused_until - now)
+                    elif self.tokens < 1:
+                        self._condition.wait((1 - self.tokens) / self.rate)
+                    else:
+                        self.tokens -= 1
+                        break
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+            waited = time.monotonic() - start
+            self.acquired += 1
+            self.wait_time += waited
+        return waited
+
+    def on_throttled(self, retry_after: float):
+        '''
+        Pauses the bucket for retry_after seconds and lowers the rate.
+
+        @param  retry_after: Seconds requested by the 429 response
+        @return:             None
+        '''
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            self.throttled += 1
+            self.rate = max(self.budget * RATE_FLOOR, self.rate * RATE_DECREASE)
+            self.paused_until = max(self.paused_until, now + retry_after)
+            self.tokens = 0
+            self._condition.notify_all()
+
+    def set_budget(self, rate: float, burst: float):
+        '''
+        Changes the budget of the bucket. A rate lowered after a 429 stays
+        lowered by the same ratio.
+
+        @param  rate:  Budget in requests per second
+        @param  burst: Tokens the bucket holds
+        @return:       None
+        '''
+        with self._condition:
+            self._refill(time.monotonic())
+            self.rate = self.rate * rate / self.budget
+            self.budget = rate
+            self.burst = max(burst, 1)
+            self.tokens = min(self.tokens, self.burst)
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            if self.rate < self.budget:
+                self.rate = min(self.budget, self.rate + self.budget * RATE_INCREASE)
+
+    def stats(self):
+        '''
+        Returns the counters of the bucket.
+
+        @rtype:  dict
+        @return: Requests, 429s, seconds waited and current rate
+        '''
+        with self._condition:
+            return {'requests': self.acquired, 'throttled': self.throttled,
+                    'waitTime': round(self.wait_time, 3), 'rate': round(self.rate, 2)}
+
+    def reset_stats(self):
+        with self._condition:
+            self.acquired = 0
+            self.throttled = 0
+            self.wait_time = 0.0
+
+
+def _get_retry_after(response):
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class RateLimitedAdapter(BaseAdapter):
+    '''
+    RateLimitedAdapter sends every request of a session through a
+    TokenBucket, in the lane of the calling thread. Requests answered with
+    429 are sent again once the bucket allows it, up to max_retries times,
+    so a sustained 429 does not exhaust the few retries of the caller.
+    '''
+
+    def __init__(self, bucket: TokenBucket, adapter, max_retries: int=MERAKI_429_MAX_RETRIES):
+        '''
+        Construct a new 'RateLimitedAdapter' object.
+
+        @param bucket:      TokenBucket shared by the requests of the organization
+        @param adapter:     Adapter requests are sent with
+        @param max_retries: Times a request answered with 429 is sent again
+        @return:            None
+        '''
+        super().__init__()
+        self.bucket = bucket
+        self.adapter = adapter
+        self.max_retries = max_retries
+
+    def send(self, request, **kwargs):
+        lane = get_request_priority()
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire(lane)
+            response = self.adapter.send(request, **kwargs)
+            if response.status_code != 429:
+                self.bucket.on_success()
+                return response
+
+            retry_after = _get_retry_after(response)
+            self.bucket.on_throttled(retry_after)
+            if attempt < self.max_retries:
+                logging.warning(f"{request.method} {request.path_url} was rate limited, "
+                                f"retrying in {retry_after} seconds")
+                response.close()
+        return response
+
+    def close(self):
+        self.adapter.close()
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from __app__.shared_code.dashboard import get_dashboard
+
+class OrgSnapshot():
+    '''
+    OrgSnapshot holds an org-wide list of Meraki Dashboard, fetched once
+    from endpoint and indexed by serial number and network ID, so lookups
+    made during a run need no further API call.
+    '''
+
+    def __init__(self, org_id: str, endpoint: tuple, dashboard=None):
+        '''
+        Construct a new 'OrgSnapshot' object. Nothing is fetched until
+        the first lookup or an explicit call to refresh().
+
+        @param org_id:    Organization ID of Meraki Dashboard
+        @param endpoint:  SDK section and operation returning the list, e.g. ('organizations', 'getOrganizationDevices')
+        @param dashboard: meraki.DashboardAPI used to fetch the list
+        @return:          None
+        '''
+        self.org_id = org_id
+        self.endpoint = endpoint
+        self.fetched_at = None
+        self._dashboard = dashboard
+        self._by_serial = {}
+        self._by_network = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        '''
+        Fetches the list of the organization and rebuilds the indexes.
+
+        @return: None
+        '''
+        if not self._dashboard:
+            self._dashboard = get_dashboard()
+        section, operation = self.endpoint
+        items = getattr(getattr(self._dashboard, section), operation)(self.org_id, total_pages='all')
+
+        by_serial = {}
+        by_network = {}
+        for item in items:
+            if item.get('serial'):
+                by_serial[item['serial']] = item
+            if item.get('networkId'):
+                by_network.setdefault(item['networkId'], []).append(item)
+
+        self._by_serial = by_serial
+        self._by_network = by_network
+        self.fetched_at = time.time()
+
+    def _ensure_fetched(self):
+        if self.fetched_at is None:
+            with self._lock:
+                if self.fetched_at is None:
+                    self.refresh()
+
+    def is_stale(self, max_age: float):
+        '''
+        Checks if the snapshot was never fetched or is older than max_age.
+
+        @param  max_age: Maximum age in seconds
+        @rtype:          boolean
+        @return:         True or False
+        '''
+        return self.fetched_at is None or time.time() - self.fetched_at > max_age
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+DESIRED_STATE_PATH = os.environ.get('desired_state_path',
+                                    os.path.join(tempfile.gettempdir(), 'meraki_vwan_desired_state.json'))
+
+def get_payload_hash(payload):
+    '''
+    Returns a content hash of a JSON serializable payload. Keys are sorted
+    so equal payloads always hash the same.
+
+    @param  payload: JSON serializable payload
+    @rtype:          str
+    @return:         SHA-256 hex digest
+    '''
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class DesiredStateStore():
+    '''
+    DesiredStateStore keeps a content hash of the configuration last
+    applied successfully to each network, persisted across invocations,
+    so unchanged networks can skip their Azure writes. Small run-level
+    values, such as the time of the last full sweep, are kept alongside.
+    A store can also be built from a state passed in, as the durable
+    orchestration does; such a store is not persisted and hands its
+    changes back with get_changes().
+    '''
+
+    def __init__(self, path: str=DESIRED_STATE_PATH, state: dict=None):
+        '''
+        Construct a new 'DesiredStateStore' object and load the hashes
+        found in path, or in state.
+
+        @param path:  File the store is persisted to
+        @param state: {'networks': dict, 'meta': dict} to start from instead of path
+        @return:      None
+        '''
+        self.path = path if state is None else None
+        self.writes_avoided = 0
+        self._lock = threading.Lock()
+        self._changed_hashes = set()
+        self._changed_meta = set()
+        if state is not None:
+            self._hashes = dict(state.get('networks', {}))
+            self._meta = dict(state.get('meta', {}))
+            return
+        try:
+            with open(path) as state_file:
+                state = json.load(state_file)
+            self._hashes = state.get('networks', {})
+            self._meta = state.get('meta', {})
+        except (OSError, ValueError, AttributeError):
+            self._hashes = {}
+            self._meta = {}
+
+    def is_unchanged(self, key: str, payload_hash: str):
+        '''
+        Checks if the hash is the one of the configuration last applied
+        for key.
+
+        @param  key:          Network ID
+        @param  payload_hash: Hash returned by get_payload_hash()
+        @rtype:               boolean
+        @return:              True or False
+        '''
+        with self._lock:
+            return self._hashes.get(key) == payload_hash
+
+    def record(self, key: str, payload_hash: str):
+        '''
+        Records the hash of the configuration applied for key.
+
+        @param  key:          Network ID
+        @param  payload_hash: Hash returned by get_payload_hash()
+        @return:              None
+        '''
+        with self._lock:
+            self._hashes[key] = payload_hash
+            self._changed_hashes.add(key)
+
+    def add_writes_avoided(self, count: int):
+        with self._lock:
+            self.writes_avoided += count
+
+    def get_meta(self, key: str, default=None):
+        '''
+        Returns a run-level value.
+
+        @param  key:     Name of the value
+        @param  default: Returned when the value was never set
+        @rtype:          any
+        @return:         Stored value
+        '''
+        with self._lock:
+            return self._meta.get(key, default)
+
+    def set_meta(self, key: str, value):
+        '''
+        Stores a JSON serializable run-level value.
+
+        @param  key:   Name of the value
+        @param  value: Value
+        @return:       None
+        '''
+        with self._lock:
+            self._meta[key] = value
+            self._changed_meta.add(key)
+
+    def get_state(self, keys: list=(), meta_keys: list=()):
+        '''
+        Returns the recorded hashes of keys and the run-level values of
+        meta_keys, as a state another store can be built from.
+
+        @param  keys:      Network IDs
+        @param  meta_keys: Names of run-level values
+        @rtype:            dict
+        @return:           {'networks': dict, 'meta': dict}
+        '''
+        with self._lock:
+            return {'networks': {key: self._hashes[key] for key in keys if key in self._hashes},
+                    'meta': {key: self._meta[key] for key in meta_keys if key in self._meta}}
+
+    def get_changes(self):
+        '''
+        Returns the hashes and run-level values recorded since the store
+        was built.
+
+        @rtype:  dict
+        @return: {'networks': dict, 'meta': dict}
+        '''
+        with self._lock:
+            return {'networks': {key: self._hashes[key] for key in self._changed_hashes},
+                    'meta': {key: self._meta[key] for key in self._changed_meta}}
+
+    def save(self):
+        '''
+        Writes the store to self.path, replacing the file atomically.
+
+        @return: None
+        '''
+        if self.path is None:
+            return
+        with self._lock:
+            state = {'networks': dict(self._hashes), 'meta': dict(self._meta)}
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as state_file:
+                json.dump(state, state_file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not persist desired state to {self.path}: {e}")
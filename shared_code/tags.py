@@ -0,0 +1,66 @@
+import logging
+import re
+
+class TagIndex():
+    '''
+    TagIndex maps Virtual WAN hubs to the Meraki networks tagged for them.
+    It is built once per run from getOrganizationNetworks with a
+    precompiled primary tag pattern, so hub fan-out needs a single pass
+    over the networks' tags.
+    '''
+
+    def __init__(self, networks: list, primary_tag_pattern):
+        '''
+        Construct a new 'TagIndex' object.
+
+        @param networks:            Networks from getOrganizationNetworks()
+        @param primary_tag_pattern: Compiled pattern (or regex) of the primary vwan tag,
+                                    group 1 being the hub name
+        @return:                    None
+        '''
+        if isinstance(primary_tag_pattern, str):
+            primary_tag_pattern = re.compile(primary_tag_pattern)
+
+        self.hubs = []
+        self._networks_by_hub = {}
+        self._primary_tag = {}
+
+        for network in networks:
+            network_hubs = []
+            for tag in network['tags'] or []:
+                match = primary_tag_pattern.match(tag)
+                if not match:
+                    continue
+                self._primary_tag[network['id']] = tag
+                hub_key = match.group(1).lower()
+                if hub_key not in self._networks_by_hub:
+                    self._networks_by_hub[hub_key] = []
+                    self.hubs.append(match.group(1))
+                if hub_key not in network_hubs:
+                    network_hubs.append(hub_key)
+                    self._networks_by_hub[hub_key].append(network)
+
+            if len(network_hubs) > 1:
+                logging.warning(f"Multiple tagged networks for {network['name']} exist. This is not a supported configuration and may " \
+                                "cause undesirable behavior. Please ensure only one tag exists for Virtual WAN on this network.")
+
+    def get_networks(self, hub: str):
+        '''
+        Returns the networks tagged for a hub, in the order of the
+        organization's networks.
+
+        @param  hub: Virtual WAN hub name, case insensitive
+        @rtype:      list
+        @return:     Networks from getOrganizationNetworks()
+        '''
+        return self._networks_by_hub.get(hub.lower(), [])
+
+    def get_primary_tag(self, network_id: str):
+        '''
+        Returns the primary vwan tag of a network.
+
+        @param  network_id: Network ID of Meraki Dashboard
+        @rtype:             str or None
+        @return:            Tag e.g. vwan-hub1-1
+        '''
+        return self._primary_tag.get(network_id)
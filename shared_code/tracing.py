@@ -0,0 +1,227 @@
+import collections
+import contextlib
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+TRACE_PATH = os.environ.get('trace_path', '')
+PROFILER = os.environ.get('profiler', '').lower()
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+PROFILE_PATH = os.environ.get('profile_path', os.path.join(
+    tempfile.gettempdir(), 'meraki_vwan_profile.prof' if PROFILER == CPROFILE else 'meraki_vwan_profile.folded'))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('profile_sample_interval', 0.005))
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+class Tracer():
+    '''
+    Tracer records named spans around the phases of a run and exports
+    them in the Chrome trace event format, which chrome://tracing,
+    Perfetto and speedscope open. Spans of worker threads show up on
+    their own tracks. Nothing is recorded without a path.
+    '''
+
+    def __init__(self, path: str=TRACE_PATH):
+        '''
+        Construct a new 'Tracer' object.
+
+        @param path: File the trace is written to, empty to disable tracing
+        @return:     None
+        '''
+        self.path = path
+        self._lock = threading.Lock()
+        self._events = []
+        self._thread_names = {}
+        self._origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args):
+        '''
+        Records the time spent within the context as a span.
+
+        @param  name: Phase name e.g. "effective routes"
+        @param  args: Details shown with the span e.g. hub="hub-1"
+        @return:      Context manager
+        '''
+        if not self.path:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            thread = threading.current_thread()
+            event = {
+                'name': name,
+                'ph': 'X',
+                'ts': round((start - self._origin) * 1e6, 1),
+                'dur': round((end - start) * 1e6, 1),
+                'pid': os.getpid(),
+                'tid': thread.ident
+            }
+            if args:
+                event['args'] = {key: str(value) for key, value in args.items()}
+            with self._lock:
+                self._events.append(event)
+                self._thread_names[thread.ident] = thread.name
+
+    def reset(self):
+        with self._lock:
+            self._events = []
+            self._thread_names = {}
+            self._origin = time.perf_counter()
+
+    def save(self):
+        '''
+        Writes the spans recorded since the last reset to self.path.
+
+        @return: None
+        '''
+        if not self.path:
+            return
+        with self._lock:
+            events = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                      for tid, name in self._thread_names.items()] + self._events
+        try:
+            with open(self.path, 'w') as trace_file:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+            logging.info(f"Wrote {len(events)} trace events to {self.path}")
+        except OSError as e:
+            logging.warning(f"Could not write trace {self.path}: {e}")
+
+
+class SamplingProfiler():
+    '''
+    SamplingProfiler takes the stack of every thread each interval from a
+    background thread, so the worker threads of a run are profiled too,
+    and writes the stacks in the folded format flame graph tools read.
+    '''
+
+    def __init__(self, path: str=PROFILE_PATH, interval: float=PROFILE_SAMPLE_INTERVAL):
+        '''
+        Construct a new 'SamplingProfiler' object.
+
+        @param path:     File the folded stacks are written to
+        @param interval: Seconds between two samples
+        @return:         None
+        '''
+        self.path = path
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own_thread = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stops sampling and writes the folded stacks to self.path.
+
+        @return: None
+        '''
+        self._stopped.set()
+        self._thread.join()
+        try:
+            with open(self.path, 'w') as profile_file:
+                for stack, count in self.samples.most_common():
+                    profile_file.write(f"{stack} {count}\n")
+            logging.info(f"Wrote {sum(self.samples.values())} profile samples to {self.path}")
+        except OSError as e:
+            logging.warning(f"Could not write profile {self.path}: {e}")
+
+
+def get_tracer():
+    '''
+    Returns the Tracer shared by the worker process.
+
+    @rtype:  Tracer
+    @return: Shared tracer
+    '''
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+    return _tracer
+
+def trace_span(name: str, **args):
+    '''
+    Returns a context manager recording a span on the shared tracer.
+
+    @param  name: Phase name
+    @param  args: Details shown with the span
+    @return:      Context manager
+    '''
+    return get_tracer().span(name, **args)
+
+def traced(name: str):
+    '''
+    Decorator recording every call of a function as a span.
+
+    @param  name: Phase name
+    @return:      Decorator
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with trace_span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextlib.contextmanager
+def profile_run(profiler: str=PROFILER, path: str=PROFILE_PATH):
+    '''
+    Profiles the code run within the context when the profiler setting is
+    'cprofile' (thread of the caller only, pstats file) or 'sampling'
+    (every thread, folded stacks).
+
+    @param  profiler: 'cprofile', 'sampling' or empty for none
+    @param  path:     File the profile is written to
+    @return:          Context manager
+    '''
+    if profiler == CPROFILE:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            try:
+                profile.dump_stats(path)
+                logging.info(f"Wrote cProfile statistics to {path}")
+            except OSError as e:
+                logging.warning(f"Could not write profile {path}: {e}")
+    elif profiler == SAMPLING:
+        sampler = SamplingProfiler(path)
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+    else:
+        yield
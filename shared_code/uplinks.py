@@ -0,0 +1,50 @@
+from __app__.shared_code.snapshot import OrgSnapshot
+
+class UplinkSnapshot(OrgSnapshot):
+    '''
+    UplinkSnapshot holds the uplink statuses of every appliance in an
+    organization, so every MX built during a run can read its uplinks
+    without another API call.
+    '''
+
+    def __init__(self, org_id: str, dashboard=None):
+        '''
+        Construct a new 'UplinkSnapshot' object.
+
+        @param org_id:    Organization ID of Meraki Dashboard
+        @param dashboard: meraki.DashboardAPI used to fetch the statuses
+        @return:          None
+        '''
+        super().__init__(org_id, ('appliance', 'getOrganizationApplianceUplinkStatuses'), dashboard)
+
+    def get_uplinks(self, network_id: str, serial: str=None):
+        '''
+        Returns the uplinks of an appliance. The serial number is preferred
+        so the primary and spare of an HA pair get their own uplinks; the
+        last appliance reported for the network is used otherwise.
+
+        @param  network_id: Network ID of Meraki Dashboard
+        @param  serial:     Serial number of the MX
+        @rtype:             list
+        @return:            Uplinks as returned by getOrganizationApplianceUplinkStatuses
+        '''
+        self._ensure_fetched()
+
+        if serial and serial in self._by_serial:
+            return self._by_serial[serial].get('uplinks', [])
+        if network_id in self._by_network:
+            return self._by_network[network_id][-1].get('uplinks', [])
+        return []
+
+    def get_wan_ips(self, network_id: str, serial: str=None):
+        '''
+        Returns the addresses of the WAN interfaces of an appliance, keyed
+        as getDevice returns them.
+
+        @param  network_id: Network ID of Meraki Dashboard
+        @param  serial:     Serial number of the MX
+        @rtype:             dict
+        @return:            wan1Ip and wan2Ip of the interfaces with an address
+        '''
+        return {f"{uplink['interface']}Ip": uplink['ip'] for uplink in self.get_uplinks(network_id, serial)
+                if uplink.get('interface') in ('wan1', 'wan2') and uplink.get('ip')}
@@ -0,0 +1,43 @@
+'''
+Imports the app the way the Functions host does, with the repository as
+the __app__ package.
+'''
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if '__app__' not in sys.modules:
+    package = types.ModuleType('__app__')
+    package.__path__ = [REPO_ROOT]
+    sys.modules['__app__'] = package
+
+FUNCTION_MODULE = '__app__.Meraki-VWAN-Automation'
+
+@pytest.fixture(scope='session')
+def function_app(tmp_path_factory):
+    '''
+    Imports the timer function. Settings are read when modules are
+    imported, so the required ones are given defaults first, and every
+    file the function keeps is placed in a temporary directory.
+    '''
+    state_dir = tmp_path_factory.mktemp('state')
+    environment = {
+        'meraki_api_key': 'f' * 40,
+        'meraki_org_name': 'Test Org',
+        'use_maintenance_window': 'No',
+        'maintenance_time_in_utc': '0',
+        'subscription_id': '00000000-0000-0000-0000-000000000000',
+        'vwan_name': 'test-vwan',
+        'isp_resolver': 'offline',
+        'whois_cache_path': str(state_dir / 'whois-cache.json'),
+        'desired_state_path': str(state_dir / 'state-desired.json'),
+        'token_cache_path': str(state_dir / 'state-token.json')
+    }
+    for name, value in environment.items():
+        os.environ.setdefault(name, value)
+    return importlib.import_module(FUNCTION_MODULE)
@@ -0,0 +1,178 @@
+import types
+
+import pytest
+
+from __app__.shared_code import arm
+
+class FakeResponse():
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.text = str(body)
+
+    def json(self):
+        if self.body is None:
+            raise ValueError('No JSON')
+        return self.body
+
+class FakeSession():
+    def __init__(self, responses, batch_responses=()):
+        self.responses = list(responses)
+        self.batch_responses = list(batch_responses)
+        self.urls = []
+        self.batches = []
+
+    def get(self, url, headers=None):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+    def post(self, url, headers=None, json=None):
+        self.batches.append([request['name'] for request in json['requests']])
+        response = self.batch_responses.pop(0)
+        return response(json['requests']) if callable(response) else response
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=0.0, sleeps=[])
+
+    def sleep(seconds):
+        clock.sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(arm, 'time', types.SimpleNamespace(monotonic=lambda: clock.now, sleep=sleep))
+    return clock
+
+def test_poll_returns_terminal_body(clock):
+    session = FakeSession([FakeResponse(200, {'status': 'Succeeded', 'id': 'op'})])
+
+    assert arm.poll_arm_operation('https://arm/op', {}, session=session) == {'status': 'Succeeded', 'id': 'op'}
+    assert clock.sleeps == [arm.ARM_POLL_INITIAL_DELAY]
+
+def test_poll_honors_retry_after(clock):
+    session = FakeSession([FakeResponse(202, headers={'Retry-After': '7'}),
+                           FakeResponse(200, {'status': 'InProgress'}),
+                           FakeResponse(200, {'status': 'Failed'})])
+
+    assert arm.poll_arm_operation('https://arm/op', {}, retry_after=3, session=session) == {'status': 'Failed'}
+    assert clock.sleeps == [3, 7, arm.ARM_POLL_INITIAL_DELAY * 4]
+
+def test_poll_location_without_body(clock):
+    # A Location URL answers 202 while running and 200 with the resource, or no body, when done
+    session = FakeSession([FakeResponse(202), FakeResponse(200)])
+
+    assert arm.poll_arm_operation('https://arm/location', {}, session=session) == {}
+    assert session.urls == ['https://arm/location', 'https://arm/location']
+
+def test_poll_azure_async_operation(clock):
+    session = FakeSession([FakeResponse(200, {'status': 'InProgress'}),
+                           FakeResponse(200, {'status': 'Succeeded'})])
+
+    assert arm.poll_arm_operation('https://arm/asyncoperation', {}, session=session)['status'] == 'Succeeded'
+    assert len(session.urls) == 2
+
+def test_poll_retries_throttled_and_server_errors(clock):
+    session = FakeSession([FakeResponse(429, headers={'Retry-After': '2'}), FakeResponse(503),
+                           FakeResponse(200, {'status': 'Succeeded'})])
+
+    assert arm.poll_arm_operation('https://arm/op', {}, session=session)['status'] == 'Succeeded'
+    assert clock.sleeps[1] == 2
+
+def test_poll_client_error_returns_none(clock):
+    session = FakeSession([FakeResponse(404, {'error': {'code': 'NotFound'}})])
+
+    assert arm.poll_arm_operation('https://arm/op', {}, session=session) is None
+
+def test_poll_timeout_returns_none(clock):
+    session = FakeSession([FakeResponse(202, headers={'Retry-After': '10'}) for _ in range(5)])
+
+    assert arm.poll_arm_operation('https://arm/op', {}, retry_after=10, timeout=25, session=session) is None
+    assert sum(clock.sleeps) == 25
+
+def test_arm_retry_only_retries_throttled_posts():
+    retry = arm.ArmRetry(total=3, status=3, status_forcelist=arm.ARM_RETRY_STATUSES)
+
+    assert retry.is_retry('POST', 429)
+    assert not retry.is_retry('POST', 500)
+    assert not retry.is_retry('POST', 503)
+    assert retry.is_retry('GET', 500)
+    assert retry.is_retry('PUT', 429)
+    assert not retry.is_retry('GET', 404)
+
+def test_arm_retry_stops_when_exhausted():
+    retry = arm.ArmRetry(total=0, status=0, status_forcelist=arm.ARM_RETRY_STATUSES)
+
+    assert not retry.is_retry('POST', 429)
+
+def batch_answer(statuses):
+    # Answers every request of a batch with the status of its url, 200 by default
+    def answer(requests):
+        return FakeResponse(200, {'responses': [
+            {'name': request['name'], 'httpStatusCode': statuses.get(request['url'], [200]).pop(0),
+             'headers': {'Retry-After': '1'}, 'content': {'url': request['url']}} for request in requests]})
+    return answer
+
+BATCH_REQUESTS = [{'httpMethod': 'PUT', 'url': f"/vpnSites/site{index}"} for index in range(5)]
+
+def test_batch_splits_requests(clock):
+    session = FakeSession([], [batch_answer({}), batch_answer({})])
+
+    responses = arm.send_arm_batch(BATCH_REQUESTS, {}, batch_size=3, session=session)
+
+    assert session.batches == [['0', '1', '2'], ['3', '4']]
+    assert [response['content']['url'] for response in responses] == [request['url'] for request in BATCH_REQUESTS]
+    assert clock.sleeps == []
+
+def test_batch_retries_throttled_and_failed_items(clock):
+    statuses = {'/vpnSites/site1': [429, 200], '/vpnSites/site3': [503, 500, 200]}
+    session = FakeSession([], [batch_answer(statuses) for _ in range(3)])
+
+    responses = arm.send_arm_batch(BATCH_REQUESTS, {}, batch_size=20, session=session)
+
+    assert session.batches == [['0', '1', '2', '3', '4'], ['1', '3'], ['3']]
+    assert [response['httpStatusCode'] for response in responses] == [200] * 5
+    assert clock.sleeps == [1, 1]
+
+def test_batch_keeps_last_status_of_exhausted_item(clock):
+    statuses = {'/vpnSites/site0': [500, 500, 500]}
+    session = FakeSession([], [batch_answer(statuses) for _ in range(3)])
+
+    responses = arm.send_arm_batch(BATCH_REQUESTS[:2], {}, max_retries=2, session=session)
+
+    assert session.batches == [['0', '1'], ['0'], ['0']]
+    assert [response['httpStatusCode'] for response in responses] == [500, 200]
+
+def test_batch_client_errors_are_not_retried(clock):
+    session = FakeSession([], [batch_answer({'/vpnSites/site0': [400]})])
+
+    responses = arm.send_arm_batch(BATCH_REQUESTS[:2], {}, session=session)
+
+    assert len(session.batches) == 1
+    assert responses[0]['httpStatusCode'] == 400
+
+def test_failed_batch_reports_status_for_each_item(clock):
+    session = FakeSession([], [FakeResponse(401, {'error': {'code': 'InvalidAuthenticationToken'}})])
+
+    responses = arm.send_arm_batch(BATCH_REQUESTS[:2], {}, session=session)
+
+    assert [response['httpStatusCode'] for response in responses] == [401, 401]
+    assert [response['name'] for response in responses] == ['0', '1']
+
+def test_failed_batch_with_server_error_is_retried(clock):
+    session = FakeSession([], [FakeResponse(502), batch_answer({})])
+
+    responses = arm.send_arm_batch(BATCH_REQUESTS[:2], {}, session=session)
+
+    assert session.batches == [['0', '1'], ['0', '1']]
+    assert [response['httpStatusCode'] for response in responses] == [200, 200]
+
+def test_accepted_batch_is_polled(clock):
+    body = {'responses': [{'name': '0', 'httpStatusCode': 200}, {'name': '1', 'httpStatusCode': 201}]}
+    session = FakeSession([FakeResponse(200, body)],
+                          [FakeResponse(202, headers={'Location': 'https://arm/batch/result', 'Retry-After': '4'})])
+
+    responses = arm.send_arm_batch(BATCH_REQUESTS[:2], {}, session=session)
+
+    assert session.urls == ['https://arm/batch/result']
+    assert clock.sleeps == [4]
+    assert [response['httpStatusCode'] for response in responses] == [200, 201]
@@ -0,0 +1,92 @@
+import json
+import types
+
+import pytest
+
+from __app__.shared_code import cache
+from __app__.shared_code.cache import PersistentLRUCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = types.SimpleNamespace(value=1000000.0)
+    monkeypatch.setattr(cache, 'time', types.SimpleNamespace(time=lambda: now.value))
+    return now
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'cache.json')
+
+def test_get_counts_hits_and_misses(clock, path):
+    lru = PersistentLRUCache(path)
+
+    assert lru.get('198.51.100.1') is None
+    lru.set('198.51.100.1', 'Example ISP')
+    assert lru.get('198.51.100.1') == 'Example ISP'
+    assert lru.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+def test_least_recently_used_entry_is_evicted(clock, path):
+    lru = PersistentLRUCache(path, max_entries=2)
+
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+    assert lru.get('c') == 3
+
+def test_entry_expires_after_ttl(clock, path):
+    lru = PersistentLRUCache(path, ttl=60)
+
+    lru.set('a', 1)
+    clock.value += 59
+    assert lru.get('a') == 1
+    clock.value += 2
+    assert lru.get('a') is None
+    assert lru.stats()['size'] == 0
+
+def test_entries_survive_in_file(clock, path):
+    lru = PersistentLRUCache(path)
+    lru.set('a', 1)
+    lru.save()
+
+    assert PersistentLRUCache(path).get('a') == 1
+
+def test_expired_entries_are_not_loaded(clock, path):
+    lru = PersistentLRUCache(path, ttl=60)
+    lru.set('a', 1)
+    lru.save()
+
+    clock.value += 61
+    assert PersistentLRUCache(path).stats()['size'] == 0
+
+def test_load_keeps_most_recent_entries(clock, path):
+    lru = PersistentLRUCache(path)
+    for key in ('a', 'b', 'c'):
+        lru.set(key, key)
+    lru.save()
+
+    loaded = PersistentLRUCache(path, max_entries=2)
+    assert loaded.get('a') is None
+    assert loaded.get('b') == 'b'
+    assert loaded.get('c') == 'c'
+
+def test_set_saves_once_save_interval_passed(clock, path):
+    lru = PersistentLRUCache(path, save_interval=5)
+
+    lru.set('a', 1)
+    assert PersistentLRUCache(path).get('a') is None
+    clock.value += 5
+    lru.set('b', 2)
+    with open(path) as cache_file:
+        assert set(json.load(cache_file)['entries']) == {'a', 'b'}
+
+def test_save_without_changes_does_not_write(clock, path, tmp_path):
+    PersistentLRUCache(path).save()
+
+    assert not (tmp_path / 'cache.json').exists()
+
+def test_unreadable_file_leaves_cache_empty(clock, path, tmp_path):
+    (tmp_path / 'cache.json').write_text('not json')
+
+    assert PersistentLRUCache(path).stats()['size'] == 0
@@ -0,0 +1,85 @@
+import types
+
+import pytest
+
+def make_connection(name, shared_key=None):
+    return {'name': name, 'properties': {'provisioningState': 'Succeeded', 'vpnLinkConnections': [
+        {'name': f"{name}-wan1", 'properties': {'sharedKey': shared_key} if shared_key else {}}]}}
+
+def make_config(network_name, shared_key):
+    return {'properties': {'remoteVpnSite': {'id': f"/vpnSites/{network_name}"},
+                           'vpnLinkConnections': [{'name': f"{network_name}-wan1", 'properties': {'sharedKey': shared_key}}]}}
+
+def test_merge_adds_chunk_and_restores_other_keys(function_app):
+    vpn_gateway = {'etag': 'W/"1"', 'properties': {'connections': [make_connection('site1-connection')]}}
+    keys = {'site1-connection': 'key1'}
+
+    merged = function_app.merge_gateway_connections(vpn_gateway, [('site2', make_config('site2', 'key2'))], keys.get)
+
+    assert [connection['name'] for connection in merged['properties']['connections']] == \
+        ['site1-connection', 'site2-connection']
+    connections = {connection['name']: connection for connection in merged['properties']['connections']}
+    assert connections['site1-connection']['properties']['vpnLinkConnections'][0]['properties']['sharedKey'] == 'key1'
+    assert connections['site2-connection']['properties'] == make_config('site2', 'key2')['properties']
+
+def test_merge_replaces_connection_of_chunk(function_app):
+    vpn_gateway = {'properties': {'connections': [make_connection('site1-connection'), make_connection('site2-connection')]}}
+    lookups = []
+
+    def get_shared_key(connection_name):
+        lookups.append(connection_name)
+        return 'key2'
+
+    merged = function_app.merge_gateway_connections(vpn_gateway, [('site1', make_config('site1', 'new-key'))],
+                                                    get_shared_key)
+
+    # Connections of the chunk follow the gateway's other connections
+    assert [connection['name'] for connection in merged['properties']['connections']] == \
+        ['site2-connection', 'site1-connection']
+    assert merged['properties']['connections'][1]['properties'] == make_config('site1', 'new-key')['properties']
+    assert lookups == ['site2-connection']
+
+def test_merge_keeps_keys_returned_by_arm(function_app):
+    vpn_gateway = {'properties': {'connections': [make_connection('site1-connection', 'arm-key')]}}
+
+    merged = function_app.merge_gateway_connections(vpn_gateway, [], lambda connection_name: None)
+
+    assert merged['properties']['connections'][0]['properties']['vpnLinkConnections'][0]['properties']['sharedKey'] == \
+        'arm-key'
+
+def test_merge_without_key_of_other_connection(function_app):
+    vpn_gateway = {'properties': {'connections': [make_connection('manual-connection')]}}
+
+    assert function_app.merge_gateway_connections(vpn_gateway, [('site1', make_config('site1', 'key1'))],
+                                                  lambda connection_name: None) is None
+
+def test_merge_gateway_without_connections(function_app):
+    vpn_gateway = {'properties': {}}
+
+    merged = function_app.merge_gateway_connections(vpn_gateway, [('site1', make_config('site1', 'key1'))],
+                                                    lambda connection_name: None)
+
+    assert [connection['name'] for connection in merged['properties']['connections']] == ['site1-connection']
+
+@pytest.fixture
+def clock(function_app, monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(function_app.time, 'monotonic', lambda: clock.now)
+    monkeypatch.setattr(function_app.AzureConfig, 'gateway_update_timeout', 120)
+    monkeypatch.setattr(function_app.AzureConfig, 'gateway_update_deadline', None)
+    return clock
+
+def test_gateway_update_budget_is_shared_by_hubs(function_app, clock):
+    assert function_app.get_gateway_update_budget(hubs_left=3) == 40
+
+    # The first hub used its share and more; the others split what is left
+    clock.now += 60
+    assert function_app.get_gateway_update_budget(hubs_left=2) == 30
+    clock.now += 10
+    assert function_app.get_gateway_update_budget(hubs_left=1) == 50
+
+def test_gateway_update_budget_used_up(function_app, clock):
+    function_app.reset_gateway_update_budget()
+    clock.now += 200
+
+    assert function_app.get_gateway_update_budget(hubs_left=2) == 0
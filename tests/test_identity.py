@@ -0,0 +1,76 @@
+import json
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from __app__.shared_code import identity
+from __app__.shared_code.identity import ManagedIdentityTokenProvider, _parse_expires_on
+
+RESOURCE = 'https://management.azure.com/'
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    provider = ManagedIdentityTokenProvider(cache_path=str(tmp_path / 'tokens.json'), refresh_margin=300)
+    provider.fetches = []
+
+    def fetch(resource):
+        provider.fetches.append(resource)
+        return f"token-{len(provider.fetches)}", provider.expires_on
+
+    provider.expires_on = time.time() + 3600
+    monkeypatch.setattr(provider, '_fetch', fetch)
+    return provider
+
+def test_token_is_cached_in_process(provider):
+    assert provider.get_token(RESOURCE) == 'token-1'
+    assert provider.get_token(RESOURCE) == 'token-1'
+    assert provider.fetches == [RESOURCE]
+
+def test_token_is_read_from_disk(provider, tmp_path):
+    expires_on = time.time() + 3600
+    (tmp_path / 'tokens.json').write_text(json.dumps({RESOURCE: {'access_token': 'cached', 'expires_on': expires_on}}))
+
+    assert provider.get_token(RESOURCE) == 'cached'
+    assert provider.fetches == []
+
+def test_fetched_token_is_persisted(provider, tmp_path):
+    provider.get_token(RESOURCE)
+
+    tokens = json.loads((tmp_path / 'tokens.json').read_text())
+    assert tokens[RESOURCE]['access_token'] == 'token-1'
+
+def test_token_within_refresh_margin_is_refreshed(provider):
+    provider.expires_on = time.time() + 100
+    assert provider.get_token(RESOURCE) == 'token-1'
+
+    provider.expires_on = time.time() + 3600
+    assert provider.get_token(RESOURCE) == 'token-2'
+    assert provider.get_token(RESOURCE) == 'token-2'
+    assert len(provider.fetches) == 2
+
+def test_stale_disk_token_is_refreshed(provider, tmp_path):
+    (tmp_path / 'tokens.json').write_text(json.dumps({RESOURCE: {'access_token': 'old', 'expires_on': time.time() + 60}}))
+
+    assert provider.get_token(RESOURCE) == 'token-1'
+
+def test_tokens_are_kept_per_resource(provider):
+    provider.get_token(RESOURCE)
+    provider.get_token('https://vault.azure.net')
+
+    assert provider.fetches == [RESOURCE, 'https://vault.azure.net']
+
+def test_parse_expires_on_epoch():
+    assert _parse_expires_on({'expires_on': '1605489697'}) == 1605489697.0
+
+def test_parse_expires_on_date():
+    expected = datetime(2020, 11, 16, 1, 21, 37, tzinfo=timezone.utc).timestamp()
+    assert _parse_expires_on({'expires_on': '11/16/2020 1:21:37 AM +00:00'}) == expected
+
+def test_parse_expires_on_falls_back_to_expires_in():
+    expires_on = _parse_expires_on({'expires_in': '3600'})
+    assert abs(expires_on - (time.time() + 3600)) < 5
+
+def test_parse_expires_on_falls_back_to_margin():
+    expires_on = _parse_expires_on({})
+    assert abs(expires_on - (time.time() + identity.TOKEN_REFRESH_MARGIN)) < 5
@@ -0,0 +1,91 @@
+import types
+
+import pytest
+
+from __app__.shared_code import interface, mx
+from __app__.shared_code.appliance import Appliance
+from __app__.shared_code.inventory import DeviceInventory
+from __app__.shared_code.uplinks import UplinkSnapshot
+
+# getOrganizationDevices records carry no WAN addresses
+DEVICES = [
+    {'serial': 'Q2XX-0001', 'networkId': 'N_1', 'model': 'MX68', 'firmware': 'wired-16-13', 'name': 'mx-1'},
+    {'serial': 'Q2XX-0002', 'networkId': 'N_1', 'model': 'MX68', 'firmware': 'wired-16-13', 'name': 'mx-2'},
+    {'serial': 'Q2XX-0003', 'networkId': None, 'model': 'MR46', 'name': 'unclaimed'},
+]
+STATUSES = [
+    {'networkId': 'N_1', 'serial': 'Q2XX-0001', 'uplinks': [
+        {'interface': 'wan1', 'status': 'active', 'ip': '10.0.1.2', 'publicIp': '198.51.100.1'}]},
+    {'networkId': 'N_1', 'serial': 'Q2XX-0002', 'uplinks': [
+        {'interface': 'wan1', 'status': 'active', 'ip': '10.0.1.3', 'publicIp': '198.51.100.2'}]},
+]
+
+def make_dashboard():
+    calls = []
+
+    def get_devices(org_id, total_pages=None):
+        calls.append('getOrganizationDevices')
+        return DEVICES
+
+    def get_uplink_statuses(org_id, total_pages=None):
+        calls.append('getOrganizationApplianceUplinkStatuses')
+        return STATUSES
+
+    def get_uplink_bandwidth(network_id):
+        return {'bandwidthLimits': {'wan1': {'limitUp': 100000, 'limitDown': 200000},
+                                    'wan2': {'limitUp': None, 'limitDown': None}}}
+
+    def get_device(serial):
+        calls.append('getDevice')
+        return None
+
+    return types.SimpleNamespace(
+        organizations=types.SimpleNamespace(getOrganizationDevices=get_devices),
+        appliance=types.SimpleNamespace(getOrganizationApplianceUplinkStatuses=get_uplink_statuses,
+                                        getNetworkApplianceTrafficShapingUplinkBandwidth=get_uplink_bandwidth),
+        devices=types.SimpleNamespace(getDevice=get_device),
+        calls=calls)
+
+@pytest.fixture
+def dashboard(monkeypatch):
+    dashboard = make_dashboard()
+    monkeypatch.setattr(mx, 'get_dashboard', lambda: dashboard)
+    monkeypatch.setattr(interface, 'get_whois_info', lambda ip: 'Example ISP')
+    return dashboard
+
+def test_devices_are_fetched_once(dashboard):
+    inventory = DeviceInventory('100', dashboard)
+
+    assert inventory.get_device('Q2XX-0001')['name'] == 'mx-1'
+    assert inventory.get_device('Q2XX-9999') is None
+    assert dashboard.calls == ['getOrganizationDevices']
+
+def test_get_network_devices(dashboard):
+    inventory = DeviceInventory('100', dashboard)
+
+    assert [device['serial'] for device in inventory.get_network_devices('N_1')] == ['Q2XX-0001', 'Q2XX-0002']
+    assert inventory.get_network_devices('N_9') == []
+
+def test_is_stale_until_fetched(dashboard):
+    inventory = DeviceInventory('100', dashboard)
+
+    assert inventory.is_stale(3600)
+    inventory.refresh()
+    assert not inventory.is_stale(3600)
+
+def test_appliance_takes_wan_addresses_from_uplinks(dashboard):
+    appliance = Appliance('N_1', True, 'Q2XX-0001', 'Q2XX-0002', '100',
+                          uplinks=UplinkSnapshot('100', dashboard), inventory=DeviceInventory('100', dashboard))
+
+    assert appliance.primary.name == 'mx-1'
+    assert appliance.primary.get_wan1_ip() == '10.0.1.2'
+    assert appliance.secondary.get_wan1_ip() == '10.0.1.3'
+    assert appliance.primary.get_wan2_ip() is None
+    assert 'getDevice' not in dashboard.calls
+    assert dashboard.calls.count('getOrganizationApplianceUplinkStatuses') == 1
+
+def test_appliance_wan_links(dashboard):
+    appliance = Appliance('N_1', False, 'Q2XX-0001', None, '100',
+                          uplinks=UplinkSnapshot('100', dashboard), inventory=DeviceInventory('100', dashboard))
+
+    assert appliance.get_wan_links() == {'wan1': {'ipaddress': '198.51.100.1', 'isp': 'Example ISP', 'linkspeed': 200}}
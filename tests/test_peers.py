@@ -0,0 +1,65 @@
+from __app__.shared_code.peers import PeerTable
+
+def make_peer(name: str, secret: str='secret', subnets: list=None, tags: list=None):
+    return {'name': name, 'publicIp': '192.0.2.1', 'secret': secret,
+            'privateSubnets': ['10.0.0.0/24'] if subnets is None else subnets,
+            'networkTags': [name] if tags is None else tags}
+
+def test_upsert_adds_new_peer():
+    table = PeerTable([make_peer('site1')])
+
+    assert table.upsert(make_peer('site2'))
+    assert len(table) == 2
+    assert 'site2' in table
+    assert [peer['name'] for peer in table.to_payload()] == ['site1', 'site2']
+    assert table.is_changed()
+
+def test_upsert_updates_fields_of_existing_peer():
+    table = PeerTable([make_peer('site1', tags=['site1'])])
+
+    assert not table.upsert(make_peer('site1', secret='new', subnets=['10.1.0.0/24'], tags=['other']))
+    peer = table.get('site1')
+    assert peer['secret'] == 'new'
+    assert peer['privateSubnets'] == ['10.1.0.0/24']
+    # networkTags are only updated when listed in fields
+    assert peer['networkTags'] == ['site1']
+    assert len(table) == 1
+
+def test_upsert_updates_listed_fields_only():
+    table = PeerTable([make_peer('site1-sec', tags=['site1'])])
+
+    table.upsert(make_peer('site1-sec', secret='new', tags=[]), fields=('networkTags',))
+    peer = table.get('site1-sec')
+    assert peer['networkTags'] == []
+    assert peer['secret'] == 'secret'
+
+def test_upsert_updates_every_peer_with_the_name():
+    table = PeerTable([make_peer('site1'), make_peer('site1')])
+
+    table.upsert(make_peer('site1', secret='new'))
+    assert [peer['secret'] for peer in table.to_payload()] == ['new', 'new']
+
+def test_is_changed_ignores_unchanged_upsert():
+    table = PeerTable([make_peer('site1'), make_peer('site2')])
+
+    table.upsert(make_peer('site2'))
+    assert not table.is_changed()
+
+def test_is_changed_detects_field_change():
+    table = PeerTable([make_peer('site1')])
+
+    table.upsert(make_peer('site1', subnets=['10.0.0.0/24', '10.0.1.0/24']))
+    assert table.is_changed()
+
+def test_is_changed_detects_change_of_returned_peer():
+    table = PeerTable([make_peer('site1')])
+
+    table.get('site1')['networkTags'] = []
+    assert table.is_changed()
+
+def test_get_missing_peer():
+    table = PeerTable([])
+
+    assert table.get('site1') is None
+    assert 'site1' not in table
+    assert not table.is_changed()
@@ -0,0 +1,66 @@
+import ipaddress
+
+import pytest
+
+from __app__.shared_code.prefix_index import PrefixIndex, _flatten, build_prefix_index
+
+def ip(address: str):
+    return int(ipaddress.ip_address(address))
+
+def test_flatten_keeps_disjoint_intervals():
+    assert _flatten([(20, 29, 'b'), (0, 9, 'a')]) == [(0, 9, 'a'), (20, 29, 'b')]
+
+def test_flatten_most_specific_interval_wins():
+    assert _flatten([(0, 99, 'a'), (10, 19, 'b')]) == [(0, 9, 'a'), (10, 19, 'b'), (20, 99, 'a')]
+
+def test_flatten_nested_intervals():
+    assert _flatten([(0, 99, 'a'), (10, 49, 'b'), (20, 29, 'c')]) == \
+        [(0, 9, 'a'), (10, 19, 'b'), (20, 29, 'c'), (30, 49, 'b'), (50, 99, 'a')]
+
+def test_flatten_interval_ending_with_its_parent():
+    assert _flatten([(0, 99, 'a'), (50, 99, 'b')]) == [(0, 49, 'a'), (50, 99, 'b')]
+
+def test_flatten_merges_adjacent_intervals_of_same_organization():
+    assert _flatten([(0, 9, 'a'), (10, 19, 'a'), (20, 29, 'b')]) == [(0, 19, 'a'), (20, 29, 'b')]
+
+def test_flatten_merges_nested_interval_of_same_organization():
+    assert _flatten([(0, 99, 'a'), (10, 19, 'a')]) == [(0, 99, 'a')]
+
+@pytest.fixture
+def index(tmp_path):
+    dump_path = tmp_path / 'prefixes.txt'
+    dump_path.write_text('\n'.join([
+        '# prefix dump',
+        '203.0.113.0/24\tExample Transit',
+        '203.0.113.128/25,Example Customer',
+        '198.51.100.0\t198.51.100.255\t64500\tUS\tExample Range',
+        '192.0.2.0/24 Not routed',
+        '2001:db8::/32 Example IPv6',
+        'not a prefix',
+    ]), encoding='utf-8')
+    index_path = tmp_path / 'prefixes.idx'
+    assert build_prefix_index(str(dump_path), str(index_path)) == 4
+    return PrefixIndex(str(index_path))
+
+def test_lookup_returns_organization(index):
+    assert index.lookup('203.0.113.1') == 'Example Transit'
+    assert index.lookup('198.51.100.200') == 'Example Range'
+    assert index.lookup('2001:db8::1') == 'Example IPv6'
+
+def test_lookup_returns_most_specific_organization(index):
+    assert index.lookup('203.0.113.127') == 'Example Transit'
+    assert index.lookup('203.0.113.128') == 'Example Customer'
+    assert index.lookup('203.0.113.255') == 'Example Customer'
+
+def test_lookup_of_address_not_indexed(index):
+    assert index.lookup('192.0.2.1') is None
+    assert index.lookup('203.0.112.255') is None
+    assert index.lookup('203.0.114.0') is None
+    assert index.lookup('2001:db9::1') is None
+    assert index.lookup('not an address') is None
+
+def test_prefix_index_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.idx'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        PrefixIndex(str(path))
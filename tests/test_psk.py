@@ -0,0 +1,69 @@
+import time
+
+from __app__.shared_code.psk import PskManager, get_psk_meta_key
+from __app__.shared_code.state import DesiredStateStore
+
+def make_store(meta: dict=None):
+    return DesiredStateStore(state={'networks': {}, 'meta': meta or {}})
+
+def test_get_psk_reuses_key_of_primary_peer():
+    store = make_store({get_psk_meta_key('site1'): time.time()})
+    manager = PskManager([{'name': 'site1', 'secret': 'key1'}, {'name': 'site1-sec', 'secret': 'key2'}], store)
+
+    assert manager.get_psk('site1') == ('key1', False)
+
+def test_get_psk_reuses_key_of_secondary_peer():
+    store = make_store({get_psk_meta_key('site1'): time.time()})
+    manager = PskManager([{'name': 'site1-sec', 'secret': 'key2'}], store)
+
+    assert manager.get_psk('site1') == ('key2', False)
+
+def test_get_psk_generates_key_for_new_site():
+    manager = PskManager([], make_store())
+
+    psk, rotated = manager.get_psk('site1')
+    assert psk
+    assert rotated
+    # The new key is returned until it is rotated again
+    assert manager.get_psk('site1') == (psk, False)
+
+def test_get_psk_starts_age_of_existing_key():
+    store = make_store()
+    manager = PskManager([{'name': 'site1', 'secret': 'key1'}], store, rotation_days=1)
+
+    before = time.time()
+    assert manager.get_psk('site1') == ('key1', False)
+    assert store.get_meta(get_psk_meta_key('site1')) >= before
+
+def test_get_psk_rotates_on_request():
+    store = make_store({get_psk_meta_key('site1'): time.time()})
+    manager = PskManager([{'name': 'site1', 'secret': 'key1'}], store)
+
+    psk, rotated = manager.get_psk('site1', rotate=True)
+    assert rotated
+    assert psk != 'key1'
+    # The key of the peers is still the one last applied on both sides
+    assert manager.get_peer_psk('site1') == 'key1'
+
+def test_get_psk_rotates_key_when_due():
+    store = make_store({get_psk_meta_key('site1'): time.time() - 2 * 86400})
+    manager = PskManager([{'name': 'site1', 'secret': 'key1'}], store, rotation_days=1)
+
+    psk, rotated = manager.get_psk('site1')
+    assert rotated
+    assert psk != 'key1'
+
+def test_get_psk_keeps_key_not_due():
+    store = make_store({get_psk_meta_key('site1'): time.time() - 2 * 86400})
+    manager = PskManager([{'name': 'site1', 'secret': 'key1'}], store, rotation_days=0)
+
+    assert manager.get_psk('site1') == ('key1', False)
+
+def test_record_rotation():
+    store = make_store()
+    manager = PskManager([], store)
+
+    before = time.time()
+    manager.record_rotation('site1')
+    assert store.get_meta(get_psk_meta_key('site1')) >= before
+    assert get_psk_meta_key('site1') in store.get_changes()['meta']
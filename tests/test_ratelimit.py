@@ -0,0 +1,111 @@
+import threading
+import time
+
+from __app__.shared_code import dashboard
+from __app__.shared_code.ratelimit import BULK, DEFAULT, FAILOVER, RATE_DECREASE, RATE_FLOOR, TokenBucket
+
+def test_acquire_serves_burst_without_waiting():
+    bucket = TokenBucket(rate=10, burst=5)
+
+    waited = [bucket.acquire() for _ in range(5)]
+    assert max(waited) < 0.05
+    assert bucket.stats()['requests'] == 5
+
+def test_acquire_waits_for_refill():
+    bucket = TokenBucket(rate=20, burst=1)
+
+    bucket.acquire()
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+def test_acquire_serves_lowest_lane_first():
+    bucket = TokenBucket(rate=20, burst=1)
+    # Every request arrives while the bucket is paused
+    bucket.on_throttled(0.2)
+    order = []
+
+    def request(lane: int, name: str):
+        bucket.acquire(lane)
+        order.append(name)
+
+    threads = [threading.Thread(target=request, args=(lane, name))
+               for lane, name in ((BULK, 'bulk'), (DEFAULT, 'default'), (FAILOVER, 'failover'))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ['failover', 'default', 'bulk']
+
+def test_on_throttled_pauses_and_lowers_rate():
+    bucket = TokenBucket(rate=100, burst=10)
+
+    bucket.on_throttled(0.2)
+    assert bucket.rate == 100 * RATE_DECREASE
+    assert bucket.stats()['throttled'] == 1
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.15
+
+def test_on_throttled_keeps_rate_floor():
+    bucket = TokenBucket(rate=10, burst=10)
+
+    for _ in range(20):
+        bucket.on_throttled(0)
+    assert bucket.rate == 10 * RATE_FLOOR
+
+def test_on_success_restores_budget():
+    bucket = TokenBucket(rate=10, burst=10)
+
+    bucket.on_throttled(0)
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate == 10
+
+def test_reset_stats():
+    bucket = TokenBucket(rate=10, burst=10)
+
+    bucket.acquire()
+    bucket.on_throttled(0)
+    bucket.reset_stats()
+    assert bucket.stats() == {'requests': 0, 'throttled': 0, 'waitTime': 0.0, 'rate': 7.0}
+
+def test_set_budget_keeps_throttled_ratio():
+    bucket = TokenBucket(rate=10, burst=10)
+
+    bucket.on_throttled(0)
+    bucket.set_budget(5, 5)
+    assert bucket.budget == 5
+    assert bucket.rate == 5 * RATE_DECREASE
+    assert bucket.burst == 5
+
+def test_set_budget_keeps_one_token_of_burst():
+    bucket = TokenBucket(rate=10, burst=10)
+
+    bucket.set_budget(1, 0.5)
+    assert bucket.burst == 1
+    assert bucket.tokens <= 1
+
+def test_set_rate_limit_workers_shares_budget(monkeypatch):
+    bucket = TokenBucket(rate=dashboard.MERAKI_RATE_LIMIT, burst=dashboard.MERAKI_RATE_BURST)
+    monkeypatch.setattr(dashboard, 'MERAKI_RATE_LIMIT_WORKERS', None)
+    monkeypatch.setattr(dashboard, '_rate_limit_workers', 1)
+    monkeypatch.setattr(dashboard, '_buckets', {'key': bucket, 'unlimited': None})
+
+    dashboard.set_rate_limit_workers(4)
+    assert bucket.budget == dashboard.MERAKI_RATE_LIMIT / 4
+    assert bucket.burst == max(dashboard.MERAKI_RATE_BURST / 4, 1)
+
+    dashboard.set_rate_limit_workers(0)
+    assert bucket.budget == dashboard.MERAKI_RATE_LIMIT
+
+def test_configured_rate_limit_workers_are_kept(monkeypatch):
+    bucket = TokenBucket(rate=dashboard.MERAKI_RATE_LIMIT / 2, burst=dashboard.MERAKI_RATE_BURST / 2)
+    monkeypatch.setattr(dashboard, 'MERAKI_RATE_LIMIT_WORKERS', 2)
+    monkeypatch.setattr(dashboard, '_rate_limit_workers', 2)
+    monkeypatch.setattr(dashboard, '_buckets', {'key': bucket})
+
+    dashboard.set_rate_limit_workers(8)
+    assert bucket.budget == dashboard.MERAKI_RATE_LIMIT / 2
@@ -0,0 +1,199 @@
+import copy
+import types
+
+import pytest
+
+from __app__.shared_code import interface, mx
+from __app__.shared_code.inventory import DeviceInventory
+from __app__.shared_code.psk import PskManager
+from __app__.shared_code.state import DesiredStateStore
+from __app__.shared_code.tags import TagIndex
+from __app__.shared_code.uplinks import UplinkSnapshot
+
+NETWORK = {'id': 'N_1', 'name': 'Branch 1', 'tags': ['vwan-hub1-1']}
+PEERS = [{'name': 'Branch1', 'secret': 'shared-secret'}, {'name': 'Branch1-sec', 'secret': 'shared-secret'}]
+
+def make_dashboard():
+    return types.SimpleNamespace(
+        organizations=types.SimpleNamespace(getOrganizationDevices=lambda org_id, total_pages=None: [
+            {'serial': 'Q2XX-0001', 'networkId': 'N_1', 'model': 'MX68', 'firmware': 'wired-16-13', 'name': 'mx-1'}]),
+        appliance=types.SimpleNamespace(
+            getOrganizationApplianceUplinkStatuses=lambda org_id, total_pages=None: [
+                {'networkId': 'N_1', 'serial': 'Q2XX-0001', 'uplinks': [
+                    {'interface': 'wan1', 'status': 'active', 'ip': '10.0.1.2', 'publicIp': '198.51.100.1'}]}],
+            getNetworkApplianceTrafficShapingUplinkBandwidth=lambda network_id: {'bandwidthLimits': {
+                'wan1': {'limitUp': 100000, 'limitDown': 200000}, 'wan2': {'limitUp': None, 'limitDown': None}}},
+            getNetworkApplianceWarmSpare=lambda network_id: {'enabled': False, 'primarySerial': 'Q2XX-0001'},
+            getNetworkApplianceVpnSiteToSiteVpn=lambda network_id: {'subnets': [
+                {'localSubnet': '10.1.0.0/24', 'useVpn': True}, {'localSubnet': '10.2.0.0/24', 'useVpn': False}]}))
+
+class FakeAzure():
+    '''
+    Records the writes of reconcile_meraki_network and answers the reads
+    of a full sweep with what was last written.
+    '''
+
+    def __init__(self):
+        self.writes = []
+        self.reads = []
+        self.site = None
+        self.connection = None
+
+    def update_site(self, resource_group, site_name, headers, site_config):
+        self.writes.append('vpnSite')
+        self.site = dict(copy.deepcopy(site_config), id=f"/vpnSites/{site_name}", provisioningState='Succeeded')
+        return self.site
+
+    def create_connection(self, resource_group, vpn_gateway_name, network_name, subscription_id, wans, psk, headers):
+        self.writes.append('vpnConnection')
+        self.connection = self.config(resource_group, network_name, subscription_id, wans, None)
+        self.connection['properties']['remoteVpnSite']['id'] = self.connection['properties']['remoteVpnSite']['id'].upper()
+        return self.connection
+
+    def get_site(self, resource_group, site_name, headers):
+        self.reads.append('vpnSite')
+        return self.site
+
+    def get_connection(self, resource_group, vpn_gateway_name, network_name, headers):
+        self.reads.append('vpnConnection')
+        return self.connection
+
+@pytest.fixture
+def azure(function_app, monkeypatch):
+    azure = FakeAzure()
+    azure.config = function_app.get_virtual_wan_connection_config
+    monkeypatch.setattr(function_app, 'update_azure_virtual_wan_site_links', azure.update_site)
+    monkeypatch.setattr(function_app, 'create_virtual_wan_connection', azure.create_connection)
+    monkeypatch.setattr(function_app, 'get_azure_virtual_wan_site', azure.get_site)
+    monkeypatch.setattr(function_app, 'get_virtual_wan_connection', azure.get_connection)
+    return azure
+
+@pytest.fixture
+def hub_context(function_app, monkeypatch):
+    dashboard = make_dashboard()
+    monkeypatch.setattr(function_app.MerakiConfig, 'sdk_auth', dashboard)
+    monkeypatch.setattr(function_app.MerakiConfig, 'org_id', '100')
+    monkeypatch.setattr(mx, 'get_dashboard', lambda: dashboard)
+    monkeypatch.setattr(interface, 'get_whois_info', lambda ip: 'Example ISP')
+
+    desired_state = DesiredStateStore(state={})
+    return {
+        'hub_info': {'location': 'westeurope', 'vpnGatewayName': 'hub1-gw'},
+        'virtual_wan_id': '/virtualWans/test-vwan',
+        'resource_group': 'rg-1',
+        'headers': {},
+        'tag_index': TagIndex([NETWORK], function_app.MerakiConfig.primary_tag_pattern),
+        'psk_manager': PskManager(PEERS, desired_state),
+        'desired_state': desired_state,
+        'existing_peers': {'Branch1', 'Branch1-sec'},
+        'full_sweep': False,
+        'uplinks': UplinkSnapshot('100', dashboard),
+        'inventory': DeviceInventory('100', dashboard)
+    }
+
+def reconcile_twice(function_app, hub_context):
+    # First run applies the network, the second one runs with the hash it recorded
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context)
+    hub_context['desired_state'].record(NETWORK['id'], result['desired_state_hash'])
+    return function_app.reconcile_meraki_network(NETWORK, hub_context)
+
+def test_config_current_ignores_added_and_none_values(function_app):
+    desired = {'location': 'westeurope', 'properties': {'sharedKey': None, 'links': [{'name': 'a'}]}}
+    actual = {'location': 'westeurope', 'id': '/x', 'properties': {'links': [{'name': 'a', 'state': 'ok'}]}}
+
+    assert function_app.is_azure_config_current(desired, actual)
+
+def test_config_current_compares_ids_case_insensitively(function_app):
+    assert function_app.is_azure_config_current({'virtualWan': {'id': '/virtualWans/VWAN'}},
+                                                {'virtualWan': {'id': '/virtualwans/vwan'}})
+    assert not function_app.is_azure_config_current({'virtualWan': {'id': '/virtualWans/a'}},
+                                                    {'virtualWan': {'id': '/virtualWans/b'}})
+
+def test_config_current_detects_drift(function_app):
+    assert not function_app.is_azure_config_current({'prefixes': ['10.1.0.0/24']}, {'prefixes': ['10.9.0.0/24']})
+    assert not function_app.is_azure_config_current({'links': [{'name': 'a'}]}, {'links': [{'name': 'a'}, {'name': 'b'}]})
+    assert not function_app.is_azure_config_current({'properties': {'name': 'a'}}, {})
+    assert not function_app.is_azure_config_current({'properties': {'name': 'a'}}, None)
+
+def test_new_network_is_written(function_app, hub_context, azure):
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context)
+
+    assert not result['unchanged']
+    assert result['specific_tag'] == 'vwan-hub1-1'
+    assert result['site_config']['properties']['addressSpace']['addressPrefixes'] == ['10.1.0.0/24']
+    assert azure.writes == ['vpnSite', 'vpnConnection']
+
+def test_unchanged_network_skips_azure_writes(function_app, hub_context, azure):
+    result = reconcile_twice(function_app, hub_context)
+
+    assert result['unchanged']
+    assert azure.writes == ['vpnSite', 'vpnConnection']
+    assert azure.reads == []
+    assert hub_context['desired_state'].writes_avoided == 2
+
+def test_changed_hash_is_written(function_app, hub_context, azure):
+    hub_context['desired_state'].record(NETWORK['id'], 'hash-of-an-older-config')
+
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context)
+
+    assert not result['unchanged']
+    assert azure.writes == ['vpnSite', 'vpnConnection']
+
+def test_missing_peer_is_written(function_app, hub_context, azure):
+    hub_context['existing_peers'] = {'Branch1'}
+
+    result = reconcile_twice(function_app, hub_context)
+
+    assert not result['unchanged']
+    assert azure.writes == ['vpnSite', 'vpnConnection'] * 2
+
+def test_rotated_key_is_written(function_app, hub_context, azure):
+    network = dict(NETWORK, tags=NETWORK['tags'] + ['vwan-rotate-psk'])
+    result = function_app.reconcile_meraki_network(network, hub_context)
+    hub_context['desired_state'].record(network['id'], result['desired_state_hash'])
+
+    result = function_app.reconcile_meraki_network(network, hub_context)
+
+    assert result['psk_rotated']
+    assert not result['unchanged']
+
+def test_update_azure_false_leaves_writes_to_caller(function_app, hub_context, azure):
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context, update_azure=False)
+
+    assert not result['unchanged']
+    assert azure.writes == []
+
+def test_full_sweep_skips_network_matching_azure(function_app, hub_context, azure):
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context)
+    hub_context['desired_state'].record(NETWORK['id'], result['desired_state_hash'])
+    hub_context['full_sweep'] = True
+
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context)
+
+    assert result['unchanged']
+    assert azure.reads == ['vpnSite', 'vpnConnection']
+    assert azure.writes == ['vpnSite', 'vpnConnection']
+
+def test_full_sweep_repairs_site_drift(function_app, hub_context, azure):
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context)
+    hub_context['desired_state'].record(NETWORK['id'], result['desired_state_hash'])
+    hub_context['full_sweep'] = True
+    azure.site['properties']['addressSpace']['addressPrefixes'] = ['10.9.0.0/24']
+
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context)
+
+    assert not result['unchanged']
+    assert azure.reads == ['vpnSite']
+    assert azure.writes == ['vpnSite', 'vpnConnection'] * 2
+
+def test_full_sweep_repairs_missing_connection(function_app, hub_context, azure):
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context)
+    hub_context['desired_state'].record(NETWORK['id'], result['desired_state_hash'])
+    hub_context['full_sweep'] = True
+    azure.connection = None
+
+    result = function_app.reconcile_meraki_network(NETWORK, hub_context)
+
+    assert not result['unchanged']
+    assert azure.reads == ['vpnSite', 'vpnConnection']
+    assert azure.writes == ['vpnSite', 'vpnConnection'] * 2
@@ -0,0 +1,149 @@
+import time
+import types
+
+import pytest
+
+from __app__.shared_code.state import DesiredStateStore
+
+NETWORKS = [
+    {'id': 'N_1', 'name': 'Branch 1', 'tags': ['vwan-hub1-1']},
+    {'id': 'N_2', 'name': 'Branch 2', 'tags': ['vwan-hub1-2']},
+    {'id': 'N_3', 'name': 'Branch 3', 'tags': ['vwan-hub1-3', 'vwan-apply-now']}
+]
+
+def tag_change(network_id):
+    return {'label': 'Network tags', 'networkId': network_id, 'oldValue': '[]', 'newValue': '["vwan-hub1-1"]'}
+
+@pytest.fixture
+def plan(function_app, monkeypatch):
+    '''
+    Returns a function that runs get_reconcile_plan against a stubbed
+    dashboard returning change_log as the recent configuration changes.
+    '''
+    config = function_app.MerakiConfig
+    monkeypatch.setattr(config, 'org_id', None)
+    monkeypatch.setattr(config, 'use_maintenance_window', 'No')
+    monkeypatch.setattr(config, 'reconcile_mode', 'incremental')
+    monkeypatch.setattr(config, 'full_sweep_interval_minutes', 60)
+    monkeypatch.setattr(function_app, 'delete_tag_placeholder', lambda: None)
+
+    def run(change_log, past_due=False, desired_state=None):
+        monkeypatch.setattr(config, 'sdk_auth', types.SimpleNamespace(organizations=types.SimpleNamespace(
+            getOrganizations=lambda: [{'id': '100', 'name': config.org_name}],
+            getOrganizationConfigurationChanges=lambda org_id, total_pages=None, timespan=None: change_log,
+            getOrganizationNetworks=lambda org_id, total_pages=None: NETWORKS)))
+        if desired_state is None:
+            desired_state = DesiredStateStore(state={'meta': {'lastFullSweep': time.time()}})
+        return function_app.get_reconcile_plan(past_due, desired_state)
+
+    return run
+
+def test_changed_network_ids(function_app):
+    change_log = [tag_change('N_1'), {'label': 'VPN subnets', 'networkId': 'N_2'},
+                  {'label': 'SSID name', 'networkId': 'N_3'}]
+
+    assert function_app.get_changed_network_ids(change_log) == {'N_1', 'N_2'}
+    assert function_app.get_changed_network_ids([]) == set()
+
+def test_change_without_network_changes_every_network(function_app):
+    assert function_app.get_changed_network_ids([tag_change('N_1'), {'label': 'Network tags', 'networkId': None}]) is None
+
+def test_full_sweep_due_only_in_incremental_mode(function_app, monkeypatch):
+    desired_state = DesiredStateStore(state={'meta': {'lastFullSweep': time.time() - 7200}})
+    monkeypatch.setattr(function_app.MerakiConfig, 'full_sweep_interval_minutes', 60)
+
+    monkeypatch.setattr(function_app.MerakiConfig, 'reconcile_mode', 'incremental')
+    assert function_app.is_full_sweep_due(desired_state)
+    monkeypatch.setattr(function_app.MerakiConfig, 'reconcile_mode', 'full')
+    assert not function_app.is_full_sweep_due(desired_state)
+
+def test_full_sweep_interval(function_app, monkeypatch):
+    monkeypatch.setattr(function_app.MerakiConfig, 'reconcile_mode', 'incremental')
+    monkeypatch.setattr(function_app.MerakiConfig, 'full_sweep_interval_minutes', 60)
+
+    assert function_app.is_full_sweep_due(DesiredStateStore(state={}))
+    assert not function_app.is_full_sweep_due(DesiredStateStore(state={'meta': {'lastFullSweep': time.time() - 60}}))
+
+    monkeypatch.setattr(function_app.MerakiConfig, 'full_sweep_interval_minutes', 0)
+    assert not function_app.is_full_sweep_due(DesiredStateStore(state={}))
+
+def test_no_changes_returns_no_plan(plan):
+    assert plan([]) is None
+
+def test_incremental_scope_holds_changed_and_apply_now_networks(plan):
+    result = plan([tag_change('N_1')])
+
+    assert result['incremental_scope'] == {'N_1', 'N_3'}
+    assert not result['full_sweep']
+    assert result['apply_updates']
+    assert result['remove_network_id_list'] == ['N_3']
+
+def test_change_without_network_reconciles_every_network(plan):
+    result = plan([{'label': 'Network tags', 'networkId': None}])
+
+    assert result['incremental_scope'] is None
+
+def test_past_due_run_reconciles_every_network(plan):
+    result = plan([], past_due=True)
+
+    assert result['incremental_scope'] is None
+    assert not result['full_sweep']
+
+def test_full_mode_reconciles_every_network(plan, function_app, monkeypatch):
+    monkeypatch.setattr(function_app.MerakiConfig, 'reconcile_mode', 'full')
+
+    result = plan([tag_change('N_1')], desired_state=DesiredStateStore(state={}))
+
+    assert result['incremental_scope'] is None
+    assert not result['full_sweep']
+
+def test_due_full_sweep_runs_without_changes(plan):
+    result = plan([], desired_state=DesiredStateStore(state={'meta': {'lastFullSweep': time.time() - 7200}}))
+
+    assert result['full_sweep']
+    assert result['incremental_scope'] is None
+
+def test_disabled_full_sweep_never_runs(plan, function_app, monkeypatch):
+    monkeypatch.setattr(function_app.MerakiConfig, 'full_sweep_interval_minutes', 0)
+
+    assert plan([], desired_state=DesiredStateStore(state={})) is None
+    assert not plan([tag_change('N_1')], desired_state=DesiredStateStore(state={}))['full_sweep']
+
+def test_maintenance_window_waits_for_apply_now(plan, function_app, monkeypatch):
+    monkeypatch.setattr(function_app.MerakiConfig, 'use_maintenance_window', 'Yes')
+    monkeypatch.setattr(function_app.MerakiConfig, 'maintenance_time_in_utc', (time.gmtime().tm_hour + 12) % 24)
+
+    result = plan([tag_change('N_1')])
+
+    # vwan-apply-now on N_3 forces the updates outside the window
+    assert result['apply_updates']
+    assert result['incremental_scope'] == {'N_1', 'N_3'}
+
+VWAN_CONFIG = {'properties': {'ipConfigurations': [{'id': 'Instance0', 'publicIpAddress': '203.0.113.1'},
+                                                   {'id': 'Instance1', 'publicIpAddress': '203.0.113.2'}]},
+               'connectedVirtualNetworks': ['10.100.0.0/16']}
+
+def test_hub_scope_narrows_unchanged_hub(function_app):
+    hub_state_hash = function_app.get_hub_state_hash('203.0.113.1', '203.0.113.2', ['10.100.0.0/16'])
+    desired_state = DesiredStateStore(state={'meta': {'hub:hub1': hub_state_hash}})
+
+    peer_info, state_hash, networks = function_app.get_hub_scope('Hub1', NETWORKS, VWAN_CONFIG, desired_state, {'N_2'})
+
+    assert peer_info == ('203.0.113.1', '203.0.113.2', ['10.100.0.0/16'])
+    assert state_hash == hub_state_hash
+    assert [network['id'] for network in networks] == ['N_2']
+
+def test_hub_scope_keeps_every_network_of_changed_hub(function_app):
+    desired_state = DesiredStateStore(state={'meta': {'hub:hub1': 'hash-of-old-gateway-instances'}})
+
+    _, _, networks = function_app.get_hub_scope('Hub1', NETWORKS, VWAN_CONFIG, desired_state, {'N_2'})
+
+    assert networks == NETWORKS
+
+def test_hub_scope_without_incremental_scope(function_app):
+    hub_state_hash = function_app.get_hub_state_hash('203.0.113.1', '203.0.113.2', ['10.100.0.0/16'])
+    desired_state = DesiredStateStore(state={'meta': {'hub:hub1': hub_state_hash}})
+
+    _, _, networks = function_app.get_hub_scope('Hub1', NETWORKS, VWAN_CONFIG, desired_state, None)
+
+    assert networks == NETWORKS
@@ -0,0 +1,74 @@
+import json
+
+from __app__.shared_code.state import DesiredStateStore, get_payload_hash
+
+def test_payload_hash_ignores_key_order():
+    assert get_payload_hash({'a': 1, 'b': {'c': [1, 2], 'd': None}}) == \
+        get_payload_hash({'b': {'d': None, 'c': [1, 2]}, 'a': 1})
+
+def test_payload_hash_changes_with_content():
+    assert get_payload_hash({'a': [1, 2]}) != get_payload_hash({'a': [2, 1]})
+    assert get_payload_hash({'a': 1}) != get_payload_hash({'a': '1'})
+
+def test_record_and_is_unchanged(tmp_path):
+    store = DesiredStateStore(str(tmp_path / 'state.json'))
+
+    assert not store.is_unchanged('N_1', 'hash-1')
+    store.record('N_1', 'hash-1')
+    assert store.is_unchanged('N_1', 'hash-1')
+    assert not store.is_unchanged('N_1', 'hash-2')
+    assert not store.is_unchanged('N_2', 'hash-1')
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'state.json')
+    store = DesiredStateStore(path)
+    store.record('N_1', 'hash-1')
+    store.set_meta('lastFullSweep', 1600000000)
+    store.save()
+
+    loaded = DesiredStateStore(path)
+    assert loaded.is_unchanged('N_1', 'hash-1')
+    assert loaded.get_meta('lastFullSweep') == 1600000000
+    assert loaded.get_meta('missing', 0) == 0
+
+def test_corrupt_file_starts_empty(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text('not json')
+
+    store = DesiredStateStore(str(path))
+    assert not store.is_unchanged('N_1', 'hash-1')
+    assert store.get_meta('lastFullSweep') is None
+
+def test_state_store_is_not_persisted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = DesiredStateStore(state={'networks': {'N_1': 'hash-1'}, 'meta': {'hub:hub-1': 'hub-hash'}})
+    store.record('N_2', 'hash-2')
+    store.save()
+
+    assert store.is_unchanged('N_1', 'hash-1')
+    assert store.get_meta('hub:hub-1') == 'hub-hash'
+    assert list(tmp_path.iterdir()) == []
+
+def test_get_changes_only_returns_recorded_values():
+    store = DesiredStateStore(state={'networks': {'N_1': 'hash-1'}, 'meta': {'lastFullSweep': 1}})
+    store.record('N_2', 'hash-2')
+    store.set_meta('psk:site-2', 5)
+
+    assert store.get_changes() == {'networks': {'N_2': 'hash-2'}, 'meta': {'psk:site-2': 5}}
+
+def test_get_state(tmp_path):
+    store = DesiredStateStore(str(tmp_path / 'state.json'))
+    store.record('N_1', 'hash-1')
+    store.record('N_2', 'hash-2')
+    store.set_meta('lastFullSweep', 1)
+
+    state = store.get_state(['N_1', 'N_3'], ['lastFullSweep', 'missing'])
+    assert state == {'networks': {'N_1': 'hash-1'}, 'meta': {'lastFullSweep': 1}}
+    assert json.loads(json.dumps(state)) == state
+
+def test_writes_avoided():
+    store = DesiredStateStore(state={})
+    store.add_writes_avoided(2)
+    store.add_writes_avoided(2)
+
+    assert store.writes_avoided == 4
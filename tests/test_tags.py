@@ -0,0 +1,56 @@
+import logging
+
+from __app__.shared_code.tags import TagIndex
+
+PRIMARY_TAG_REGEX = "(?i)^vwan-([a-zA-Z0-9_-]+)-[0-9]+$"
+
+NETWORKS = [
+    {'id': 'N_1', 'name': 'Branch 1', 'tags': ['vwan-Hub1-1']},
+    {'id': 'N_2', 'name': 'Branch 2', 'tags': ['office', 'vwan-hub2-1', 'vwan-hub2-1-sec']},
+    {'id': 'N_3', 'name': 'Branch 3', 'tags': ['VWAN-HUB1-2']},
+    {'id': 'N_4', 'name': 'Branch 4', 'tags': None},
+    {'id': 'N_5', 'name': 'Branch 5', 'tags': ['vwan-apply-now']}
+]
+
+def test_hubs_in_order_of_first_tag():
+    assert TagIndex(NETWORKS, PRIMARY_TAG_REGEX).hubs == ['Hub1', 'hub2']
+
+def test_get_networks_is_case_insensitive():
+    index = TagIndex(NETWORKS, PRIMARY_TAG_REGEX)
+
+    assert [network['id'] for network in index.get_networks('HUB1')] == ['N_1', 'N_3']
+    assert [network['id'] for network in index.get_networks('hub2')] == ['N_2']
+    assert index.get_networks('hub3') == []
+
+def test_secondary_tag_does_not_match():
+    index = TagIndex(NETWORKS, PRIMARY_TAG_REGEX)
+
+    assert index.get_primary_tag('N_2') == 'vwan-hub2-1'
+    assert 'hub2-1' not in [hub.lower() for hub in index.hubs]
+
+def test_get_primary_tag():
+    index = TagIndex(NETWORKS, PRIMARY_TAG_REGEX)
+
+    assert index.get_primary_tag('N_1') == 'vwan-Hub1-1'
+    assert index.get_primary_tag('N_4') is None
+    assert index.get_primary_tag('N_5') is None
+
+def test_network_tagged_for_several_hubs(caplog):
+    networks = [{'id': 'N_1', 'name': 'Branch 1', 'tags': ['vwan-hub1-1', 'vwan-hub2-1', 'vwan-hub1-2']}]
+
+    with caplog.at_level(logging.WARNING):
+        index = TagIndex(networks, PRIMARY_TAG_REGEX)
+
+    assert index.hubs == ['hub1', 'hub2']
+    assert index.get_networks('hub1') == networks
+    assert index.get_networks('hub2') == networks
+    assert 'Multiple tagged networks for Branch 1' in caplog.text
+
+def test_network_tagged_twice_for_one_hub(caplog):
+    networks = [{'id': 'N_1', 'name': 'Branch 1', 'tags': ['vwan-hub1-1', 'vwan-hub1-2']}]
+
+    with caplog.at_level(logging.WARNING):
+        index = TagIndex(networks, PRIMARY_TAG_REGEX)
+
+    assert index.get_networks('hub1') == networks
+    assert caplog.text == ''
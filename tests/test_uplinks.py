@@ -0,0 +1,78 @@
+import time
+import types
+
+from __app__.shared_code.uplinks import UplinkSnapshot
+
+STATUSES = [
+    {'networkId': 'N_1', 'serial': 'Q2XX-0001', 'uplinks': [
+        {'interface': 'wan1', 'status': 'active', 'ip': '10.0.1.2', 'publicIp': '198.51.100.1'},
+        {'interface': 'wan2', 'status': 'not connected'}]},
+    {'networkId': 'N_1', 'serial': 'Q2XX-0002', 'uplinks': [
+        {'interface': 'wan1', 'status': 'active', 'ip': '10.0.1.3', 'publicIp': '198.51.100.2'}]},
+    {'networkId': 'N_2', 'serial': 'Q2XX-0003', 'uplinks': [
+        {'interface': 'wan1', 'status': 'active', 'ip': '10.0.2.2', 'publicIp': '198.51.100.3'},
+        {'interface': 'wan2', 'status': 'active', 'ip': '10.0.3.2', 'publicIp': '203.0.113.3'}]},
+]
+
+def make_dashboard(statuses: list=STATUSES):
+    calls = []
+
+    def get_uplink_statuses(org_id, total_pages=None):
+        calls.append((org_id, total_pages))
+        return statuses
+
+    appliance = types.SimpleNamespace(getOrganizationApplianceUplinkStatuses=get_uplink_statuses)
+    return types.SimpleNamespace(appliance=appliance, calls=calls)
+
+def test_statuses_are_fetched_once_on_first_lookup():
+    dashboard = make_dashboard()
+    snapshot = UplinkSnapshot('100', dashboard)
+    assert dashboard.calls == []
+    assert snapshot.is_stale(3600)
+
+    snapshot.get_uplinks('N_1', 'Q2XX-0001')
+    snapshot.get_uplinks('N_2', 'Q2XX-0003')
+    assert dashboard.calls == [('100', 'all')]
+    assert not snapshot.is_stale(3600)
+
+def test_get_uplinks_prefers_serial():
+    snapshot = UplinkSnapshot('100', make_dashboard())
+
+    assert snapshot.get_uplinks('N_1', 'Q2XX-0001')[0]['publicIp'] == '198.51.100.1'
+    assert snapshot.get_uplinks('N_1', 'Q2XX-0002')[0]['publicIp'] == '198.51.100.2'
+
+def test_get_uplinks_falls_back_to_last_appliance_of_network():
+    snapshot = UplinkSnapshot('100', make_dashboard())
+
+    assert snapshot.get_uplinks('N_1')[0]['publicIp'] == '198.51.100.2'
+    assert snapshot.get_uplinks('N_1', 'Q2XX-9999')[0]['publicIp'] == '198.51.100.2'
+
+def test_get_uplinks_of_unknown_network():
+    snapshot = UplinkSnapshot('100', make_dashboard())
+
+    assert snapshot.get_uplinks('N_9') == []
+
+def test_refresh_replaces_statuses():
+    statuses = [dict(STATUSES[0])]
+    snapshot = UplinkSnapshot('100', make_dashboard(statuses))
+    snapshot.refresh()
+
+    statuses[0] = dict(STATUSES[0], uplinks=[])
+    assert snapshot.get_uplinks('N_1', 'Q2XX-0001')
+    snapshot.refresh()
+    assert snapshot.get_uplinks('N_1', 'Q2XX-0001') == []
+
+def test_is_stale_after_max_age():
+    snapshot = UplinkSnapshot('100', make_dashboard())
+    snapshot.refresh()
+
+    snapshot.fetched_at = time.time() - 120
+    assert snapshot.is_stale(60)
+    assert not snapshot.is_stale(300)
+
+def test_get_wan_ips_of_interfaces_with_an_address():
+    snapshot = UplinkSnapshot('100', make_dashboard())
+
+    assert snapshot.get_wan_ips('N_1', 'Q2XX-0001') == {'wan1Ip': '10.0.1.2'}
+    assert snapshot.get_wan_ips('N_2', 'Q2XX-0003') == {'wan1Ip': '10.0.2.2', 'wan2Ip': '10.0.3.2'}
+    assert snapshot.get_wan_ips('N_9') == {}